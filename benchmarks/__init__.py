@@ -0,0 +1 @@
+# author: sawyer-shi
@@ -0,0 +1,569 @@
+# author: sawyer-shi
+
+"""
+Local stand-in for the Volcengine Ark API used by the benchmark suite.
+
+Implements the endpoints the plugin calls:
+
+- ``POST /api/v3/images/generations`` (url, b64_json and stream variants)
+- ``POST /api/v3/contents/generations/tasks`` and
+  ``GET /api/v3/contents/generations/tasks[/<id>]``
+- ``POST /api/v3/chat/completions``
+
+plus the generated assets (``/files/images/...``, ``/files/videos/...``), an
+asset upload stand-in (``POST /assets``, see ``ARK_ASSET_UPLOAD_URL`` and
+``ARK_ASSET_UPLOAD_TOKEN``) and two control endpoints: ``GET /__stats``
+returns request and byte counters, ``POST /__reset`` clears them.
+
+Run standalone with ``python -m benchmarks.fake_ark_server --port 8765`` and
+point the plugin at it with ``ARK_BASE_URL=http://127.0.0.1:8765/api/v3``.
+"""
+
+import argparse
+import base64
+import hashlib
+import io
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlsplit
+
+API_PREFIX = "/api/v3"
+TASK_PATH_RE = re.compile(rf"^{API_PREFIX}/contents/generations/tasks/([\w.-]+)$")
+VIDEO_PATH_RE = re.compile(r"^/files/videos/([\w.-]+)\.mp4$")
+IMAGE_PATH_RE = re.compile(r"^/files/images/([\w.-]+)\.(png|jpeg)$")
+ASSET_UPLOAD_PATH = "/assets"
+
+
+@dataclass
+class FakeArkConfig:
+    """Behaviour knobs for the stand-in server."""
+
+    # Seconds added before every API response, plus up to ``latency_jitter``.
+    latency: float = 0.0
+    latency_jitter: float = 0.0
+    # Extra delay between streamed image events.
+    stream_interval: float = 0.0
+    # Fraction of API calls answered with ``error_status``.
+    error_rate: float = 0.0
+    error_status: int = 500
+    # Retry-After seconds sent with injected failures; None sends no header.
+    retry_after: float | None = None
+    # Size of each generated image and video in bytes (approximate for images).
+    image_bytes: int = 512 * 1024
+    video_bytes: int = 4 * 1024 * 1024
+    # Serve videos without Content-Length (chunked transfer encoding).
+    video_chunked: bool = False
+    # Statuses a task walks through, one step per query.
+    task_progression: list[str] = field(
+        default_factory=lambda: ["queued", "running", "succeeded"]
+    )
+    seed: int = 0
+
+
+class FakeArkState:
+    def __init__(self, config: FakeArkConfig) -> None:
+        self.config = config
+        self.lock = threading.Lock()
+        self.random = random.Random(config.seed)
+        self.tasks: dict[str, dict[str, Any]] = {}
+        self._image_cache: dict[int, bytes] = {}
+        self._video: bytes | None = None
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        with self.lock:
+            self.stats: dict[str, Any] = {
+                "requests": 0,
+                "errors": 0,
+                "bytes_in": 0,
+                "bytes_out": 0,
+                "paths": {},
+            }
+
+    # Counters are updated before bytes hit the wire, so a client that reads
+    # /__stats right after a response sees that response accounted for.
+    def count_request(self, path: str, bytes_in: int) -> None:
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["bytes_in"] += bytes_in
+            self.stats["paths"][path] = self.stats["paths"].get(path, 0) + 1
+
+    def count_response(self, status: int, bytes_out: int) -> None:
+        with self.lock:
+            self.stats["bytes_out"] += bytes_out
+            if status >= 400:
+                self.stats["errors"] += 1
+
+    def count_bytes_out(self, bytes_out: int) -> None:
+        with self.lock:
+            self.stats["bytes_out"] += bytes_out
+
+    def should_fail(self) -> bool:
+        with self.lock:
+            return self.random.random() < self.config.error_rate
+
+    def delay(self) -> None:
+        latency = self.config.latency
+        if self.config.latency_jitter > 0:
+            with self.lock:
+                latency += self.random.uniform(0, self.config.latency_jitter)
+        if latency > 0:
+            time.sleep(latency)
+
+    def image(self) -> bytes:
+        """Return a real PNG of roughly ``image_bytes`` (noise does not compress)."""
+        target = max(self.config.image_bytes, 1024)
+        with self.lock:
+            cached = self._image_cache.get(target)
+        if cached is not None:
+            return cached
+
+        from PIL import Image
+
+        side = max(16, int((target / 3) ** 0.5))
+        noise = random.Random(self.config.seed).randbytes(side * side * 3)
+        buffer = io.BytesIO()
+        Image.frombytes("RGB", (side, side), noise).save(buffer, format="PNG", compress_level=1)
+        data = buffer.getvalue()
+        with self.lock:
+            self._image_cache[target] = data
+        return data
+
+    def video(self) -> bytes:
+        with self.lock:
+            if self._video is None or len(self._video) != self.config.video_bytes:
+                header = b"\x00\x00\x00\x18ftypmp42\x00\x00\x00\x00mp42isom"
+                body_size = max(self.config.video_bytes - len(header), 0)
+                self._video = header + random.Random(self.config.seed).randbytes(body_size)
+            return self._video
+
+    def new_task(self, payload: dict[str, Any], task_id: str | None = None) -> dict[str, Any]:
+        task_id = task_id or f"cgt-{uuid.uuid4().hex[:20]}"
+        now = int(time.time())
+        task = {
+            "id": task_id,
+            "model": payload.get("model", "doubao-seedance-1-5-pro-251215"),
+            "step": 0,
+            "created_at": now,
+            "updated_at": now,
+            "payload": payload,
+        }
+        with self.lock:
+            self.tasks[task_id] = task
+        return task
+
+    def advance(self, task: dict[str, Any]) -> str:
+        progression = self.config.task_progression or ["succeeded"]
+        with self.lock:
+            status = progression[min(task["step"], len(progression) - 1)]
+            task["step"] += 1
+            task["updated_at"] = int(time.time())
+        return status
+
+
+class FakeArkHandler(BaseHTTPRequestHandler):
+    server: "FakeArkServer"
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    @property
+    def state(self) -> FakeArkState:
+        return self.server.state
+
+    # ---- plumbing ---------------------------------------------------------
+
+    def _read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().strip().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            return b"".join(chunks)
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(
+        self,
+        status: int,
+        body: bytes,
+        content_type: str,
+        counted: bool = True,
+        headers: dict[str, str] | None = None,
+    ) -> None:
+        if counted:
+            self.state.count_response(status, len(body))
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_chunk(self, chunk: bytes) -> None:
+        self.state.count_bytes_out(len(chunk))
+        self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii"))
+        self.wfile.write(chunk)
+        self.wfile.write(b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status: int, data: Any, counted: bool = True) -> None:
+        self._send(status, json.dumps(data).encode("utf-8"), "application/json", counted)
+
+    def _send_error(
+        self,
+        status: int,
+        message: str,
+        code: str = "InvalidParameter",
+        headers: dict[str, str] | None = None,
+    ) -> None:
+        body = json.dumps({"error": {"code": code, "message": message}}).encode("utf-8")
+        self._send(status, body, "application/json", headers=headers)
+
+    def _base_url(self) -> str:
+        host = self.headers.get("Host") or "%s:%s" % self.server.server_address[:2]
+        return f"http://{host}"
+
+    def _authorized(self) -> bool:
+        return self.headers.get("Authorization", "").startswith("Bearer ")
+
+    def _api_preamble(self) -> bool:
+        """Apply latency and injected failures. Returns False if a response was sent."""
+        self.state.delay()
+        if not self._authorized():
+            self._send_error(401, "missing API key", "AuthenticationError")
+            return False
+        if self.state.should_fail():
+            retry_after = self.state.config.retry_after
+            self._send_error(
+                self.state.config.error_status,
+                "injected failure",
+                "InternalServiceError",
+                headers={"Retry-After": f"{retry_after:g}"} if retry_after is not None else None,
+            )
+            return False
+        return True
+
+    # ---- routing ----------------------------------------------------------
+
+    def do_POST(self) -> None:
+        path = urlsplit(self.path).path
+        body = self._read_body()
+
+        if path == "/__reset":
+            self.state.reset_stats()
+            self._send_json(200, {"ok": True}, counted=False)
+            return
+
+        if path == ASSET_UPLOAD_PATH:
+            # Stand-in for an asset upload service, see ARK_ASSET_UPLOAD_URL.
+            self.state.count_request(path, len(body))
+            if self._api_preamble():
+                asset_id = hashlib.sha256(body).hexdigest()[:16]
+                self._send_json(200, {"id": f"asset-{asset_id}"})
+            return
+
+        routes = {
+            f"{API_PREFIX}/images/generations": self._images_generations,
+            f"{API_PREFIX}/contents/generations/tasks": self._submit_task,
+            f"{API_PREFIX}/chat/completions": self._chat_completions,
+        }
+        handler = routes.get(path)
+        self.state.count_request(path, len(body))
+        if handler is None:
+            self._send_error(404, f"unknown path {path}", "NotFound")
+            return
+
+        if not self._api_preamble():
+            return
+        try:
+            payload = json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            self._send_error(400, "request body is not valid JSON")
+            return
+        handler(payload)
+
+    def do_GET(self) -> None:
+        parts = urlsplit(self.path)
+        path = parts.path
+
+        if path == "/__stats":
+            with self.state.lock:
+                stats = json.loads(json.dumps(self.state.stats))
+            self._send_json(200, stats, counted=False)
+            return
+
+        if VIDEO_PATH_RE.match(path):
+            self.state.count_request("/files/videos", 0)
+            self.state.delay()
+            self._send_video()
+            return
+
+        if IMAGE_PATH_RE.match(path):
+            self.state.count_request("/files/images", 0)
+            self.state.delay()
+            self._send(200, self.state.image(), "image/png")
+            return
+
+        match = TASK_PATH_RE.match(path)
+        if match:
+            self.state.count_request(f"{API_PREFIX}/contents/generations/tasks/{{id}}", 0)
+            if self._api_preamble():
+                self._query_task(match.group(1))
+            return
+
+        self.state.count_request(path, 0)
+        if path == f"{API_PREFIX}/contents/generations/tasks":
+            if self._api_preamble():
+                self._list_tasks(parse_qs(parts.query))
+            return
+
+        self._send_error(404, f"unknown path {path}", "NotFound")
+
+    # ---- endpoints --------------------------------------------------------
+
+    def _image_count(self, payload: dict[str, Any]) -> int:
+        if payload.get("sequential_image_generation") == "auto":
+            options = payload.get("sequential_image_generation_options") or {}
+            return max(1, min(int(options.get("max_images", 1)), 15))
+        return 1
+
+    def _image_item(self, payload: dict[str, Any], index: int) -> dict[str, Any]:
+        item: dict[str, Any] = {"size": payload.get("size", "2048x2048")}
+        if payload.get("response_format") == "b64_json":
+            item["b64_json"] = base64.b64encode(self.state.image()).decode("ascii")
+        else:
+            item["url"] = f"{self._base_url()}/files/images/{uuid.uuid4().hex}-{index}.png"
+        return item
+
+    def _images_generations(self, payload: dict[str, Any]) -> None:
+        if not payload.get("prompt"):
+            self._send_error(400, "prompt is required")
+            return
+
+        count = self._image_count(payload)
+        usage = {
+            "generated_images": count,
+            "output_tokens": 4096 * count,
+            "total_tokens": 4096 * count,
+        }
+
+        if payload.get("stream"):
+            self._stream_images(payload, count, usage)
+            return
+
+        data = [self._image_item(payload, i) for i in range(count)]
+        self._send_json(
+            200,
+            {
+                "model": payload.get("model"),
+                "created": int(time.time()),
+                "data": data,
+                "usage": usage,
+            },
+        )
+
+    def _stream_images(self, payload: dict[str, Any], count: int, usage: dict[str, Any]) -> None:
+        self.state.count_response(200, 0)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write_event(event_type: str, data: Any) -> None:
+            self._send_chunk(f"event: {event_type}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+
+        for index in range(count):
+            if index and self.state.config.stream_interval > 0:
+                time.sleep(self.state.config.stream_interval)
+            event = {"type": "image_generation.partial_succeeded", "image_index": index}
+            event.update(self._image_item(payload, index))
+            write_event(event["type"], event)
+        write_event(
+            "image_generation.completed",
+            {"type": "image_generation.completed", "usage": usage},
+        )
+        self._send_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _submit_task(self, payload: dict[str, Any]) -> None:
+        if not payload.get("content"):
+            self._send_error(400, "content is required")
+            return
+        task = self.state.new_task(payload)
+        self._send_json(200, {"id": task["id"]})
+
+    def _task_body(self, task: dict[str, Any], status: str) -> dict[str, Any]:
+        body: dict[str, Any] = {
+            "id": task["id"],
+            "model": task["model"],
+            "status": status,
+            "created_at": task["created_at"],
+            "updated_at": task["updated_at"],
+        }
+        if status == "succeeded":
+            body["content"] = {"video_url": f"{self._base_url()}/files/videos/{task['id']}.mp4"}
+            body["usage"] = {"completion_tokens": 108900, "total_tokens": 108900}
+            body.update({"resolution": "720p", "ratio": "16:9", "duration": 5, "seed": 42})
+        elif status == "failed":
+            body["error"] = {"code": "InternalServiceError", "message": "scripted failure"}
+        return body
+
+    def _query_task(self, task_id: str) -> None:
+        with self.state.lock:
+            task = self.state.tasks.get(task_id)
+        if task is None:
+            # Unknown ids are adopted so video_query can be benchmarked on its own.
+            task = self.state.new_task({}, task_id)
+        status = self.state.advance(task)
+        self._send_json(200, self._task_body(task, status))
+
+    def _list_tasks(self, query: dict[str, list[str]]) -> None:
+        page_num = int(query.get("page_num", ["1"])[0])
+        page_size = int(query.get("page_size", ["10"])[0])
+        status_filter = query.get("filter.status", [None])[0]
+        model_filter = query.get("filter.model", [None])[0]
+        task_ids = set(query.get("filter.task_ids", []))
+
+        items = []
+        with self.state.lock:
+            tasks = sorted(self.state.tasks.values(), key=lambda t: t["created_at"], reverse=True)
+        progression = self.state.config.task_progression or ["succeeded"]
+        for task in tasks:
+            if task_ids and task["id"] not in task_ids:
+                continue
+            if task_ids:
+                # A lookup by id is a poll, so it moves the task along just
+                # like a single-task query.
+                status = self.state.advance(task)
+            else:
+                status = progression[min(max(task["step"] - 1, 0), len(progression) - 1)]
+            if status_filter and status != status_filter:
+                continue
+            if model_filter and task["model"] != model_filter:
+                continue
+            items.append(self._task_body(task, status))
+
+        start = (page_num - 1) * page_size
+        self._send_json(
+            200, {"items": items[start:start + page_size], "total": len(items)}
+        )
+
+    def _chat_completions(self, payload: dict[str, Any]) -> None:
+        self._send_json(
+            200,
+            {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                "model": payload.get("model"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "ok"},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+            },
+        )
+
+    def _send_video(self) -> None:
+        video = self.state.video()
+        if not self.state.config.video_chunked:
+            self._send(200, video, "video/mp4")
+            return
+
+        self.state.count_response(200, 0)
+        self.send_response(200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        view = memoryview(video)
+        for start in range(0, len(video), 64 * 1024):
+            self._send_chunk(view[start:start + 64 * 1024])
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class FakeArkServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], config: FakeArkConfig) -> None:
+        super().__init__(address, FakeArkHandler)
+        self.state = FakeArkState(config)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{API_PREFIX}"
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    defaults = FakeArkConfig()
+    parser = argparse.ArgumentParser(description="Local stand-in for the Volcengine Ark API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port")
+    parser.add_argument("--latency", type=float, default=defaults.latency)
+    parser.add_argument("--latency-jitter", type=float, default=defaults.latency_jitter)
+    parser.add_argument("--stream-interval", type=float, default=defaults.stream_interval)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--error-status", type=int, default=defaults.error_status)
+    parser.add_argument("--retry-after", type=float, default=defaults.retry_after)
+    parser.add_argument("--image-bytes", type=int, default=defaults.image_bytes)
+    parser.add_argument("--video-bytes", type=int, default=defaults.video_bytes)
+    parser.add_argument("--video-chunked", action="store_true")
+    parser.add_argument(
+        "--task-progression",
+        default=",".join(defaults.task_progression),
+        help="comma separated statuses a task walks through, one per query",
+    )
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    return parser
+
+
+def config_from_args(args: argparse.Namespace) -> FakeArkConfig:
+    return FakeArkConfig(
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        stream_interval=args.stream_interval,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after,
+        image_bytes=args.image_bytes,
+        video_bytes=args.video_bytes,
+        video_chunked=args.video_chunked,
+        task_progression=[s.strip() for s in args.task_progression.split(",") if s.strip()],
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    args = build_arg_parser().parse_args()
+    config = config_from_args(args)
+    server = FakeArkServer((args.host, args.port), config)
+    # The first line is machine-readable so callers can discover the port.
+    print(json.dumps({"base_url": server.base_url, "config": asdict(config)}), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
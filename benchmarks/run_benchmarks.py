@@ -0,0 +1,607 @@
+# author: sawyer-shi
+
+"""
+End-to-end benchmark harness for the plugin tools.
+
+Starts the local Ark stand-in (``benchmarks.fake_ark_server``), then drives
+each tool's ``_invoke`` generator in a fresh subprocess so peak RSS is
+measured per scenario. For every scenario it reports wall time, time to
+first message, peak RSS, the longest stall of the gevent hub, bytes
+exchanged with the API and bytes yielded to Dify, and writes the results as
+JSON so runs can be compared.
+
+    python -m benchmarks.run_benchmarks --output results.json
+    python -m benchmarks.run_benchmarks --scenario text2image --repeat 10
+    python -m benchmarks.run_benchmarks --scenario text2video_wait --concurrency 200
+    python -m benchmarks.run_benchmarks --compare baseline.json --output new.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from dataclasses import dataclass
+from typing import Any, Callable
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@dataclass
+class BenchFile:
+    """Minimal stand-in for a Dify ``File`` parameter."""
+
+    blob: bytes
+    mime_type: str
+    filename: str
+    extension: str
+    url: str | None = None
+
+    @property
+    def size(self) -> int:
+        return len(self.blob)
+
+
+class BenchStorage:
+    """In-memory replacement for ``session.storage``."""
+
+    def __init__(self) -> None:
+        self._data: dict[str, bytes] = {}
+
+    def set(self, key: str, val: bytes) -> None:
+        self._data[key] = val
+
+    def get(self, key: str) -> bytes:
+        if key not in self._data:
+            raise ValueError(f"key {key} not found")
+        return self._data[key]
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def exist(self, key: str) -> bool:
+        return key in self._data
+
+
+class BenchSession:
+    def __init__(self) -> None:
+        self.storage = BenchStorage()
+
+
+def make_image(width: int, height: int, image_format: str) -> BenchFile:
+    from PIL import Image
+
+    image = Image.effect_noise((width, height), 48).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, quality=90)
+    extension = "jpg" if image_format == "JPEG" else image_format.lower()
+    return BenchFile(
+        blob=buffer.getvalue(),
+        mime_type=f"image/{image_format.lower()}",
+        filename=f"bench-{width}x{height}.{extension}",
+        extension=f".{extension}",
+    )
+
+
+def _unique_task_id() -> str:
+    return f"cgt-bench-{time.time_ns()}"
+
+
+# name -> (module, class, parameter factory). Factories run once per
+# invocation so inputs are fresh and task ids are unique.
+SCENARIOS: dict[str, tuple[str, str, Callable[[str], dict[str, Any]]]] = {
+    "text2image": (
+        "tools.text_2_image",
+        "Text2ImageTool",
+        lambda base: {"prompt": "a lighthouse at dusk", "size": "2048x2048"},
+    ),
+    "text2image_stream": (
+        "tools.text_2_image",
+        "Text2ImageTool",
+        lambda base: {"prompt": "a lighthouse at dusk", "stream": "true"},
+    ),
+    "text2image_batch": (
+        "tools.text_2_image_batch",
+        "Text2ImageBatchTool",
+        lambda base: {
+            "prompts": "\n".join(f"variant {i} of a lighthouse" for i in range(8)),
+            "max_concurrency": 4,
+        },
+    ),
+    "image2image": (
+        "tools.image_2_image",
+        "ImageFile2ImageTool",
+        lambda base: {
+            "prompt": "make it snowy",
+            "input_image_file": make_image(3000, 2000, "JPEG"),
+        },
+    ),
+    "multi_images_2_image": (
+        "tools.multi_images_2_image",
+        "MultiImageFiles2ImageTool",
+        lambda base: {
+            "prompt": "blend these",
+            "input_image_files": [make_image(2400, 1600, "JPEG") for _ in range(4)],
+        },
+    ),
+    "multi_images_2_multi_images": (
+        "tools.multi_images_2_multi_images",
+        "MultiImageFiles2MultiImagesTool",
+        lambda base: {
+            "prompt": "a storyboard",
+            "input_image_files": [make_image(2400, 1600, "PNG") for _ in range(3)],
+            "max_images": 4,
+        },
+    ),
+    "multi_images_2_multi_images_stream": (
+        "tools.multi_images_2_multi_images",
+        "MultiImageFiles2MultiImagesTool",
+        lambda base: {
+            "prompt": "a storyboard",
+            "input_image_files": [make_image(2400, 1600, "PNG") for _ in range(3)],
+            "max_images": 4,
+            "stream": "true",
+        },
+    ),
+    "multi_images_2_multi_images_url": (
+        "tools.multi_images_2_multi_images",
+        "MultiImageFiles2MultiImagesTool",
+        lambda base: {
+            "prompt": "a storyboard",
+            "input_image_files": [make_image(2400, 1600, "PNG") for _ in range(3)],
+            "max_images": 4,
+            "output_mode": "url",
+        },
+    ),
+    "multi_images_2_multi_images_b64": (
+        "tools.multi_images_2_multi_images",
+        "MultiImageFiles2MultiImagesTool",
+        lambda base: {
+            "prompt": "a storyboard",
+            "input_image_files": [make_image(2400, 1600, "PNG") for _ in range(3)],
+            "max_images": 4,
+            "output_mode": "b64",
+        },
+    ),
+    "text2video": (
+        "tools.text_2_video",
+        "Text2VideoTool",
+        lambda base: {"prompt": "waves on a beach", "duration": 5},
+    ),
+    "text2video_wait": (
+        "tools.text_2_video",
+        "Text2VideoTool",
+        lambda base: {
+            "prompt": "waves on a beach",
+            "duration": 5,
+            "wait_for_completion": "true",
+        },
+    ),
+    "image2video": (
+        "tools.image_2_video",
+        "Image2VideoTool",
+        lambda base: {
+            "prompt": "slow zoom",
+            "input_image_file": make_image(3000, 2000, "JPEG"),
+        },
+    ),
+    "images2video": (
+        "tools.images_2_video",
+        "Images2VideoTool",
+        lambda base: {
+            "prompt": "day to night",
+            "first_frame_file": make_image(2400, 1600, "JPEG"),
+            "last_frame_file": make_image(2400, 1600, "JPEG"),
+        },
+    ),
+    "multimodal_reference_2_video": (
+        "tools.multimodal_reference_2_video",
+        "MultimodalReference2VideoTool",
+        lambda base: {
+            "input_mode": "text_image_video",
+            "prompt": "combine the references",
+            "reference_image_files": [make_image(2400, 1600, "JPEG") for _ in range(2)],
+            "reference_video_urls": f"{base.rsplit('/api/', 1)[0]}/files/videos/ref.mp4",
+        },
+    ),
+    "video_query_download": (
+        "tools.video_query",
+        "VideoQueryTool",
+        lambda base: {
+            "task_id": _unique_task_id(),
+            "download_video": "true",
+            "wait_for_completion": "true",
+        },
+    ),
+    # The same finished task queried again and again, as retrying workflows
+    # do; after the warmup run it is answered from the registry and cache.
+    "video_query_repeat": (
+        "tools.video_query",
+        "VideoQueryTool",
+        lambda base: {
+            "task_id": "cgt-bench-repeat",
+            "download_video": "true",
+            "wait_for_completion": "true",
+        },
+    ),
+}
+
+
+def _message_size(message: Any) -> int:
+    payload = message.message
+    for attr in ("blob", "text"):
+        value = getattr(payload, attr, None)
+        if isinstance(value, (bytes, str)):
+            return len(value)
+    json_object = getattr(payload, "json_object", None)
+    if json_object is not None:
+        return len(json.dumps(json_object, ensure_ascii=False).encode("utf-8"))
+    return 0
+
+
+def _is_error(message: Any) -> bool:
+    text = getattr(message.message, "text", None)
+    return isinstance(text, str) and text.startswith("❌")
+
+
+def _http_json(url: str, method: str = "GET") -> dict[str, Any]:
+    request = urllib.request.Request(url, method=method, data=b"" if method == "POST" else None)
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def _peak_rss_kb() -> int:
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kilobytes.
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+class LoopLagMonitor:
+    """
+    Measures how long the gevent hub is blocked: a greenlet asks to sleep
+    for ``interval`` and records how late it wakes up. CPU work left on the
+    hub shows up here as lag for every concurrent invocation.
+    """
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self.max_lag = 0.0
+        self._running = False
+
+    def _run(self) -> None:
+        while self._running:
+            start = time.perf_counter()
+            time.sleep(self.interval)
+            self.max_lag = max(self.max_lag, time.perf_counter() - start - self.interval)
+
+    def __enter__(self) -> "LoopLagMonitor":
+        import threading
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._running = False
+        self._thread.join()
+
+
+def _consume(tool: Any, parameters: dict[str, Any], start: float) -> dict[str, Any]:
+    counters: dict[str, Any] = {
+        "messages": 0,
+        "error_messages": 0,
+        "bytes_yielded": 0,
+        "time_to_first_message": None,
+    }
+    for message in tool._invoke(parameters):
+        if counters["time_to_first_message"] is None:
+            counters["time_to_first_message"] = time.perf_counter() - start
+        counters["messages"] += 1
+        counters["error_messages"] += _is_error(message)
+        counters["bytes_yielded"] += _message_size(message)
+    return counters
+
+
+def run_scenario(
+    name: str, base_url: str, repeat: int, warmup: int, concurrency: int = 1
+) -> dict[str, Any]:
+    """
+    Run one scenario in this process. Call from a fresh interpreter.
+
+    With ``concurrency`` > 1 each run starts that many invocations at once,
+    the way the plugin daemon does, and reports totals across them.
+    """
+    os.environ["ARK_BASE_URL"] = base_url
+    os.environ.setdefault("ARK_POLL_INITIAL_INTERVAL", "0.05")
+    os.environ.setdefault("ARK_POLL_MAX_INTERVAL", "0.2")
+    os.environ.setdefault("ARK_POLL_JITTER", "0")
+    # Start every scenario with an empty video cache of its own.
+    video_cache_dir = tempfile.mkdtemp(prefix="bench-video-cache-")
+    os.environ.setdefault("ARK_VIDEO_CACHE_DIR", video_cache_dir)
+    sys.path.insert(0, REPO_ROOT)
+
+    import importlib
+
+    from dify_plugin.entities.tool import ToolRuntime
+
+    module_name, class_name, factory = SCENARIOS[name]
+    tool_class = getattr(importlib.import_module(module_name), class_name)
+    server_root = base_url.rsplit("/api/", 1)[0]
+    rss_before = _peak_rss_kb()
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    runs = []
+    for iteration in range(warmup + repeat):
+        invocations = [
+            (
+                tool_class(
+                    runtime=ToolRuntime(
+                        credentials={"api_key": "bench-key"}, user_id="bench", session_id=None
+                    ),
+                    session=BenchSession(),
+                ),
+                factory(base_url),
+            )
+            for _ in range(concurrency)
+        ]
+        _http_json(f"{server_root}/__reset", method="POST")
+
+        with LoopLagMonitor() as monitor:
+            start = time.perf_counter()
+            if concurrency == 1:
+                results = [_consume(*invocations[0], start)]
+            else:
+                # Threads are greenlets once dify_plugin has patched them,
+                # matching how the daemon runs concurrent invocations.
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    futures = [
+                        executor.submit(_consume, tool, parameters, start)
+                        for tool, parameters in invocations
+                    ]
+                    results = [future.result() for future in futures]
+            wall_time = time.perf_counter() - start
+
+        stats = _http_json(f"{server_root}/__stats")
+        if iteration < warmup:
+            continue
+        first_messages = [
+            result["time_to_first_message"]
+            for result in results
+            if result["time_to_first_message"] is not None
+        ]
+        runs.append(
+            {
+                "wall_time": wall_time,
+                "time_to_first_message": statistics.median(first_messages)
+                if first_messages
+                else None,
+                "max_loop_lag": monitor.max_lag,
+                "messages": sum(result["messages"] for result in results),
+                "error_messages": sum(result["error_messages"] for result in results),
+                "bytes_yielded": sum(result["bytes_yielded"] for result in results),
+                "api_requests": stats["requests"],
+                "api_bytes_sent": stats["bytes_in"],
+                "api_bytes_received": stats["bytes_out"],
+            }
+        )
+
+    shutil.rmtree(video_cache_dir, ignore_errors=True)
+
+    def median(key: str) -> float:
+        values = [run[key] for run in runs if run[key] is not None]
+        return statistics.median(values) if values else 0.0
+
+    return {
+        "scenario": name,
+        "repeat": repeat,
+        "concurrency": concurrency,
+        "wall_time_median": median("wall_time"),
+        "wall_time_min": min(run["wall_time"] for run in runs),
+        "wall_time_max": max(run["wall_time"] for run in runs),
+        "time_to_first_message_median": median("time_to_first_message"),
+        "max_loop_lag": max(run["max_loop_lag"] for run in runs),
+        "peak_rss_kb": _peak_rss_kb(),
+        "peak_rss_delta_kb": _peak_rss_kb() - rss_before,
+        "bytes_yielded": median("bytes_yielded"),
+        "api_requests": median("api_requests"),
+        "api_bytes_sent": median("api_bytes_sent"),
+        "api_bytes_received": median("api_bytes_received"),
+        "error_messages": max(run["error_messages"] for run in runs),
+        "runs": runs,
+    }
+
+
+def start_server(server_args: list[str]) -> tuple[subprocess.Popen, str, dict[str, Any]]:
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fake_ark_server", *server_args],
+        cwd=REPO_ROOT,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    banner = json.loads(process.stdout.readline())
+    return process, banner["base_url"], banner["config"]
+
+
+def run_in_subprocess(
+    name: str, base_url: str, repeat: int, warmup: int, concurrency: int
+) -> dict[str, Any]:
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.run_benchmarks",
+            "--child",
+            name,
+            "--base-url",
+            base_url,
+            "--repeat",
+            str(repeat),
+            "--warmup",
+            str(warmup),
+            "--concurrency",
+            str(concurrency),
+        ],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        return {"scenario": name, "failed": True, "stderr": result.stderr[-2000:]}
+    # Plugin imports may print to stdout; the result is the last line.
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(results: list[dict[str, Any]], baseline: dict[str, dict[str, Any]]) -> None:
+    header = (
+        f"{'scenario':<38}{'wall ms':>10}{'first ms':>10}{'rss MB':>9}"
+        f"{'lag ms':>8}{'api out KB':>12}{'api in KB':>11}{'yield KB':>10}{'err':>5}"
+    )
+    if baseline:
+        header += f"{'Δwall':>9}{'Δrss':>8}"
+    print(header)
+    for result in results:
+        if result.get("failed"):
+            print(f"{result['scenario']:<38} FAILED")
+            continue
+        line = (
+            f"{result['scenario']:<38}"
+            f"{result['wall_time_median'] * 1000:>10.1f}"
+            f"{result['time_to_first_message_median'] * 1000:>10.1f}"
+            f"{result['peak_rss_kb'] / 1024:>9.1f}"
+            f"{result.get('max_loop_lag', 0) * 1000:>8.1f}"
+            f"{result['api_bytes_sent'] / 1024:>12.1f}"
+            f"{result['api_bytes_received'] / 1024:>11.1f}"
+            f"{result['bytes_yielded'] / 1024:>10.1f}"
+            f"{result['error_messages']:>5}"
+        )
+        previous = baseline.get(result["scenario"])
+        if previous and not previous.get("failed"):
+            line += f"{_change(previous['wall_time_median'], result['wall_time_median']):>9}"
+            line += f"{_change(previous['peak_rss_kb'], result['peak_rss_kb']):>8}"
+        print(line)
+
+
+def _change(old: float, new: float) -> str:
+    if not old:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.0f}%"
+
+
+def main() -> None:
+    from benchmarks.fake_ark_server import build_arg_parser as server_arg_parser
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the plugin tools against a local Ark stand-in",
+        parents=[server_arg_parser()],
+        conflict_handler="resolve",
+    )
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=sorted(SCENARIOS),
+        help="scenario to run (repeatable, default: all)",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="simultaneous invocations per run, as the plugin daemon would issue them",
+    )
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--compare", help="baseline JSON results to diff against")
+    parser.add_argument("--base-url", help="use an already running server")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(
+            json.dumps(
+                run_scenario(
+                    args.child, args.base_url, args.repeat, args.warmup, args.concurrency
+                )
+            )
+        )
+        return
+
+    server = None
+    server_config: dict[str, Any] = {}
+    base_url = args.base_url
+    if not base_url:
+        server_args = []
+        for action in server_arg_parser()._actions:
+            if not action.option_strings or action.dest == "help":
+                continue
+            value = getattr(args, action.dest)
+            if isinstance(value, bool):
+                if value:
+                    server_args.append(action.option_strings[0])
+            elif value is not None:
+                server_args.extend([action.option_strings[0], str(value)])
+        server, base_url, server_config = start_server(server_args)
+
+    try:
+        results = [
+            run_in_subprocess(name, base_url, args.repeat, args.warmup, args.concurrency)
+            for name in (args.scenario or list(SCENARIOS))
+        ]
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    baseline: dict[str, dict[str, Any]] = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = {r["scenario"]: r for r in json.load(f)["results"]}
+
+    print_table(results, baseline)
+
+    if args.output:
+        report = {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "server": server_config,
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if any(result.get("failed") for result in results):
+        for result in results:
+            if result.get("failed"):
+                print(f"\n[{result['scenario']}]\n{result['stderr']}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,23 @@
 # author: sawyer-shi
 
-import base64
 import json
 import logging
 from collections.abc import Generator
-from io import BytesIO
 from typing import Any
 
 import requests
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
-from PIL import Image
+
+from utils.ark_client import IMAGES_GENERATIONS_URL, ark_client
+from utils.image_output import emit_image, parse_output_mode, response_format_for
+from utils.image_processing import (
+    encode_image_file,
+    input_limits_for,
+    target_dimension_for_image,
+)
+from utils.payload_log import RedactedPayload
+from utils.queue_status import announce_queue, report_queue_wait
 
 logger = logging.getLogger(__name__)
 
@@ -30,12 +37,6 @@ class ImageFile2ImageTool(Tool):
                 yield self.create_text_message(msg)
                 return
 
-            api_url = "https://ark.cn-beijing.volces.com/api/v3/images/generations"
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            }
-
             prompt = tool_parameters.get("prompt", "").strip()
             if not prompt:
                 msg = "❌ 请输入提示词"
@@ -55,6 +56,7 @@ class ImageFile2ImageTool(Tool):
                 "sequential_image_generation", "disabled"
             )
             watermark = tool_parameters.get("watermark", "true") == "true"
+            output_mode = parse_output_mode(tool_parameters)
             model = tool_parameters.get("model", "doubao-seedream-4-5-251128")
 
             yield self.create_text_message("🚀 图生图任务启动中...")
@@ -65,50 +67,11 @@ class ImageFile2ImageTool(Tool):
             yield self.create_text_message("⏳ 正在处理输入图像文件...")
 
             try:
-                if hasattr(input_image_file, "blob"):
-                    image_bytes = input_image_file.blob
-                elif hasattr(input_image_file, "read") and callable(
-                    getattr(input_image_file, "read")
-                ):
-                    image_bytes = input_image_file.read()
-                    if isinstance(image_bytes, str):
-                        image_bytes = image_bytes.encode("utf-8")
-                elif isinstance(input_image_file, bytes):
-                    image_bytes = input_image_file
-                elif isinstance(input_image_file, str) and input_image_file.startswith("data:"):
-                    _, base64_data = input_image_file.split(",", 1)
-                    image_bytes = base64.b64decode(base64_data)
-                else:
-                    raise ValueError(f"不支持的图像数据类型: {type(input_image_file)}")
-
-                if not isinstance(image_bytes, bytes):
-                    raise ValueError("图像数据必须是字节格式")
-
-                if len(image_bytes) > 10 * 1024 * 1024:
-                    msg = "❌ 输入图片大小超过10MB限制"
-                    logger.warning(msg)
-                    yield self.create_text_message(msg)
-                    return
-
-                image = Image.open(BytesIO(image_bytes))
-
-                if image.mode == "RGBA":
-                    background = Image.new("RGB", image.size, (255, 255, 255))
-                    background.paste(image, mask=image.split()[3])
-                    image = background
-                elif image.mode == "P":
-                    image = image.convert("RGB")
-
-                img_byte_arr = BytesIO()
-                image.save(img_byte_arr, format="PNG")
-                png_size = len(img_byte_arr.getvalue())
-
-                if png_size > 10 * 1024 * 1024:
-                    img_byte_arr = BytesIO()
-                    image.save(img_byte_arr, format="JPEG", quality=95)
-
-                img_base64 = base64.b64encode(img_byte_arr.getvalue()).decode("utf-8")
-                data_url = f"data:image/png;base64,{img_base64}"
+                data_url = encode_image_file(
+                    input_image_file,
+                    max_dimension=target_dimension_for_image(size, model),
+                    limits=input_limits_for(model),
+                ).to_data_url()
             except Exception as e:
                 yield self.create_text_message(f"❌ 图像处理失败: {str(e)}")
                 return
@@ -120,19 +83,17 @@ class ImageFile2ImageTool(Tool):
                 "size": size,
                 "sequential_image_generation": sequential_image_generation,
                 "stream": False,
-                "response_format": "b64_json",
+                "response_format": response_format_for(output_mode),
                 "watermark": watermark,
             }
 
-            logger.info("Submitting request: %s", json.dumps(payload, ensure_ascii=False))
+            logger.info("Submitting request: %s", RedactedPayload(payload))
             yield self.create_text_message("🎨 正在生成图像，请稍候...")
 
+            yield from announce_queue(self, api_key, "image_edit")
             try:
-                response = requests.post(
-                    api_url,
-                    headers=headers,
-                    json=payload,
-                    timeout=360,
+                response = ark_client.post(
+                    IMAGES_GENERATIONS_URL, api_key, payload, "image_edit"
                 )
             except requests.exceptions.Timeout:
                 msg = "❌ 请求超时，请稍后重试"
@@ -145,6 +106,8 @@ class ImageFile2ImageTool(Tool):
                 yield self.create_text_message(msg)
                 return
 
+            yield from report_queue_wait(self, response)
+
             if response.status_code != 200:
                 logger.error(
                     "API status %s: %s", response.status_code, response.text[:300]
@@ -175,30 +138,26 @@ class ImageFile2ImageTool(Tool):
             yield self.create_text_message("🎉 图像生成成功！")
 
             for i, data in enumerate(data_list):
-                b64_json = data.get("b64_json", "")
                 image_size_text = data.get("size", "")
-                if not b64_json:
+                if not data.get("url") and not data.get("b64_json"):
                     yield self.create_text_message(
-                        f"❌ 未获取到第 {i + 1} 张图片的Base64数据"
+                        f"❌ 未获取到第 {i + 1} 张图片的数据"
                     )
                     return
 
                 try:
-                    image_bytes = base64.b64decode(b64_json)
-                    yield self.create_blob_message(
-                        blob=image_bytes,
-                        meta={"mime_type": "image/png"},
-                    )
+                    image_bytes_size = yield from emit_image(self, data, output_mode)
                 except Exception as e:
-                    logger.error("Failed to decode image: %s", str(e))
+                    logger.error("Failed to output image: %s", str(e))
                     yield self.create_text_message(f"❌ 处理图像失败: {str(e)}")
                     return
 
                 info_text = f"✅ 第 {i + 1} 张图片生成完成！\n"
                 if image_size_text:
                     info_text += f"📐 尺寸: {image_size_text}\n"
-                info_text += f"💾 大小: {len(image_bytes) / 1024 / 1024:.2f} MB"
-                yield self.create_text_message(info_text)
+                if image_bytes_size is not None:
+                    info_text += f"💾 大小: {image_bytes_size / 1024 / 1024:.2f} MB"
+                yield self.create_text_message(info_text.rstrip())
 
             usage = resp_data.get("usage", {})
             if usage:
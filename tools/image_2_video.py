@@ -1,16 +1,30 @@
 # author: sawyer-shi
 
-import base64
 import json
 import logging
 from collections.abc import Generator
-from io import BytesIO
 from typing import Any
 
 import requests
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
-from PIL import Image
+
+from utils.ark_client import CONTENTS_GENERATIONS_TASKS_URL
+from utils.assets import post_with_assets
+from utils.image_processing import (
+    encode_image_file,
+    input_limits_for,
+    target_dimension_for_video,
+)
+from utils.payload_log import RedactedPayload
+from utils.queue_status import (
+    announce_queue,
+    report_assets,
+    report_queue_wait,
+    report_reuse,
+)
+from utils.task_registry import task_registry
+from utils.video_tasks import parse_wait_parameters, report_task_result, wait_for_task
 
 logger = logging.getLogger(__name__)
 
@@ -48,12 +62,6 @@ class Image2VideoTool(Tool):
                 yield self.create_text_message(msg)
                 return
 
-            api_url = "https://ark.cn-beijing.volces.com/api/v3/contents/generations/tasks"
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            }
-
             prompt = tool_parameters.get("prompt", "").strip()
             if not prompt:
                 msg = "❌ 请输入提示词"
@@ -80,6 +88,7 @@ class Image2VideoTool(Tool):
             draft = tool_parameters.get("draft", "false") == "true"
             return_last_frame = tool_parameters.get("return_last_frame", "false") == "true"
             service_tier = tool_parameters.get("service_tier", "default")
+            wait_for_completion, max_wait_seconds = parse_wait_parameters(tool_parameters)
 
             if len(prompt) > 500:
                 prompt = prompt[:500]
@@ -126,50 +135,11 @@ class Image2VideoTool(Tool):
             yield self.create_text_message("⏳ 正在处理输入图像文件...")
 
             try:
-                if hasattr(input_image_file, "blob"):
-                    image_bytes = input_image_file.blob
-                elif hasattr(input_image_file, "read") and callable(
-                    getattr(input_image_file, "read")
-                ):
-                    image_bytes = input_image_file.read()
-                    if isinstance(image_bytes, str):
-                        image_bytes = image_bytes.encode("utf-8")
-                elif isinstance(input_image_file, bytes):
-                    image_bytes = input_image_file
-                elif isinstance(input_image_file, str) and input_image_file.startswith("data:"):
-                    _, base64_data = input_image_file.split(",", 1)
-                    image_bytes = base64.b64decode(base64_data)
-                else:
-                    raise ValueError(f"不支持的图像数据类型: {type(input_image_file)}")
-
-                if not isinstance(image_bytes, bytes):
-                    raise ValueError("图像数据必须是字节格式")
-
-                if len(image_bytes) > 10 * 1024 * 1024:
-                    msg = "❌ 输入图片大小超过10MB限制"
-                    logger.warning(msg)
-                    yield self.create_text_message(msg)
-                    return
-
-                image = Image.open(BytesIO(image_bytes))
-
-                if image.mode == "RGBA":
-                    background = Image.new("RGB", image.size, (255, 255, 255))
-                    background.paste(image, mask=image.split()[3])
-                    image = background
-                elif image.mode == "P":
-                    image = image.convert("RGB")
-
-                img_byte_arr = BytesIO()
-                image.save(img_byte_arr, format="PNG")
-                png_size = len(img_byte_arr.getvalue())
-
-                if png_size > 10 * 1024 * 1024:
-                    img_byte_arr = BytesIO()
-                    image.save(img_byte_arr, format="JPEG", quality=95)
-
-                img_base64 = base64.b64encode(img_byte_arr.getvalue()).decode("utf-8")
-                data_url = f"data:image/png;base64,{img_base64}"
+                data_url = encode_image_file(
+                    input_image_file,
+                    max_dimension=target_dimension_for_video(resolution, model),
+                    limits=input_limits_for(model),
+                ).to_data_url()
             except Exception as e:
                 yield self.create_text_message(f"❌ 图像处理失败: {str(e)}")
                 return
@@ -194,15 +164,18 @@ class Image2VideoTool(Tool):
                 payload["camera_fixed"] = camera_fixed
                 payload["service_tier"] = service_tier
 
-            logger.info("Submitting request: %s", json.dumps(payload, ensure_ascii=False))
+            logger.info("Submitting request: %s", RedactedPayload(payload))
             yield self.create_text_message("🎬 正在生成视频，请稍候...")
 
+            yield from announce_queue(self, api_key, "task_submit")
             try:
-                response = requests.post(
-                    api_url,
-                    headers=headers,
-                    json=payload,
-                    timeout=60,
+                response = post_with_assets(
+                    self.session,
+                    CONTENTS_GENERATIONS_TASKS_URL,
+                    api_key,
+                    payload,
+                    "task_submit",
+                    dedupe=True,
                 )
             except requests.exceptions.Timeout:
                 msg = "❌ 请求超时，请稍后重试"
@@ -215,6 +188,10 @@ class Image2VideoTool(Tool):
                 yield self.create_text_message(msg)
                 return
 
+            yield from report_queue_wait(self, response)
+            yield from report_assets(self, response)
+            yield from report_reuse(self, response)
+
             if response.status_code != 200:
                 logger.error(
                     "API status %s: %s", response.status_code, response.text[:300]
@@ -242,6 +219,11 @@ class Image2VideoTool(Tool):
                 yield self.create_text_message("❌ API 响应中未返回任务ID")
                 return
 
+            task_registry.record_submission(
+                api_key, task_id, "image_2_video", model, tool_parameters
+            )
+            task_registry.save(self.session, api_key)
+
             yield self.create_text_message(f"📋 视频生成任务已提交，任务ID: {task_id}")
             yield self.create_text_message("✅ 任务提交成功，可用任务ID查询状态")
 
@@ -260,6 +242,16 @@ class Image2VideoTool(Tool):
 
             yield self.create_text_message("🎯 图生视频任务提交完成！")
 
+            if wait_for_completion:
+                final_data = yield from wait_for_task(
+                    self, api_key, task_id, max_wait_seconds
+                )
+                if final_data is not None:
+                    task_registry.observe(api_key, final_data)
+                    task_registry.save(self.session, api_key)
+                    yield from report_task_result(self, final_data)
+                    return
+
             result_json = {
                 "task_id": task_id,
                 "status": "submitted",
@@ -1,16 +1,26 @@
 # author: sawyer-shi
 
-import base64
 import json
 import logging
 from collections.abc import Generator
-from io import BytesIO
 from typing import Any
 
 import requests
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
-from PIL import Image
+
+from utils.ark_client import IMAGES_GENERATIONS_URL
+from utils.assets import post_with_assets
+from utils.image_output import emit_image, parse_output_mode, response_format_for
+from utils.image_processing import (
+    ImageEncodeError,
+    encode_image_files_to_data_urls,
+    input_limits_for,
+    target_dimension_for_image,
+)
+from utils.image_stream import relay_image_stream
+from utils.payload_log import RedactedPayload
+from utils.queue_status import announce_queue, report_assets, report_queue_wait
 
 logger = logging.getLogger(__name__)
 
@@ -30,12 +40,6 @@ class MultiImageFiles2MultiImagesTool(Tool):
                 yield self.create_text_message(msg)
                 return
 
-            api_url = "https://ark.cn-beijing.volces.com/api/v3/images/generations"
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            }
-
             prompt = tool_parameters.get("prompt", "").strip()
             if not prompt:
                 msg = "❌ 请输入提示词"
@@ -54,6 +58,8 @@ class MultiImageFiles2MultiImagesTool(Tool):
             size = tool_parameters.get("size", "2048x2048")
             max_images = int(tool_parameters.get("max_images", 4))
             watermark = tool_parameters.get("watermark", "true") == "true"
+            output_mode = parse_output_mode(tool_parameters)
+            stream = tool_parameters.get("stream", "false") == "true"
 
             yield self.create_text_message("🚀 多参考图生组图任务启动中...")
             yield self.create_text_message(f"🤖 使用模型: {model}")
@@ -63,63 +69,17 @@ class MultiImageFiles2MultiImagesTool(Tool):
             yield self.create_text_message(f"📷 参考图片数量: {len(input_image_files)}")
             yield self.create_text_message("⏳ 正在处理输入图像文件...")
 
-            valid_image_data_urls = []
-            for i, input_image_file in enumerate(input_image_files):
-                try:
-                    if hasattr(input_image_file, "blob"):
-                        image_bytes = input_image_file.blob
-                    elif hasattr(input_image_file, "read") and callable(
-                        getattr(input_image_file, "read")
-                    ):
-                        image_bytes = input_image_file.read()
-                        if isinstance(image_bytes, str):
-                            image_bytes = image_bytes.encode("utf-8")
-                    elif isinstance(input_image_file, bytes):
-                        image_bytes = input_image_file
-                    elif isinstance(input_image_file, str) and input_image_file.startswith(
-                        "data:"
-                    ):
-                        _, base64_data = input_image_file.split(",", 1)
-                        image_bytes = base64.b64decode(base64_data)
-                    else:
-                        raise ValueError(
-                            f"不支持的图像数据类型: {type(input_image_file)}"
-                        )
-
-                    if not isinstance(image_bytes, bytes):
-                        raise ValueError("图像数据必须是字节格式")
-
-                    if len(image_bytes) > 10 * 1024 * 1024:
-                        msg = f"❌ 第 {i + 1} 张输入图片大小超过10MB限制"
-                        logger.warning(msg)
-                        yield self.create_text_message(msg)
-                        return
-
-                    image = Image.open(BytesIO(image_bytes))
-
-                    if image.mode == "RGBA":
-                        background = Image.new("RGB", image.size, (255, 255, 255))
-                        background.paste(image, mask=image.split()[3])
-                        image = background
-                    elif image.mode == "P":
-                        image = image.convert("RGB")
-
-                    img_byte_arr = BytesIO()
-                    image.save(img_byte_arr, format="PNG")
-                    png_size = len(img_byte_arr.getvalue())
-
-                    if png_size > 10 * 1024 * 1024:
-                        img_byte_arr = BytesIO()
-                        image.save(img_byte_arr, format="JPEG", quality=95)
-
-                    img_base64 = base64.b64encode(img_byte_arr.getvalue()).decode("utf-8")
-                    data_url = f"data:image/png;base64,{img_base64}"
-                    valid_image_data_urls.append(data_url)
-                except Exception as e:
-                    yield self.create_text_message(
-                        f"❌ 第 {i + 1} 张图像处理失败: {str(e)}"
-                    )
-                    return
+            try:
+                valid_image_data_urls = encode_image_files_to_data_urls(
+                    input_image_files,
+                    max_dimension=target_dimension_for_image(size, model),
+                    limits=input_limits_for(model),
+                )
+            except ImageEncodeError as e:
+                yield self.create_text_message(
+                    f"❌ 第 {e.index + 1} 张图像处理失败: {str(e)}"
+                )
+                return
 
             yield self.create_text_message(f"📐 图像尺寸: {size}")
             yield self.create_text_message("⏳ 正在连接火山方舟 API...")
@@ -131,19 +91,23 @@ class MultiImageFiles2MultiImagesTool(Tool):
                 "size": size,
                 "sequential_image_generation": "auto",
                 "sequential_image_generation_options": {"max_images": max_images},
+                "stream": stream,
                 "watermark": watermark,
-                "response_format": "b64_json",
+                "response_format": response_format_for(output_mode),
             }
 
-            logger.info("Submitting request: %s", json.dumps(payload, ensure_ascii=False))
+            logger.info("Submitting request: %s", RedactedPayload(payload))
             yield self.create_text_message("🎨 正在生成组图，请稍候...")
 
+            yield from announce_queue(self, api_key, "image_edit")
             try:
-                response = requests.post(
-                    api_url,
-                    headers=headers,
-                    json=payload,
-                    timeout=360,
+                response = post_with_assets(
+                    self.session,
+                    IMAGES_GENERATIONS_URL,
+                    api_key,
+                    payload,
+                    "image_edit",
+                    stream=stream,
                 )
             except requests.exceptions.Timeout:
                 msg = "❌ 请求超时，请稍后重试"
@@ -156,6 +120,9 @@ class MultiImageFiles2MultiImagesTool(Tool):
                 yield self.create_text_message(msg)
                 return
 
+            yield from report_queue_wait(self, response)
+            yield from report_assets(self, response)
+
             if response.status_code != 200:
                 logger.error(
                     "API status %s: %s", response.status_code, response.text[:300]
@@ -169,6 +136,26 @@ class MultiImageFiles2MultiImagesTool(Tool):
                     )
                 return
 
+            if stream:
+                try:
+                    with response:
+                        image_count = yield from relay_image_stream(
+                            self, response, output_mode
+                        )
+                except requests.exceptions.RequestException as e:
+                    msg = f"❌ 流式响应中断: {str(e)}"
+                    logger.error(msg)
+                    yield self.create_text_message(msg)
+                    return
+
+                if not image_count:
+                    yield self.create_text_message("❌ API 响应中未返回图像数据")
+                    return
+
+                yield self.create_text_message("🎯 多参考图生组图任务完成！")
+                logger.info("Multi-reference group image task completed (stream)")
+                return
+
             try:
                 resp_data = response.json()
             except json.JSONDecodeError as e:
@@ -186,30 +173,26 @@ class MultiImageFiles2MultiImagesTool(Tool):
             yield self.create_text_message("🎉 组图生成成功！")
 
             for i, data in enumerate(data_list):
-                b64_json = data.get("b64_json", "")
                 image_size_text = data.get("size", "")
-                if not b64_json:
+                if not data.get("url") and not data.get("b64_json"):
                     yield self.create_text_message(
-                        f"❌ 未获取到第 {i + 1} 张图片的Base64数据"
+                        f"❌ 未获取到第 {i + 1} 张图片的数据"
                     )
                     return
 
                 try:
-                    image_bytes = base64.b64decode(b64_json)
-                    yield self.create_blob_message(
-                        blob=image_bytes,
-                        meta={"mime_type": "image/png"},
-                    )
+                    image_bytes_size = yield from emit_image(self, data, output_mode)
                 except Exception as e:
-                    logger.error("Failed to decode image: %s", str(e))
+                    logger.error("Failed to output image: %s", str(e))
                     yield self.create_text_message(f"❌ 处理图像失败: {str(e)}")
                     return
 
                 info_text = f"✅ 第 {i + 1} 张图片生成完成！\n"
                 if image_size_text:
                     info_text += f"📐 尺寸: {image_size_text}\n"
-                info_text += f"💾 大小: {len(image_bytes) / 1024 / 1024:.2f} MB"
-                yield self.create_text_message(info_text)
+                if image_bytes_size is not None:
+                    info_text += f"💾 大小: {image_bytes_size / 1024 / 1024:.2f} MB"
+                yield self.create_text_message(info_text.rstrip())
 
             usage = resp_data.get("usage", {})
             if usage:
@@ -1,16 +1,36 @@
 # author: sawyer-shi
 
-import base64
 import json
 import logging
 from collections.abc import Generator
-from io import BytesIO
 from typing import Any
 
 import requests
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
-from PIL import Image
+
+from utils.ark_client import CONTENTS_GENERATIONS_TASKS_URL
+from utils.assets import post_with_assets
+from utils.audio_processing import DURATION_TOLERANCE, MAX_TOTAL_AUDIO_SECONDS, read_audio
+from utils.image_processing import (
+    ImageEncodeError,
+    ImageLimits,
+    encode_all,
+    encode_image,
+    input_limits_for,
+    read_image_bytes,
+    target_dimension_for_video,
+)
+from utils.payload_log import RedactedPayload
+from utils.queue_status import (
+    announce_queue,
+    report_assets,
+    report_queue_wait,
+    report_reuse,
+)
+from utils.request_body import DataUrl
+from utils.task_registry import task_registry
+from utils.video_tasks import parse_wait_parameters, report_task_result, wait_for_task
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +43,8 @@ MODEL_ALIASES = {
     "doubao-seedance-2-0-fast-250428": "doubao-seedance-2-0-fast-260128",
 }
 
+MAX_REFERENCE_IMAGE_BYTES = 30 * 1024 * 1024
+
 MODE_RULES: dict[str, dict[str, Any]] = {
     "text_video": {
         "label": "文本（可选）+ 视频",
@@ -145,6 +167,7 @@ class MultimodalReference2VideoTool(Tool):
             return_last_frame = (
                 tool_parameters.get("return_last_frame", "false") == "true"
             )
+            wait_for_completion, max_wait_seconds = parse_wait_parameters(tool_parameters)
 
             if resolution == "1080p":
                 resolution = "720p"
@@ -178,15 +201,21 @@ class MultimodalReference2VideoTool(Tool):
 
             if image_files:
                 yield self.create_text_message("⏳ 正在处理参考图片...")
-                for i, image_file in enumerate(image_files):
-                    try:
-                        image_data_url = self._encode_image(image_file)
-                    except Exception as e:
-                        yield self.create_text_message(
-                            f"❌ 第 {i + 1} 张图片处理失败: {str(e)}"
-                        )
-                        return
+                try:
+                    max_dimension = target_dimension_for_video(resolution, model)
+                    limits = input_limits_for(model)
+                    image_data_urls = encode_all(
+                        image_files,
+                        lambda image: self._encode_image(image, max_dimension, limits),
+                        reader=self._load_image,
+                    )
+                except ImageEncodeError as e:
+                    yield self.create_text_message(
+                        f"❌ 第 {e.index + 1} 张图片处理失败: {str(e)}"
+                    )
+                    return
 
+                for image_data_url in image_data_urls:
                     content.append(
                         {
                             "type": "image_url",
@@ -207,15 +236,24 @@ class MultimodalReference2VideoTool(Tool):
 
             if audio_files:
                 yield self.create_text_message("⏳ 正在处理参考音频...")
+                total_audio_seconds = 0.0
                 for i, audio_file in enumerate(audio_files):
                     try:
-                        audio_data_url = self._encode_audio(audio_file)
+                        audio_data_url, audio_seconds = self._encode_audio(audio_file)
                     except Exception as e:
                         yield self.create_text_message(
                             f"❌ 第 {i + 1} 段音频处理失败: {str(e)}"
                         )
                         return
 
+                    total_audio_seconds += audio_seconds or 0.0
+                    if total_audio_seconds > MAX_TOTAL_AUDIO_SECONDS + DURATION_TOLERANCE:
+                        yield self.create_text_message(
+                            f"❌ 参考音频总时长 {total_audio_seconds:.1f} 秒超过 "
+                            f"{MAX_TOTAL_AUDIO_SECONDS} 秒限制"
+                        )
+                        return
+
                     content.append(
                         {
                             "type": "audio_url",
@@ -236,21 +274,18 @@ class MultimodalReference2VideoTool(Tool):
                 "return_last_frame": return_last_frame,
             }
 
-            api_url = "https://ark.cn-beijing.volces.com/api/v3/contents/generations/tasks"
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            }
-
-            logger.info("Submitting request: %s", json.dumps(payload, ensure_ascii=False))
+            logger.info("Submitting request: %s", RedactedPayload(payload))
             yield self.create_text_message("🎬 正在生成视频，请稍候...")
 
+            yield from announce_queue(self, api_key, "task_submit")
             try:
-                response = requests.post(
-                    api_url,
-                    headers=headers,
-                    json=payload,
-                    timeout=60,
+                response = post_with_assets(
+                    self.session,
+                    CONTENTS_GENERATIONS_TASKS_URL,
+                    api_key,
+                    payload,
+                    "task_submit",
+                    dedupe=True,
                 )
             except requests.exceptions.Timeout:
                 msg = "❌ 请求超时，请稍后重试"
@@ -263,6 +298,10 @@ class MultimodalReference2VideoTool(Tool):
                 yield self.create_text_message(msg)
                 return
 
+            yield from report_queue_wait(self, response)
+            yield from report_assets(self, response)
+            yield from report_reuse(self, response)
+
             if response.status_code != 200:
                 logger.error("API status %s: %s", response.status_code, response.text[:300])
                 yield self.create_text_message(
@@ -284,6 +323,11 @@ class MultimodalReference2VideoTool(Tool):
                 yield self.create_text_message("❌ API 响应中未返回任务ID")
                 return
 
+            task_registry.record_submission(
+                api_key, task_id, "multimodal_reference_2_video", model, tool_parameters
+            )
+            task_registry.save(self.session, api_key)
+
             yield self.create_text_message(f"📋 视频生成任务已提交，任务ID: {task_id}")
             yield self.create_text_message("✅ 任务提交成功，可用任务ID查询状态")
 
@@ -302,6 +346,16 @@ class MultimodalReference2VideoTool(Tool):
 
             yield self.create_text_message("🎯 多模态参考生视频任务提交完成！")
 
+            if wait_for_completion:
+                final_data = yield from wait_for_task(
+                    self, api_key, task_id, max_wait_seconds
+                )
+                if final_data is not None:
+                    task_registry.observe(api_key, final_data)
+                    task_registry.save(self.session, api_key)
+                    yield from report_task_result(self, final_data)
+                    return
+
             result_json = {
                 "task_id": task_id,
                 "status": "submitted",
@@ -350,18 +404,8 @@ class MultimodalReference2VideoTool(Tool):
         return valid_urls
 
     @staticmethod
-    def _encode_image(input_image_file: Any) -> str:
-        if hasattr(input_image_file, "blob"):
-            image_bytes = input_image_file.blob
-        elif hasattr(input_image_file, "read") and callable(
-            getattr(input_image_file, "read")
-        ):
-            image_bytes = input_image_file.read()
-            if isinstance(image_bytes, str):
-                image_bytes = image_bytes.encode("utf-8")
-        elif isinstance(input_image_file, bytes):
-            image_bytes = input_image_file
-        elif isinstance(input_image_file, str):
+    def _load_image(input_image_file: Any) -> str | bytes:
+        if isinstance(input_image_file, str):
             if input_image_file.startswith("data:image/"):
                 return input_image_file
             if input_image_file.startswith("http://") or input_image_file.startswith(
@@ -371,70 +415,35 @@ class MultimodalReference2VideoTool(Tool):
             if input_image_file.startswith("asset://"):
                 return input_image_file
             raise ValueError("不支持的图片字符串格式")
-        else:
-            raise ValueError(f"不支持的图像数据类型: {type(input_image_file)}")
-
-        if not isinstance(image_bytes, bytes):
-            raise ValueError("图像数据必须是字节格式")
 
-        if len(image_bytes) > 30 * 1024 * 1024:
-            raise ValueError("输入图片大小超过30MB限制")
+        return read_image_bytes(input_image_file)
 
-        image = Image.open(BytesIO(image_bytes))
-        if image.mode == "RGBA":
-            background = Image.new("RGB", image.size, (255, 255, 255))
-            background.paste(image, mask=image.split()[3])
-            image = background
-        elif image.mode == "P":
-            image = image.convert("RGB")
-
-        img_byte_arr = BytesIO()
-        image.save(img_byte_arr, format="PNG")
-        img_base64 = base64.b64encode(img_byte_arr.getvalue()).decode("utf-8")
-        return f"data:image/png;base64,{img_base64}"
+    @staticmethod
+    def _encode_image(
+        image: str | bytes,
+        max_dimension: int | None = None,
+        limits: ImageLimits | None = None,
+    ) -> str | DataUrl:
+        if isinstance(image, str):
+            return image
+
+        return encode_image(
+            image, MAX_REFERENCE_IMAGE_BYTES, max_dimension, limits
+        ).to_data_url()
 
     @staticmethod
-    def _encode_audio(input_audio_file: Any) -> str:
+    def _encode_audio(input_audio_file: Any) -> tuple[str | DataUrl, float | None]:
+        """Return the audio reference for the payload and its duration if known."""
         if isinstance(input_audio_file, str):
             if input_audio_file.startswith("data:audio/"):
-                return input_audio_file
+                return input_audio_file, None
             if input_audio_file.startswith("http://") or input_audio_file.startswith(
                 "https://"
             ):
-                return input_audio_file
+                return input_audio_file, None
             if input_audio_file.startswith("asset://"):
-                return input_audio_file
+                return input_audio_file, None
             raise ValueError("不支持的音频字符串格式")
 
-        if hasattr(input_audio_file, "blob"):
-            audio_bytes = input_audio_file.blob
-        elif hasattr(input_audio_file, "read") and callable(
-            getattr(input_audio_file, "read")
-        ):
-            audio_bytes = input_audio_file.read()
-            if isinstance(audio_bytes, str):
-                audio_bytes = audio_bytes.encode("utf-8")
-        elif isinstance(input_audio_file, bytes):
-            audio_bytes = input_audio_file
-        else:
-            raise ValueError(f"不支持的音频数据类型: {type(input_audio_file)}")
-
-        if not isinstance(audio_bytes, bytes):
-            raise ValueError("音频数据必须是字节格式")
-
-        if len(audio_bytes) > 15 * 1024 * 1024:
-            raise ValueError("输入音频大小超过15MB限制")
-
-        audio_ext = MultimodalReference2VideoTool._guess_audio_ext(input_audio_file)
-        audio_base64 = base64.b64encode(audio_bytes).decode("utf-8")
-        return f"data:audio/{audio_ext};base64,{audio_base64}"
-
-    @staticmethod
-    def _guess_audio_ext(input_audio_file: Any) -> str:
-        mime_type = str(getattr(input_audio_file, "mime_type", "") or "").lower()
-        filename = str(getattr(input_audio_file, "filename", "") or "").lower()
-
-        if "wav" in mime_type or filename.endswith(".wav"):
-            return "wav"
-
-        return "mp3"
+        audio_data, info = read_audio(input_audio_file)
+        return DataUrl(info.mime_type, audio_data), info.duration
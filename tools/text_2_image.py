@@ -9,6 +9,15 @@ import requests
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from utils.image_generation import (
+    ImageGenerationError,
+    build_text_to_image_payload,
+    parse_image_response,
+    post_image_generation,
+)
+from utils.image_stream import relay_image_stream
+from utils.queue_status import announce_queue, report_queue_wait, report_reuse
+
 logger = logging.getLogger(__name__)
 
 
@@ -27,12 +36,6 @@ class Text2ImageTool(Tool):
                 yield self.create_text_message(msg)
                 return
 
-            api_url = "https://ark.cn-beijing.volces.com/api/v3/images/generations"
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            }
-
             prompt = tool_parameters.get("prompt", "").strip()
             if not prompt:
                 msg = "❌ 请输入提示词"
@@ -46,6 +49,7 @@ class Text2ImageTool(Tool):
             )
             watermark = tool_parameters.get("watermark", "true") == "true"
             model = tool_parameters.get("model", "doubao-seedream-4-5-251128")
+            stream = tool_parameters.get("stream", "false") == "true"
 
             yield self.create_text_message("🚀 文生图任务启动中...")
             yield self.create_text_message(f"🤖 使用模型: {model}")
@@ -55,63 +59,54 @@ class Text2ImageTool(Tool):
             yield self.create_text_message(f"📐 图像尺寸: {size}")
             yield self.create_text_message("⏳ 正在连接火山方舟 API...")
 
-            payload = {
-                "model": model,
-                "prompt": prompt,
-                "size": size,
-                "sequential_image_generation": sequential_image_generation,
-                "stream": False,
-                "response_format": "url",
-                "watermark": watermark,
-            }
-
-            logger.info("Submitting request: %s", json.dumps(payload, ensure_ascii=False))
+            payload = build_text_to_image_payload(
+                prompt,
+                model,
+                size,
+                sequential_image_generation=sequential_image_generation,
+                watermark=watermark,
+                stream=stream,
+            )
+
             yield self.create_text_message("🎨 正在生成图像，请稍候...")
 
+            yield from announce_queue(self, api_key, "text_to_image")
             try:
-                response = requests.post(
-                    api_url,
-                    headers=headers,
-                    json=payload,
-                    timeout=60,
+                response = post_image_generation(
+                    api_key, payload, "text_to_image", stream=stream, dedupe=True
                 )
-            except requests.exceptions.Timeout:
-                msg = "❌ 请求超时，请稍后重试"
-                logger.error(msg)
-                yield self.create_text_message(msg)
-                return
-            except requests.exceptions.RequestException as e:
-                msg = f"❌ 请求失败: {str(e)}"
-                logger.error(msg)
-                yield self.create_text_message(msg)
+            except ImageGenerationError as e:
+                yield self.create_text_message(f"❌ {str(e)}")
                 return
 
-            if response.status_code != 200:
-                logger.error(
-                    "API status %s: %s", response.status_code, response.text[:300]
-                )
-                yield self.create_text_message(
-                    f"❌ API 响应状态码: {response.status_code}"
-                )
-                if response.text:
-                    yield self.create_text_message(
-                        f"🔧 响应内容: {response.text[:500]}"
-                    )
+            yield from report_queue_wait(self, response)
+            yield from report_reuse(self, response)
+
+            if stream:
+                try:
+                    with response:
+                        image_count = yield from relay_image_stream(self, response)
+                except requests.exceptions.RequestException as e:
+                    msg = f"❌ 流式响应中断: {str(e)}"
+                    logger.error(msg)
+                    yield self.create_text_message(msg)
+                    return
+
+                if not image_count:
+                    yield self.create_text_message("❌ API 响应中未返回图像数据")
+                    return
+
+                yield self.create_text_message("🎯 文生图任务完成！")
+                logger.info("Text-to-image task completed (stream)")
                 return
 
             try:
-                resp_data = response.json()
-            except json.JSONDecodeError as e:
-                logger.error(
-                    "Failed to parse JSON: %s - %s", str(e), response.text[:300]
-                )
-                yield self.create_text_message("❌ API 响应解析失败（非JSON）")
+                resp_data = parse_image_response(response)
+            except ImageGenerationError as e:
+                yield self.create_text_message(f"❌ {str(e)}")
                 return
 
-            data_list = resp_data.get("data", [])
-            if not data_list:
-                yield self.create_text_message("❌ API 响应中未返回图像数据")
-                return
+            data_list = resp_data["data"]
 
             yield self.create_text_message("🎉 图像生成成功！")
 
@@ -0,0 +1,204 @@
+# author: sawyer-shi
+
+import json
+import logging
+from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from utils.image_generation import (
+    ImageGenerationError,
+    build_text_to_image_payload,
+    generate_images,
+)
+from utils.queue_status import announce_queue
+from utils.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_SIZE = 50
+MAX_CONCURRENCY = 10
+
+
+class Text2ImageBatchTool(Tool):
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        """
+        Volcengine Ark Images Generations API batch text-to-image tool.
+        """
+        logger.info("Starting batch text-to-image task (Ark)")
+
+        try:
+            api_key = self.runtime.credentials.get("api_key")
+            if not api_key:
+                msg = "❌ API密钥未配置"
+                logger.error(msg)
+                yield self.create_text_message(msg)
+                return
+
+            default_size = tool_parameters.get("size", "2048x2048")
+            default_model = tool_parameters.get("model", "doubao-seedream-4-5-251128")
+            default_watermark = tool_parameters.get("watermark", "true") == "true"
+            max_concurrency = int(tool_parameters.get("max_concurrency", 4) or 4)
+            requests_per_minute = float(tool_parameters.get("requests_per_minute", 0) or 0)
+
+            try:
+                items = self._parse_items(tool_parameters.get("prompts", ""))
+            except ValueError as e:
+                msg = f"❌ {str(e)}"
+                logger.warning(msg)
+                yield self.create_text_message(msg)
+                return
+
+            if not items:
+                msg = "❌ 请输入至少一个提示词"
+                logger.warning(msg)
+                yield self.create_text_message(msg)
+                return
+
+            if len(items) > MAX_BATCH_SIZE:
+                yield self.create_text_message(f"❌ 单次最多支持 {MAX_BATCH_SIZE} 个提示词")
+                return
+
+            max_concurrency = max(1, min(MAX_CONCURRENCY, max_concurrency, len(items)))
+
+            payloads = []
+            for item in items:
+                payloads.append(
+                    build_text_to_image_payload(
+                        item["prompt"],
+                        item.get("model") or default_model,
+                        item.get("size") or default_size,
+                        watermark=item.get("watermark", default_watermark),
+                        seed=item.get("seed"),
+                    )
+                )
+
+            yield self.create_text_message("🚀 批量文生图任务启动中...")
+            yield self.create_text_message(f"📋 任务数量: {len(payloads)}")
+            yield self.create_text_message(f"⚙️ 并发数: {max_concurrency}")
+            if requests_per_minute > 0:
+                yield self.create_text_message(
+                    f"⏱️ 速率限制: 每分钟 {requests_per_minute:g} 次"
+                )
+            yield self.create_text_message("🎨 正在生成图像，请稍候...")
+            yield from announce_queue(self, api_key, "text_to_image")
+
+            # This batch's own pace. The per-key budget shared with every
+            # other call (ARK_RPM_IMAGES) is applied by the Ark client.
+            bucket = (
+                TokenBucket(requests_per_minute, burst=max_concurrency)
+                if requests_per_minute > 0
+                else None
+            )
+
+            def run(payload: dict[str, Any]) -> dict[str, Any]:
+                if bucket is not None:
+                    bucket.acquire()
+                return generate_images(api_key, payload, "text_to_image")
+
+            results: list[dict[str, Any]] = [{} for _ in payloads]
+            with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+                futures = {
+                    executor.submit(run, payload): index
+                    for index, payload in enumerate(payloads)
+                }
+                for future in as_completed(futures):
+                    index = futures[future]
+                    prompt = payloads[index]["prompt"]
+                    tag = f"[#{index + 1}]"
+                    try:
+                        resp_data = future.result()
+                    except ImageGenerationError as e:
+                        yield self.create_text_message(f"❌ {tag} 生成失败: {str(e)}")
+                        results[index] = {"index": index, "prompt": prompt, "error": str(e)}
+                        continue
+                    except Exception as e:
+                        logger.exception("Batch item %s failed", index)
+                        yield self.create_text_message(f"❌ {tag} 生成失败: {str(e)}")
+                        results[index] = {"index": index, "prompt": prompt, "error": str(e)}
+                        continue
+
+                    urls = []
+                    for data in resp_data.get("data", []):
+                        image_url = data.get("url")
+                        if image_url:
+                            urls.append(image_url)
+                            yield self.create_image_message(image_url)
+                    yield self.create_text_message(
+                        f"✅ {tag} 生成完成（{len(urls)} 张）: "
+                        f"{prompt[:30]}{'...' if len(prompt) > 30 else ''}"
+                    )
+                    results[index] = {
+                        "index": index,
+                        "prompt": prompt,
+                        "urls": urls,
+                        "usage": resp_data.get("usage"),
+                    }
+
+            succeeded = sum(1 for result in results if "error" not in result)
+            yield self.create_text_message(
+                f"🎯 批量文生图任务完成！成功 {succeeded}/{len(results)}"
+            )
+            yield self.create_json_message(
+                {
+                    "total": len(results),
+                    "succeeded": succeeded,
+                    "failed": len(results) - succeeded,
+                    "results": results,
+                }
+            )
+            logger.info("Batch text-to-image task completed")
+
+        except Exception as e:
+            error_msg = f"❌ 批量生成图像时出现未预期错误: {str(e)}"
+            logger.exception(error_msg)
+            yield self.create_text_message(error_msg)
+
+    @staticmethod
+    def _parse_items(raw_value: Any) -> list[dict[str, Any]]:
+        """
+        Accept a JSON array of prompts or parameter objects, or one prompt
+        per line.
+        """
+        if isinstance(raw_value, list):
+            entries = raw_value
+        else:
+            text = str(raw_value or "").strip()
+            if not text:
+                return []
+            if text.startswith("["):
+                try:
+                    entries = json.loads(text)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"提示词列表 JSON 解析失败: {str(e)}")
+            else:
+                entries = text.splitlines()
+
+        items = []
+        for i, entry in enumerate(entries):
+            if isinstance(entry, str):
+                entry = {"prompt": entry}
+            if not isinstance(entry, dict):
+                raise ValueError(f"第 {i + 1} 项格式无效")
+
+            prompt = str(entry.get("prompt", "")).strip()
+            if not prompt:
+                continue
+
+            item: dict[str, Any] = {"prompt": prompt}
+            for key in ("model", "size"):
+                if entry.get(key):
+                    item[key] = str(entry[key])
+            if "watermark" in entry:
+                item["watermark"] = entry["watermark"] in (True, "true")
+            if entry.get("seed") is not None:
+                try:
+                    item["seed"] = int(entry["seed"])
+                except (TypeError, ValueError):
+                    raise ValueError(f"第 {i + 1} 项的 seed 无效")
+            items.append(item)
+
+        return items
@@ -9,6 +9,12 @@ import requests
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from utils.ark_client import CONTENTS_GENERATIONS_TASKS_URL, ark_client
+from utils.payload_log import RedactedPayload
+from utils.queue_status import announce_queue, report_queue_wait, report_reuse
+from utils.task_registry import task_registry
+from utils.video_tasks import parse_wait_parameters, report_task_result, wait_for_task
+
 logger = logging.getLogger(__name__)
 
 SEEDANCE_2_MODELS = {
@@ -45,12 +51,6 @@ class Text2VideoTool(Tool):
                 yield self.create_text_message(msg)
                 return
 
-            api_url = "https://ark.cn-beijing.volces.com/api/v3/contents/generations/tasks"
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            }
-
             prompt = tool_parameters.get("prompt", "").strip()
             if not prompt:
                 msg = "❌ 请输入提示词"
@@ -70,6 +70,7 @@ class Text2VideoTool(Tool):
             draft = tool_parameters.get("draft", "false") == "true"
             return_last_frame = tool_parameters.get("return_last_frame", "false") == "true"
             service_tier = tool_parameters.get("service_tier", "default")
+            wait_for_completion, max_wait_seconds = parse_wait_parameters(tool_parameters)
 
             if len(prompt) > 500:
                 prompt = prompt[:500]
@@ -140,15 +141,17 @@ class Text2VideoTool(Tool):
                 payload["camera_fixed"] = camera_fixed
                 payload["service_tier"] = service_tier
 
-            logger.info("Submitting request: %s", json.dumps(payload, ensure_ascii=False))
+            logger.info("Submitting request: %s", RedactedPayload(payload))
             yield self.create_text_message("🎬 正在生成视频，请稍候...")
 
+            yield from announce_queue(self, api_key, "task_submit")
             try:
-                response = requests.post(
-                    api_url,
-                    headers=headers,
-                    json=payload,
-                    timeout=60,
+                response = ark_client.post(
+                    CONTENTS_GENERATIONS_TASKS_URL,
+                    api_key,
+                    payload,
+                    "task_submit",
+                    dedupe=True,
                 )
             except requests.exceptions.Timeout:
                 msg = "❌ 请求超时，请稍后重试"
@@ -161,6 +164,9 @@ class Text2VideoTool(Tool):
                 yield self.create_text_message(msg)
                 return
 
+            yield from report_queue_wait(self, response)
+            yield from report_reuse(self, response)
+
             if response.status_code != 200:
                 logger.error(
                     "API status %s: %s", response.status_code, response.text[:300]
@@ -188,6 +194,11 @@ class Text2VideoTool(Tool):
                 yield self.create_text_message("❌ API 响应中未返回任务ID")
                 return
 
+            task_registry.record_submission(
+                api_key, task_id, "text_2_video", model, tool_parameters
+            )
+            task_registry.save(self.session, api_key)
+
             yield self.create_text_message(f"📋 视频生成任务已提交，任务ID: {task_id}")
             yield self.create_text_message("✅ 任务提交成功，可用任务ID查询状态")
 
@@ -206,6 +217,16 @@ class Text2VideoTool(Tool):
 
             yield self.create_text_message("🎯 文生视频任务提交完成！")
 
+            if wait_for_completion:
+                final_data = yield from wait_for_task(
+                    self, api_key, task_id, max_wait_seconds
+                )
+                if final_data is not None:
+                    task_registry.observe(api_key, final_data)
+                    task_registry.save(self.session, api_key)
+                    yield from report_task_result(self, final_data)
+                    return
+
             result_json = {
                 "task_id": task_id,
                 "status": "submitted",
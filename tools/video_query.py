@@ -2,15 +2,41 @@
 
 import json
 import logging
+import re
+import time
+from collections import Counter
 from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Any
 
 import requests
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from utils.ark_client import CONTENTS_GENERATIONS_TASKS_URL, ark_client
+from utils.blob_stream import remove_quietly, stream_file_blob
+from utils.queue_status import announce_queue, report_queue_wait
+from utils.task_registry import task_registry
+from utils.video_cache import video_cache
+from utils.video_download import VideoTooLargeError, fetch_video_file, stream_video_blob
+from utils.video_tasks import (
+    POLL_INITIAL_INTERVAL,
+    TERMINAL_STATUSES,
+    build_task_result,
+    jittered_interval,
+    next_poll_interval,
+    parse_wait_parameters,
+    wait_for_task,
+)
+
 logger = logging.getLogger(__name__)
 
+MAX_BATCH_TASK_IDS = 100
+DEFAULT_MAX_CONCURRENCY = 4
+MAX_MAX_CONCURRENCY = 10
+
+_TASK_ID_SEPARATOR_RE = re.compile(r"[\s,;，；]+")
+
 
 class VideoQueryTool(Tool):
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
@@ -27,62 +53,97 @@ class VideoQueryTool(Tool):
                 yield self.create_text_message(msg)
                 return
 
-            task_id = tool_parameters.get("task_id", "").strip()
-            if not task_id:
+            task_ids = self._parse_task_ids(tool_parameters.get("task_id", ""))
+            if not task_ids:
                 msg = "❌ 请输入任务ID"
                 logger.warning(msg)
                 yield self.create_text_message(msg)
                 return
+            if len(task_ids) > MAX_BATCH_TASK_IDS:
+                msg = f"❌ 一次最多查询 {MAX_BATCH_TASK_IDS} 个任务，当前为 {len(task_ids)} 个"
+                logger.warning(msg)
+                yield self.create_text_message(msg)
+                return
 
             download_video = tool_parameters.get("download_video", "true") == "true"
+            wait_for_completion, max_wait_seconds = parse_wait_parameters(tool_parameters)
 
-            api_url = (
-                "https://ark.cn-beijing.volces.com/api/v3/contents/generations/tasks/"
-                f"{task_id}"
-            )
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            }
+            if len(task_ids) > 1:
+                yield from self._query_many(
+                    api_key,
+                    task_ids,
+                    download_video,
+                    wait_for_completion,
+                    max_wait_seconds,
+                    self._parse_max_concurrency(tool_parameters),
+                )
+                return
+
+            task_id = task_ids[0]
+
+            api_url = f"{CONTENTS_GENERATIONS_TASKS_URL}/{task_id}"
 
             yield self.create_text_message("🔍 正在查询视频生成结果...")
             yield self.create_text_message(f"📋 任务ID: {task_id}")
-            yield self.create_text_message("⏳ 正在连接火山方舟 API...")
-
-            try:
-                response = requests.get(api_url, headers=headers, timeout=60)
-            except requests.exceptions.Timeout:
-                msg = "❌ 请求超时，请稍后重试"
-                logger.error(msg)
-                yield self.create_text_message(msg)
-                return
-            except requests.exceptions.RequestException as e:
-                msg = f"❌ 请求失败: {str(e)}"
-                logger.error(msg)
-                yield self.create_text_message(msg)
-                return
 
-            if response.status_code != 200:
-                logger.error(
-                    "API status %s: %s", response.status_code, response.text[:300]
-                )
+            task_registry.load(self.session, api_key)
+            cached = task_registry.lookup(api_key, task_id)
+            if cached is not None:
+                resp_data, age = cached
                 yield self.create_text_message(
-                    f"❌ API 响应状态码: {response.status_code}"
+                    f"⚡ 已从任务记录获取状态（{int(age)} 秒前更新）"
                 )
-                if response.text:
+            else:
+                yield self.create_text_message("⏳ 正在连接火山方舟 API...")
+
+                yield from announce_queue(self, api_key, "task_query")
+                try:
+                    response = ark_client.get(api_url, api_key, "task_query")
+                except requests.exceptions.Timeout:
+                    msg = "❌ 请求超时，请稍后重试"
+                    logger.error(msg)
+                    yield self.create_text_message(msg)
+                    return
+                except requests.exceptions.RequestException as e:
+                    msg = f"❌ 请求失败: {str(e)}"
+                    logger.error(msg)
+                    yield self.create_text_message(msg)
+                    return
+
+                yield from report_queue_wait(self, response)
+
+                if response.status_code != 200:
+                    logger.error(
+                        "API status %s: %s", response.status_code, response.text[:300]
+                    )
                     yield self.create_text_message(
-                        f"🔧 响应内容: {response.text[:500]}"
+                        f"❌ API 响应状态码: {response.status_code}"
                     )
-                return
+                    if response.text:
+                        yield self.create_text_message(
+                            f"🔧 响应内容: {response.text[:500]}"
+                        )
+                    return
 
-            try:
-                resp_data = response.json()
-            except json.JSONDecodeError as e:
-                logger.error(
-                    "Failed to parse JSON: %s - %s", str(e), response.text[:300]
+                try:
+                    resp_data = response.json()
+                except json.JSONDecodeError as e:
+                    logger.error(
+                        "Failed to parse JSON: %s - %s", str(e), response.text[:300]
+                    )
+                    yield self.create_text_message("❌ API 响应解析失败（非JSON）")
+                    return
+
+                task_registry.observe(api_key, resp_data)
+
+            if wait_for_completion and resp_data.get("status") not in TERMINAL_STATUSES:
+                final_data = yield from wait_for_task(
+                    self, api_key, task_id, max_wait_seconds, initial_data=resp_data
                 )
-                yield self.create_text_message("❌ API 响应解析失败（非JSON）")
-                return
+                if final_data is not None:
+                    resp_data = final_data
+                    task_registry.observe(api_key, resp_data)
+            task_registry.save(self.session, api_key)
 
             task_id_result = resp_data.get("id")
             status = resp_data.get("status")
@@ -96,41 +157,29 @@ class VideoQueryTool(Tool):
             if video_url:
                 yield self.create_text_message(f"🎬 视频链接: {video_url}")
                 if download_video:
-                    yield self.create_text_message("⬇️ 正在下载视频文件...")
+                    if video_cache.get(task_id_result) is not None:
+                        yield self.create_text_message("⚡ 正在发送已缓存的视频文件...")
+                    else:
+                        yield self.create_text_message("⬇️ 正在下载视频文件...")
                     try:
-                        video_response = requests.get(video_url, timeout=120)
-                        if video_response.status_code == 200:
-                            yield self.create_blob_message(
-                                blob=video_response.content,
-                                meta={"mime_type": "video/mp4", "filename": f"{task_id_result}.mp4"},
-                            )
-                            yield self.create_text_message("✅ 视频下载完成")
-                        else:
-                            yield self.create_text_message(
-                                f"❌ 视频下载失败，状态码: {video_response.status_code}"
-                            )
+                        video_size = yield from stream_video_blob(
+                            self, video_url, f"{task_id_result}.mp4", task_id=task_id_result
+                        )
+                        yield self.create_text_message(
+                            f"✅ 视频下载完成（{video_size / 1024 / 1024:.2f} MB）"
+                        )
+                    except VideoTooLargeError as e:
+                        yield self.create_text_message(f"⚠️ {str(e)}，请使用视频链接下载")
+                    except requests.exceptions.HTTPError as e:
+                        yield self.create_text_message(
+                            f"❌ 视频下载失败，状态码: {e.response.status_code}"
+                        )
                     except requests.exceptions.RequestException as e:
                         yield self.create_text_message(f"❌ 视频下载失败: {str(e)}")
             if last_frame_url:
                 yield self.create_text_message(f"🖼️ 尾帧链接: {last_frame_url}")
 
-            result_json = {
-                "task_id": task_id_result,
-                "status": status,
-                "video_url": video_url,
-                "last_frame_url": last_frame_url,
-                "model": resp_data.get("model"),
-                "error": resp_data.get("error"),
-                "seed": resp_data.get("seed"),
-                "resolution": resp_data.get("resolution"),
-                "ratio": resp_data.get("ratio"),
-                "duration": resp_data.get("duration"),
-                "frames": resp_data.get("frames"),
-                "frames_per_second": resp_data.get("framespersecond"),
-                "usage": resp_data.get("usage"),
-                "created_at": resp_data.get("created_at"),
-                "updated_at": resp_data.get("updated_at"),
-            }
+            result_json = build_task_result(resp_data)
             yield self.create_json_message(result_json)
 
             logger.info("Video query completed")
@@ -139,3 +188,212 @@ class VideoQueryTool(Tool):
             error_msg = f"❌ 查询视频结果时出现未预期错误: {str(e)}"
             logger.exception(error_msg)
             yield self.create_text_message(error_msg)
+
+    @staticmethod
+    def _parse_task_ids(raw: Any) -> list[str]:
+        """
+        Accept a single id, a JSON array of ids, or ids separated by commas,
+        semicolons or whitespace. Duplicates are dropped, order is kept.
+        """
+        if isinstance(raw, list):
+            candidates = raw
+        else:
+            text = str(raw or "").strip()
+            candidates = None
+            if text.startswith("["):
+                try:
+                    parsed = json.loads(text)
+                except json.JSONDecodeError:
+                    parsed = None
+                if isinstance(parsed, list):
+                    candidates = parsed
+            if candidates is None:
+                candidates = _TASK_ID_SEPARATOR_RE.split(text)
+        task_ids = []
+        for candidate in candidates:
+            task_id = str(candidate).strip()
+            if task_id and task_id not in task_ids:
+                task_ids.append(task_id)
+        return task_ids
+
+    @staticmethod
+    def _parse_max_concurrency(tool_parameters: dict[str, Any]) -> int:
+        try:
+            value = int(tool_parameters.get("max_concurrency") or DEFAULT_MAX_CONCURRENCY)
+        except (TypeError, ValueError):
+            value = DEFAULT_MAX_CONCURRENCY
+        return max(1, min(MAX_MAX_CONCURRENCY, value))
+
+    def _query_many(
+        self,
+        api_key: str,
+        task_ids: list[str],
+        download_video: bool,
+        wait_for_completion: bool,
+        max_wait_seconds: int,
+        max_concurrency: int,
+    ) -> Generator[ToolInvokeMessage]:
+        """
+        Query several tasks in one invocation: list queries for the bulk,
+        parallel single-task queries for the rest, then optionally download
+        the finished videos in parallel and stream them one by one.
+        """
+        total = len(task_ids)
+        yield self.create_text_message(f"🔍 正在批量查询 {total} 个视频任务...")
+
+        task_registry.load(self.session, api_key)
+        yield from announce_queue(self, api_key, "task_query")
+        found, errors = task_registry.query_many(api_key, task_ids, max_concurrency)
+
+        if wait_for_completion:
+            yield self.create_text_message(
+                f"⏳ 正在等待任务完成（最长 {max_wait_seconds} 秒）..."
+            )
+            started = time.monotonic()
+            deadline = started + max_wait_seconds
+            interval = POLL_INITIAL_INTERVAL
+            while True:
+                pending = [
+                    task_id
+                    for task_id in task_ids
+                    if task_id in found and found[task_id].get("status") not in TERMINAL_STATUSES
+                ]
+                if not pending:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    yield self.create_text_message(
+                        f"⌛ 等待超时（{max_wait_seconds} 秒），{len(pending)} 个任务仍在处理中"
+                    )
+                    break
+                time.sleep(min(jittered_interval(interval), remaining))
+                before = {task_id: found[task_id].get("status") for task_id in pending}
+                polled, _ = task_registry.query_many(
+                    api_key, pending, max_concurrency, use_registry=False
+                )
+                found.update(polled)
+                changed = any(
+                    polled.get(task_id, {}).get("status") != status
+                    for task_id, status in before.items()
+                    if task_id in polled
+                )
+                if changed:
+                    interval = POLL_INITIAL_INTERVAL
+                else:
+                    interval = next_poll_interval(interval)
+                finished = sum(
+                    1 for data in found.values() if data.get("status") in TERMINAL_STATUSES
+                )
+                elapsed = int(time.monotonic() - started)
+                yield self.create_text_message(
+                    f"🔄 已结束 {finished}/{len(found)}（已等待 {elapsed} 秒）"
+                )
+
+        yield self.create_text_message(f"✅ 查询完成，成功 {len(found)} 个，失败 {len(errors)} 个")
+        for task_id in task_ids:
+            if task_id in found:
+                yield self.create_text_message(
+                    f"📋 {task_id}: {found[task_id].get('status')}"
+                )
+            else:
+                yield self.create_text_message(
+                    f"❌ {task_id}: {errors.get(task_id, '未返回任务数据')}"
+                )
+
+        downloaded: set[str] = set()
+        download_errors: dict[str, str] = {}
+        if download_video:
+            ready = {
+                task_id: data["content"]["video_url"]
+                for task_id, data in found.items()
+                if data.get("status") == "succeeded"
+                and (data.get("content") or {}).get("video_url")
+            }
+            if ready:
+                yield self.create_text_message(f"⬇️ 正在下载 {len(ready)} 个视频文件...")
+                yield from self._download_videos(
+                    ready, max_concurrency, downloaded, download_errors
+                )
+
+        task_registry.save(self.session, api_key)
+
+        records = []
+        for task_id in task_ids:
+            if task_id in found:
+                record = build_task_result(found[task_id])
+                record["downloaded"] = task_id in downloaded
+                if task_id in download_errors:
+                    record["download_error"] = download_errors[task_id]
+            else:
+                record = {
+                    "task_id": task_id,
+                    "status": None,
+                    "error": errors.get(task_id, "未返回任务数据"),
+                }
+            records.append(record)
+        status_counts = Counter(record["status"] or "error" for record in records)
+        yield self.create_json_message(
+            {"total": total, "status_counts": dict(status_counts), "tasks": records}
+        )
+        logger.info("Batch video query completed: %d tasks", total)
+
+    def _download_videos(
+        self,
+        video_urls: dict[str, str],
+        max_concurrency: int,
+        downloaded: set[str],
+        download_errors: dict[str, str],
+    ) -> Generator[ToolInvokeMessage]:
+        """
+        Download in parallel and stream each video as soon as it is ready. A
+        failure only affects its own task and is recorded in
+        ``download_errors``; temporary files are removed even if the stream
+        is abandoned halfway.
+        """
+        workers = max(1, min(max_concurrency, len(video_urls)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(fetch_video_file, video_url, task_id): task_id
+                for task_id, video_url in video_urls.items()
+            }
+            unclaimed = set(futures)
+            try:
+                for future in as_completed(futures):
+                    unclaimed.discard(future)
+                    task_id = futures[future]
+                    try:
+                        path, temporary = future.result()
+                    except VideoTooLargeError as e:
+                        download_errors[task_id] = str(e)
+                        yield self.create_text_message(
+                            f"⚠️ {task_id}: {str(e)}，请使用视频链接下载"
+                        )
+                        continue
+                    except (requests.exceptions.RequestException, OSError) as e:
+                        download_errors[task_id] = str(e)
+                        yield self.create_text_message(f"❌ {task_id} 视频下载失败: {str(e)}")
+                        continue
+                    try:
+                        size = yield from stream_file_blob(
+                            self, path, "video/mp4", f"{task_id}.mp4"
+                        )
+                        downloaded.add(task_id)
+                        yield self.create_text_message(
+                            f"✅ {task_id} 视频下载完成（{size / 1024 / 1024:.2f} MB）"
+                        )
+                    except OSError as e:
+                        download_errors[task_id] = str(e)
+                        yield self.create_text_message(f"❌ {task_id} 视频读取失败: {str(e)}")
+                    finally:
+                        if temporary:
+                            remove_quietly(path)
+            finally:
+                for future in unclaimed:
+                    future.cancel()
+                executor.shutdown(wait=True)
+                for future in unclaimed:
+                    if future.cancelled() or future.exception() is not None:
+                        continue
+                    path, temporary = future.result()
+                    if temporary:
+                        remove_quietly(path)
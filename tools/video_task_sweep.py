@@ -0,0 +1,205 @@
+# author: sawyer-shi
+
+import logging
+from collections import Counter
+from collections.abc import Generator
+from typing import Any
+
+import requests
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from utils.queue_status import announce_queue
+from utils.task_registry import task_registry
+from utils.video_tasks import (
+    MAX_LIST_PAGE_SIZE,
+    TERMINAL_STATUSES,
+    VideoTaskError,
+    build_task_result,
+    list_tasks,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_MAX_PAGES = 10
+MAX_MAX_PAGES = 50
+
+SOURCE_ARK = "ark"
+SOURCE_RECORDED = "recorded"
+TASK_STATUSES = {"queued", "running", "succeeded", "failed", "cancelled", "expired"}
+
+
+def _bounded_int(value: Any, default: int, low: int, high: int) -> int:
+    try:
+        number = int(value if value not in (None, "") else default)
+    except (TypeError, ValueError):
+        number = default
+    return max(low, min(high, number))
+
+
+class VideoTaskSweepTool(Tool):
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage]:
+        """
+        Volcengine Ark Contents Generations API bulk task status sweep.
+        """
+        logger.info("Starting video task sweep (Ark)")
+
+        try:
+            api_key = self.runtime.credentials.get("api_key")
+            if not api_key:
+                msg = "❌ API密钥未配置"
+                logger.error(msg)
+                yield self.create_text_message(msg)
+                return
+
+            source = tool_parameters.get("source") or SOURCE_ARK
+            status = (tool_parameters.get("status") or "").strip()
+            if status == "all":
+                status = ""
+            if status and status not in TASK_STATUSES:
+                msg = f"❌ 不支持的任务状态: {status}"
+                logger.warning(msg)
+                yield self.create_text_message(msg)
+                return
+            model = (tool_parameters.get("model") or "").strip()
+            page_size = _bounded_int(
+                tool_parameters.get("page_size"), DEFAULT_PAGE_SIZE, 1, MAX_LIST_PAGE_SIZE
+            )
+            max_pages = _bounded_int(
+                tool_parameters.get("max_pages"), DEFAULT_MAX_PAGES, 1, MAX_MAX_PAGES
+            )
+
+            task_registry.load(self.session, api_key)
+
+            if source == SOURCE_RECORDED:
+                task_ids = task_registry.pending_task_ids(api_key)
+                if not task_ids:
+                    yield self.create_text_message("✅ 没有未结束的已记录任务")
+                    yield self.create_json_message(
+                        {"source": source, "pages": 0, "total": 0, "fetched": 0, "status_counts": {}}
+                    )
+                    return
+                yield self.create_text_message(
+                    f"🔍 正在刷新 {len(task_ids)} 个未结束的已记录任务..."
+                )
+            else:
+                task_ids = None
+                filters = [f"状态={status}" if status else "", f"模型={model}" if model else ""]
+                filter_text = "，".join(item for item in filters if item) or "无"
+                yield self.create_text_message(
+                    f"🔍 正在分页查询任务列表（筛选: {filter_text}，每页 {page_size} 个）..."
+                )
+
+            yield from announce_queue(self, api_key, "task_query")
+            summary = yield from self._sweep(
+                api_key, source, status, model, page_size, max_pages, task_ids
+            )
+            task_registry.save(self.session, api_key)
+
+            counts_text = "，".join(
+                f"{name}: {count}" for name, count in summary["status_counts"].items()
+            )
+            yield self.create_text_message(
+                f"✅ 扫描完成，共 {summary['pages']} 页，获取 {summary['fetched']} 个任务"
+                + (f"（{counts_text}）" if counts_text else "")
+            )
+            yield self.create_json_message(summary)
+
+            logger.info(
+                "Video task sweep completed: %d pages, %d tasks",
+                summary["pages"],
+                summary["fetched"],
+            )
+
+        except Exception as e:
+            error_msg = f"❌ 扫描任务状态时出现未预期错误: {str(e)}"
+            logger.exception(error_msg)
+            yield self.create_text_message(error_msg)
+
+    def _sweep(
+        self,
+        api_key: str,
+        source: str,
+        status: str,
+        model: str,
+        page_size: int,
+        max_pages: int,
+        task_ids: list[str] | None,
+    ) -> Generator[ToolInvokeMessage, None, dict[str, Any]]:
+        """
+        Fetch pages one by one and stream each as soon as it arrives. The
+        status and model filters apply to the Ark task list only. Every
+        task seen updates the task registry; unknown tasks are only adopted
+        while they are still pending.
+        """
+        status_counts: Counter[str] = Counter()
+        seen: set[str] = set()
+        pages = 0
+        total = len(task_ids) if task_ids is not None else 0
+
+        if task_ids is not None:
+            # Recorded tasks are looked up by id, always all of them.
+            max_pages = -(-len(task_ids) // page_size)
+        for page_num in range(1, max_pages + 1):
+            if task_ids is not None:
+                batch = task_ids[(page_num - 1) * page_size:page_num * page_size]
+                query = {"page_size": len(batch), "task_ids": batch}
+            else:
+                query = {
+                    "page_num": page_num,
+                    "page_size": page_size,
+                    "status": status or None,
+                    "model": model or None,
+                }
+            try:
+                items, page_total = list_tasks(api_key, **query)
+            except (requests.exceptions.RequestException, VideoTaskError) as e:
+                logger.warning("Listing video tasks page %d failed: %s", page_num, str(e))
+                yield self.create_text_message(f"❌ 第 {page_num} 页查询失败: {str(e)}")
+                break
+            pages += 1
+            if task_ids is None:
+                total = page_total
+
+            records = []
+            for data in items:
+                task_id = data.get("id")
+                # Statuses change while paging, so a task can move onto a
+                # later page; report it once.
+                if not task_id or task_id in seen:
+                    continue
+                seen.add(task_id)
+                task_registry.observe(
+                    api_key, data, adopt=data.get("status") not in TERMINAL_STATUSES
+                )
+                record = build_task_result(data)
+                records.append(record)
+                status_counts[record["status"] or "unknown"] += 1
+
+            yield self.create_text_message(
+                f"📄 第 {page_num} 页: {len(records)} 个任务（已获取 {len(seen)}/{total}）"
+            )
+            yield self.create_json_message(
+                {"page_num": page_num, "total": total, "tasks": records}
+            )
+
+            if task_ids is None and (len(items) < page_size or page_num * page_size >= total):
+                break
+        else:
+            if task_ids is None and len(seen) < total:
+                yield self.create_text_message(
+                    f"⚠️ 已达到最大页数 {max_pages}，还有任务未获取，可增大页大小或最大页数"
+                )
+
+        summary: dict[str, Any] = {
+            "source": source,
+            "pages": pages,
+            "total": total,
+            "fetched": len(seen),
+            "status_counts": dict(status_counts),
+        }
+        if task_ids is not None:
+            missing = [task_id for task_id in task_ids if task_id not in seen]
+            summary["missing_task_ids"] = missing
+        return summary
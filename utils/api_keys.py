@@ -0,0 +1,13 @@
+# author: sawyer-shi
+
+import hashlib
+
+
+def api_key_id(api_key: str) -> str:
+    """
+    Short, stable fingerprint of an API key, used wherever per-key state is
+    kept (rate limits, task and asset registries, credential results) so the
+    key itself is never stored. Persisted storage keys are derived from it,
+    so its form must not change.
+    """
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
@@ -0,0 +1,245 @@
+# author: sawyer-shi
+
+import logging
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.env import env_float, env_int, env_str
+from utils.dedup import DEDUP_ENABLED, has_fixed_seed, payload_key, request_deduplicator
+from utils.rate_limit import get_limiter
+from utils.request_body import JsonBody
+from utils.resilience import (
+    CREATE_RETRY_STATUSES,
+    DEGRADED_STATUSES,
+    IDEMPOTENT_RETRY_STATUSES,
+    RETRY_AFTER_MAX,
+    RETRY_MAX_ATTEMPTS,
+    backoff_delay,
+    get_breaker,
+    is_degraded_error,
+    is_retryable_error,
+    retry_after_seconds,
+)
+
+logger = logging.getLogger(__name__)
+
+ARK_BASE_URL = env_str(
+    "ARK_BASE_URL", "https://ark.cn-beijing.volces.com/api/v3"
+).rstrip("/")
+IMAGES_GENERATIONS_URL = f"{ARK_BASE_URL}/images/generations"
+CONTENTS_GENERATIONS_TASKS_URL = f"{ARK_BASE_URL}/contents/generations/tasks"
+CHAT_COMPLETIONS_URL = f"{ARK_BASE_URL}/chat/completions"
+
+POOL_CONNECTIONS = env_int("ARK_POOL_CONNECTIONS", 4)
+POOL_MAXSIZE = env_int("ARK_POOL_MAXSIZE", 128)
+CONNECT_TIMEOUT = env_float("ARK_CONNECT_TIMEOUT", 10)
+
+# Read timeouts (seconds) per endpoint profile. Each can be overridden with
+# ARK_TIMEOUT_<PROFILE>, e.g. ARK_TIMEOUT_TASK_QUERY=30.
+READ_TIMEOUTS: dict[str, float] = {
+    "text_to_image": env_float("ARK_TIMEOUT_TEXT_TO_IMAGE", 60),
+    "image_edit": env_float("ARK_TIMEOUT_IMAGE_EDIT", 360),
+    "task_submit": env_float("ARK_TIMEOUT_TASK_SUBMIT", 60),
+    "task_query": env_float("ARK_TIMEOUT_TASK_QUERY", 60),
+    "video_download": env_float("ARK_TIMEOUT_VIDEO_DOWNLOAD", 120),
+    "image_download": env_float("ARK_TIMEOUT_IMAGE_DOWNLOAD", 60),
+    "audio_download": env_float("ARK_TIMEOUT_AUDIO_DOWNLOAD", 60),
+    "credential_check": env_float("ARK_TIMEOUT_CREDENTIAL_CHECK", 10),
+    "asset_upload": env_float("ARK_TIMEOUT_ASSET_UPLOAD", 120),
+}
+
+
+class ArkClient:
+    """
+    Process-wide HTTP client for the Volcengine Ark API.
+
+    All tools share one pooled ``requests.Session`` so repeated calls reuse
+    keep-alive connections instead of paying DNS, TCP and TLS setup each time.
+
+    Every call goes through :meth:`request`, which retries transient
+    failures with jittered exponential backoff and honours ``Retry-After``.
+    Reads are retried on any transient failure. POSTs create tasks or
+    images, so they are only retried when Ark cannot have acted on them.
+    Each endpoint profile has a circuit breaker, so while Ark is degraded
+    calls fail at once instead of each waiting out its timeout. Calls made
+    with an API key also queue for that key's per-endpoint rate and
+    concurrency budget (:mod:`utils.rate_limit`).
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = POOL_CONNECTIONS,
+        pool_maxsize: int = POOL_MAXSIZE,
+    ) -> None:
+        self._pool_connections = pool_connections
+        self._pool_maxsize = pool_maxsize
+        self._session: requests.Session | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._build_session()
+        return self._session
+
+    def _build_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self._pool_connections,
+            pool_maxsize=self._pool_maxsize,
+            max_retries=0,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({"Connection": "keep-alive"})
+        logger.info(
+            "Ark HTTP session created (pool_connections=%s, pool_maxsize=%s)",
+            self._pool_connections,
+            self._pool_maxsize,
+        )
+        return session
+
+    @staticmethod
+    def headers(api_key: str) -> dict[str, str]:
+        return {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        }
+
+    @staticmethod
+    def timeout(profile: str) -> tuple[float, float]:
+        return CONNECT_TIMEOUT, READ_TIMEOUTS[profile]
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        profile: str,
+        api_key: str | None = None,
+        **kwargs: Any,
+    ) -> requests.Response:
+        """
+        Send a request with the retry, circuit-breaker and rate-limit policy
+        applied.
+
+        Returns the last response, which may still be an error status once
+        retries are used up. ``response.queue_wait`` holds the seconds spent
+        waiting for the rate limiter, across all attempts. A streamed
+        response gives its slot back once the headers have arrived.
+
+        :raises requests.exceptions.RequestException: on a network error
+            that is not retried, or :class:`utils.resilience.CircuitOpenError`
+            while the profile's circuit is open.
+        """
+        idempotent = method.upper() == "GET"
+        retry_statuses = IDEMPOTENT_RETRY_STATUSES if idempotent else CREATE_RETRY_STATUSES
+        breaker = get_breaker(profile)
+        limiter = get_limiter(api_key, profile) if api_key else None
+        if api_key:
+            kwargs.setdefault("headers", self.headers(api_key))
+        kwargs.setdefault("timeout", self.timeout(profile))
+
+        attempt = 1
+        queue_wait = 0.0
+        while True:
+            trial = breaker.before_call()
+            try:
+                with limiter.slot() if limiter is not None else nullcontext(0.0) as waited:
+                    queue_wait += waited
+                    response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                breaker.record(not is_degraded_error(e), trial)
+                if attempt >= RETRY_MAX_ATTEMPTS or not is_retryable_error(e, idempotent):
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(
+                    "%s %s failed (%s), retry %d in %.1fs",
+                    method, profile, type(e).__name__, attempt, delay,
+                )
+            except Exception:
+                # Never leave a half-open circuit waiting on a lost trial.
+                breaker.record(False, trial)
+                raise
+            else:
+                status = response.status_code
+                if status != 429:
+                    breaker.record(status not in DEGRADED_STATUSES, trial)
+                elif trial:
+                    breaker.record(True, trial)
+                if attempt >= RETRY_MAX_ATTEMPTS or status not in retry_statuses:
+                    response.queue_wait = queue_wait
+                    return response
+                delay = retry_after_seconds(response)
+                if delay is None:
+                    delay = backoff_delay(attempt)
+                elif delay > RETRY_AFTER_MAX:
+                    response.queue_wait = queue_wait
+                    return response
+                response.close()
+                logger.warning(
+                    "%s %s returned %s, retry %d in %.1fs",
+                    method, profile, status, attempt, delay,
+                )
+            time.sleep(delay)
+            attempt += 1
+
+    def post(
+        self,
+        url: str,
+        api_key: str,
+        payload: dict[str, Any],
+        profile: str,
+        stream: bool = False,
+        dedupe: bool = False,
+    ) -> requests.Response:
+        """
+        POST a JSON payload. With ``dedupe`` and ``ARK_DEDUP_ENABLED``, an
+        identical call already in flight is joined instead of sent again,
+        see :mod:`utils.dedup`. Streamed calls are never deduplicated.
+        """
+        def send() -> requests.Response:
+            return self.request(
+                "POST", url, profile, api_key, data=JsonBody(payload), stream=stream
+            )
+
+        if not dedupe or stream or not DEDUP_ENABLED:
+            return send()
+        return request_deduplicator.run(
+            payload_key(api_key, url, payload), send, cacheable=has_fixed_seed(payload)
+        )
+
+    def get(
+        self,
+        url: str,
+        api_key: str,
+        profile: str,
+        params: dict[str, Any] | None = None,
+    ) -> requests.Response:
+        return self.request("GET", url, profile, api_key, params=params)
+
+    def download(
+        self,
+        url: str,
+        profile: str = "video_download",
+        stream: bool = False,
+    ) -> requests.Response:
+        """
+        Fetch a pre-signed result URL (no Ark credentials attached).
+        """
+        return self.request("GET", url, profile, stream=stream)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+ark_client = ArkClient()
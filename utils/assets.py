@@ -0,0 +1,379 @@
+# author: sawyer-shi
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any
+
+import requests
+
+from utils.api_keys import api_key_id
+from utils.ark_client import ark_client
+from utils.env import env_float, env_int, env_str
+from utils.request_body import DataUrl
+
+logger = logging.getLogger(__name__)
+
+# Ark's API-key endpoints have no call that creates ``asset://`` handles, so
+# uploads go to a service the operator runs in front of their object storage
+# or Ark asset library. It authenticates with its own token; the tenant's
+# Ark API key is never sent to it. Contract (see README, "Reference Media
+# Reuse"):
+#
+#   POST <ARK_ASSET_UPLOAD_URL>
+#   Authorization: Bearer <ARK_ASSET_UPLOAD_TOKEN>
+#   multipart/form-data, one field ``file`` (filename, MIME type, bytes)
+#
+#   200/201 {"url": "https://..."}  a URL Ark can fetch for ARK_ASSET_TTL_HOURS
+#        or {"id": "..."}           an asset id, sent to Ark as ``asset://<id>``
+#
+# Both settings are required; reuse is disabled otherwise.
+ASSET_UPLOAD_URL = env_str("ARK_ASSET_UPLOAD_URL", "")
+ASSET_UPLOAD_TOKEN = env_str("ARK_ASSET_UPLOAD_TOKEN", "")
+# Media smaller than this is cheaper to send inline than to upload.
+ASSET_MIN_BYTES = env_int("ARK_ASSET_MIN_KB", 256) * 1024
+ASSET_TTL = env_float("ARK_ASSET_TTL_HOURS", 24) * 3600
+ASSET_MAX_ENTRIES = env_int("ARK_ASSET_MAX_ENTRIES", 500)
+ASSET_UPLOAD_CONCURRENCY = max(1, env_int("ARK_ASSET_UPLOAD_CONCURRENCY", 4))
+
+STORAGE_KEY_PREFIX = "seedance_assets"
+
+# Statuses with which Ark rejects a request whose asset reference it cannot
+# resolve, e.g. because the asset was deleted. The error must also point at
+# the reference (see ``_rejects_reference``); other 400s are returned as is.
+REJECTED_ASSET_STATUSES = frozenset({400, 404})
+# Substrings of Ark's error code or message that blame a media reference.
+REJECTED_ASSET_MARKERS = ("asset", "download", "fetch", "unreachable", "inaccessible")
+
+
+def _empty_stats() -> dict[str, Any]:
+    return {"hashes": [], "refs": [], "reused": 0, "uploaded": 0, "bytes_saved": 0}
+
+
+def media_hash(media: DataUrl) -> str:
+    digest = hashlib.sha256(media.mime_type.encode("utf-8"))
+    digest.update(media.data)
+    return digest.hexdigest()
+
+
+def _reference_from(body: Any) -> str | None:
+    if not isinstance(body, dict):
+        return None
+    if isinstance(body.get("data"), dict):
+        body = body["data"]
+    url = body.get("url")
+    if isinstance(url, str) and url.startswith(("https://", "http://", "asset://")):
+        return url
+    asset_id = body.get("id") or body.get("asset_id")
+    if isinstance(asset_id, str) and asset_id:
+        return asset_id if asset_id.startswith("asset://") else f"asset://{asset_id}"
+    return None
+
+
+class AssetManager:
+    """
+    Content-hash registry of uploaded reference media.
+
+    Each inline image or audio clip is uploaded once per API key; later
+    payloads carrying the same bytes reference the upload instead of
+    re-sending it as base64. References are kept in memory and in plugin
+    storage for ``ASSET_TTL`` seconds. Identical uploads running at the same
+    time share one request.
+    """
+
+    def __init__(
+        self, upload_url: str = ASSET_UPLOAD_URL, upload_token: str = ASSET_UPLOAD_TOKEN
+    ) -> None:
+        self._upload_url = upload_url
+        self._upload_token = upload_token
+        self._lock = threading.Lock()
+        # key id -> media hash -> {"ref", "mime_type", "size", "created_at"}
+        self._entries: dict[str, dict[str, dict[str, Any]]] = {}
+        self._inflight: dict[tuple[str, str], Future] = {}
+        self._loaded: set[str] = set()
+        self._dirty: set[str] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._upload_url and self._upload_token)
+
+    @staticmethod
+    def _storage_key(key_id: str) -> str:
+        return f"{STORAGE_KEY_PREFIX}:{key_id}"
+
+    def load(self, session: Any, api_key: str) -> None:
+        """Merge the stored references for this key on first use in the process."""
+        key_id = api_key_id(api_key)
+        with self._lock:
+            if key_id in self._loaded:
+                return
+            self._loaded.add(key_id)
+
+        storage = getattr(session, "storage", None)
+        if storage is None:
+            return
+        try:
+            if not storage.exist(self._storage_key(key_id)):
+                return
+            stored = json.loads(storage.get(self._storage_key(key_id)))
+        except Exception as e:
+            logger.warning("Could not load the asset registry: %s", str(e))
+            return
+
+        with self._lock:
+            entries = self._entries.setdefault(key_id, {})
+            for digest, entry in (stored.get("assets") or {}).items():
+                entries.setdefault(digest, entry)
+            self._trim_locked(key_id)
+
+    def save(self, session: Any, api_key: str) -> None:
+        """Write this key's references back to storage if they changed."""
+        key_id = api_key_id(api_key)
+        self.load(session, api_key)
+        with self._lock:
+            if key_id not in self._dirty:
+                return
+            self._dirty.discard(key_id)
+            self._trim_locked(key_id)
+            body = json.dumps(
+                {"assets": self._entries.get(key_id, {})},
+                ensure_ascii=False,
+                separators=(",", ":"),
+            ).encode("utf-8")
+
+        storage = getattr(session, "storage", None)
+        if storage is None:
+            return
+        try:
+            storage.set(self._storage_key(key_id), body)
+        except Exception as e:
+            logger.warning("Could not save the asset registry: %s", str(e))
+            with self._lock:
+                self._dirty.add(key_id)
+
+    def _trim_locked(self, key_id: str) -> None:
+        entries = self._entries.get(key_id)
+        if not entries:
+            return
+        cutoff = time.time() - ASSET_TTL
+        for digest in [d for d, entry in entries.items() if entry["created_at"] < cutoff]:
+            del entries[digest]
+        while len(entries) > max(0, ASSET_MAX_ENTRIES):
+            oldest = min(entries, key=lambda d: entries[d]["created_at"])
+            del entries[oldest]
+
+    def _lookup(self, key_id: str, digest: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key_id, {}).get(digest)
+            if entry is None:
+                return None
+            if entry["created_at"] < time.time() - ASSET_TTL:
+                del self._entries[key_id][digest]
+                self._dirty.add(key_id)
+                return None
+            return entry["ref"]
+
+    def forget(self, api_key: str, digests: list[str]) -> None:
+        """Drop references Ark refused, so the media is sent inline again."""
+        key_id = api_key_id(api_key)
+        with self._lock:
+            entries = self._entries.get(key_id, {})
+            for digest in digests:
+                if entries.pop(digest, None) is not None:
+                    self._dirty.add(key_id)
+
+    def _upload(self, media: DataUrl) -> str | None:
+        extension = media.mime_type.split("/")[-1]
+        try:
+            response = ark_client.request(
+                "POST",
+                self._upload_url,
+                "asset_upload",
+                headers={"Authorization": f"Bearer {self._upload_token}"},
+                # The buffer is handed over as is; the multipart encoder
+                # writes it into the body without an intermediate copy.
+                files={"file": (f"reference.{extension}", media.data, media.mime_type)},
+            )
+        except requests.exceptions.RequestException as e:
+            logger.warning("Asset upload failed: %s", str(e))
+            return None
+        if response.status_code not in (200, 201):
+            logger.warning(
+                "Asset upload returned %s: %s", response.status_code, response.text[:300]
+            )
+            return None
+        try:
+            ref = _reference_from(response.json())
+        except ValueError:
+            ref = None
+        if ref is None:
+            logger.warning("Asset upload response has no url or id: %s", response.text[:300])
+        return ref
+
+    def _resolve(self, api_key: str, media: DataUrl, digest: str) -> tuple[str | None, bool]:
+        """Return ``(reference, uploaded now)`` for one piece of media."""
+        key_id = api_key_id(api_key)
+        ref = self._lookup(key_id, digest)
+        if ref is not None:
+            return ref, False
+
+        with self._lock:
+            future = self._inflight.get((key_id, digest))
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[(key_id, digest)] = future
+        if not leader:
+            return future.result(), False
+
+        ref = None
+        try:
+            ref = self._upload(media)
+        finally:
+            with self._lock:
+                self._inflight.pop((key_id, digest), None)
+                if ref is not None:
+                    self._entries.setdefault(key_id, {})[digest] = {
+                        "ref": ref,
+                        "mime_type": media.mime_type,
+                        "size": media.size,
+                        "created_at": time.time(),
+                    }
+                    self._dirty.add(key_id)
+            future.set_result(ref)
+        return ref, True
+
+    def swap_inline_media(
+        self, api_key: str, payload: dict[str, Any]
+    ) -> tuple[dict[str, Any], dict[str, Any]]:
+        """
+        Return a copy of ``payload`` with inline media of at least
+        ``ASSET_MIN_BYTES`` replaced by asset references, uploading media
+        seen for the first time. Media that cannot be uploaded stays inline.
+
+        :returns: ``(payload, stats)`` where stats holds the hashes used and
+            how many references were reused, uploaded and bytes saved.
+        """
+        stats = _empty_stats()
+        if not self.enabled:
+            return payload, stats
+
+        media: dict[str, DataUrl] = {}
+        # id of each DataUrl in the payload -> its hash, so nothing is hashed twice
+        digests: dict[int, str] = {}
+
+        def collect(value: Any) -> None:
+            if isinstance(value, DataUrl):
+                if value.size >= ASSET_MIN_BYTES:
+                    digest = media_hash(value)
+                    digests[id(value)] = digest
+                    media.setdefault(digest, value)
+            elif isinstance(value, dict):
+                for item in value.values():
+                    collect(item)
+            elif isinstance(value, (list, tuple)):
+                for item in value:
+                    collect(item)
+
+        collect(payload)
+        if not media:
+            return payload, stats
+
+        workers = min(ASSET_UPLOAD_CONCURRENCY, len(media))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            resolved = dict(
+                zip(
+                    media,
+                    executor.map(
+                        lambda item: self._resolve(api_key, item[1], item[0]), media.items()
+                    ),
+                )
+            )
+
+        refs: dict[str, str] = {}
+        for digest, (ref, uploaded) in resolved.items():
+            if ref is None:
+                continue
+            refs[digest] = ref
+            stats["hashes"].append(digest)
+            stats["refs"].append(ref)
+            stats["uploaded" if uploaded else "reused"] += 1
+            stats["bytes_saved"] += media[digest].encoded_length()
+
+        def replace(value: Any) -> Any:
+            if isinstance(value, DataUrl):
+                return refs.get(digests.get(id(value), ""), value)
+            if isinstance(value, dict):
+                return {key: replace(item) for key, item in value.items()}
+            if isinstance(value, (list, tuple)):
+                return [replace(item) for item in value]
+            return value
+
+        return (replace(payload) if refs else payload), stats
+
+
+asset_manager = AssetManager()
+
+
+def _rejects_reference(response: requests.Response, refs: list[str]) -> bool:
+    """
+    Whether Ark refused the request because of an asset reference, rather
+    than e.g. a bad size or prompt, judged from its error code and message.
+    """
+    if response.status_code not in REJECTED_ASSET_STATUSES:
+        return False
+    try:
+        error = response.json().get("error") or {}
+    except (ValueError, AttributeError):
+        return False
+    if not isinstance(error, dict):
+        return False
+    text = f"{error.get('code') or ''} {error.get('message') or ''}"
+    if any(ref in text for ref in refs):
+        return True
+    text = text.lower()
+    return any(marker in text for marker in REJECTED_ASSET_MARKERS)
+
+
+def post_with_assets(
+    session: Any,
+    url: str,
+    api_key: str,
+    payload: dict[str, Any],
+    profile: str,
+    stream: bool = False,
+    dedupe: bool = False,
+) -> requests.Response:
+    """
+    ``ark_client.post`` with inline reference media swapped for uploaded
+    assets. If Ark rejects a request because of one of those references,
+    they are forgotten and the request is sent once more with the media
+    inline; any other error response is returned unchanged.
+
+    The response carries ``asset_stats`` with the counts from
+    :meth:`AssetManager.swap_inline_media`.
+    """
+    if not asset_manager.enabled:
+        return ark_client.post(url, api_key, payload, profile, stream=stream, dedupe=dedupe)
+
+    asset_manager.load(session, api_key)
+    swapped, stats = asset_manager.swap_inline_media(api_key, payload)
+    try:
+        response = ark_client.post(url, api_key, swapped, profile, stream=stream, dedupe=dedupe)
+        if stats["hashes"] and _rejects_reference(response, stats["refs"]):
+            logger.warning(
+                "Ark rejected a request with %d asset references (%s), resending inline",
+                len(stats["hashes"]),
+                response.status_code,
+            )
+            response.close()
+            asset_manager.forget(api_key, stats["hashes"])
+            stats = _empty_stats()
+            response = ark_client.post(url, api_key, payload, profile, stream=stream, dedupe=dedupe)
+    finally:
+        asset_manager.save(session, api_key)
+    response.asset_stats = stats
+    return response
@@ -0,0 +1,328 @@
+# author: sawyer-shi
+
+import logging
+import struct
+from dataclasses import dataclass
+from typing import Any
+
+import requests
+
+from utils.ark_client import ark_client
+
+logger = logging.getLogger(__name__)
+
+# Seedance 2.0 reference audio limits: WAV or MP3, at most 15 MB and
+# 2-15 seconds per clip, at most 15 seconds across all clips.
+MAX_AUDIO_BYTES = 15 * 1024 * 1024
+MIN_AUDIO_SECONDS = 2
+MAX_AUDIO_SECONDS = 15
+MAX_TOTAL_AUDIO_SECONDS = 15
+# Durations read from headers are estimates for constant-bitrate MP3.
+DURATION_TOLERANCE = 0.25
+
+# Bytes read before probing. An ID3 tag in front of MP3 frames (often with
+# cover art) is read past in full, see ``probe_size``.
+PROBE_BYTES = 64 * 1024
+READ_CHUNK_BYTES = 256 * 1024
+
+# Media types used in the data URLs sent to Ark.
+AUDIO_MIME_TYPES = {
+    "wav": "audio/wav",
+    "mp3": "audio/mp3",
+}
+
+# MPEG audio header tables, indexed by version id (3 = MPEG 1, 2 = MPEG 2,
+# 0 = MPEG 2.5) and layer id (3 = Layer I, 2 = Layer II, 1 = Layer III).
+_MPEG_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    0: (11025, 12000, 8000),
+}
+_MPEG1_BITRATES = {
+    3: (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    2: (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+}
+_MPEG2_BITRATES = {
+    3: (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    1: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+
+class AudioTooLargeError(ValueError):
+    """Raised as soon as a clip is known to be over the size limit."""
+
+
+@dataclass(frozen=True)
+class AudioInfo:
+    format: str
+    duration: float | None
+    sample_rate: int | None = None
+    channels: int | None = None
+
+    @property
+    def mime_type(self) -> str:
+        return AUDIO_MIME_TYPES[self.format]
+
+
+@dataclass(frozen=True)
+class _MpegFrame:
+    version: int
+    layer: int
+    bitrate: int
+    sample_rate: int
+    channels: int
+    samples: int
+    length: int
+
+
+def _id3_size(head: bytes) -> int:
+    """Size of a leading ID3v2 tag including its header, 0 if there is none."""
+    if len(head) < 10 or head[:3] != b"ID3":
+        return 0
+    size = 0
+    for byte in head[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if head[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def probe_size(head: bytes) -> int:
+    """How many leading bytes ``probe_audio`` needs, given the first few."""
+    return _id3_size(head) + PROBE_BYTES
+
+
+def _parse_mpeg_frame(data: bytes, offset: int) -> _MpegFrame | None:
+    if offset + 4 > len(data):
+        return None
+    b0, b1, b2, b3 = data[offset:offset + 4]
+    if b0 != 0xFF or b1 & 0xE0 != 0xE0:
+        return None
+    version = (b1 >> 3) & 3
+    layer = (b1 >> 1) & 3
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 3
+    if version == 1 or layer == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    table = _MPEG1_BITRATES if version == 3 else _MPEG2_BITRATES
+    bitrate = table[layer][bitrate_index] * 1000
+    sample_rate = _MPEG_SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 1
+    if layer == 3:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 576 if layer == 1 and version != 3 else 1152
+        length = samples // 8 * bitrate // sample_rate + padding
+    channels = 1 if b3 >> 6 == 3 else 2
+    return _MpegFrame(version, layer, bitrate, sample_rate, channels, samples, length)
+
+
+def _vbr_frame_count(data: bytes, offset: int, frame: _MpegFrame) -> int | None:
+    """Frame count from a Xing/Info or VBRI header in the first frame."""
+    if frame.version == 3:
+        side_info = 17 if frame.channels == 1 else 32
+    else:
+        side_info = 9 if frame.channels == 1 else 17
+    xing = offset + 4 + side_info
+    if data[xing:xing + 4] in (b"Xing", b"Info") and len(data) >= xing + 12:
+        (flags,) = struct.unpack(">I", data[xing + 4:xing + 8])
+        if flags & 1:
+            return struct.unpack(">I", data[xing + 8:xing + 12])[0]
+    vbri = offset + 4 + 32
+    if data[vbri:vbri + 4] == b"VBRI" and len(data) >= vbri + 18:
+        return struct.unpack(">I", data[vbri + 14:vbri + 18])[0]
+    return None
+
+
+def _probe_mp3(data: bytes, total_size: int | None) -> AudioInfo | None:
+    start = _id3_size(data)
+    # Look for two frames in a row, so a stray sync pattern is not taken
+    # for the first frame.
+    for offset in range(start, max(start, len(data) - 4)):
+        frame = _parse_mpeg_frame(data, offset)
+        if frame is None:
+            continue
+        following = offset + frame.length
+        if following + 4 <= len(data) and _parse_mpeg_frame(data, following) is None:
+            continue
+        frames = _vbr_frame_count(data, offset, frame)
+        if frames is not None:
+            duration = frames * frame.samples / frame.sample_rate
+        elif total_size is not None:
+            duration = (total_size - offset) * 8 / frame.bitrate
+        else:
+            duration = None
+        return AudioInfo("mp3", duration, frame.sample_rate, frame.channels)
+    return None
+
+
+def _probe_wav(data: bytes, total_size: int | None) -> AudioInfo | None:
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None
+    sample_rate = channels = byte_rate = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        (chunk_size,) = struct.unpack("<I", data[offset + 4:offset + 8])
+        body = offset + 8
+        if chunk_id == b"fmt " and body + 16 <= len(data):
+            _, channels, sample_rate, byte_rate = struct.unpack("<HHII", data[body:body + 12])
+        elif chunk_id == b"data":
+            # Streamed writers leave the size at 0 or 0xFFFFFFFF.
+            unknown_size = chunk_size in (0, 0xFFFFFFFF)
+            if total_size is not None:
+                chunk_size = total_size - body if unknown_size else min(chunk_size, total_size - body)
+            elif unknown_size:
+                return AudioInfo("wav", None, sample_rate, channels)
+            duration = chunk_size / byte_rate if byte_rate else None
+            return AudioInfo("wav", duration, sample_rate, channels)
+        offset = body + chunk_size + (chunk_size & 1)
+    # The data chunk lies past the probed bytes.
+    return AudioInfo("wav", None, sample_rate, channels)
+
+
+def probe_audio(head: bytes, total_size: int | None = None) -> AudioInfo | None:
+    """
+    Read format and duration from a WAV or MP3 header without decoding any
+    audio. ``head`` should hold at least ``probe_size(head)`` bytes;
+    ``total_size`` is needed for the duration of constant-bitrate MP3.
+    Returns ``None`` for anything that is neither.
+    """
+    return _probe_wav(head, total_size) or _probe_mp3(head, total_size)
+
+
+def guess_audio_format(input_audio_file: Any) -> str:
+    mime_type = str(getattr(input_audio_file, "mime_type", "") or "").lower()
+    filename = str(getattr(input_audio_file, "filename", "") or "").lower()
+
+    if "wav" in mime_type or filename.endswith(".wav"):
+        return "wav"
+
+    return "mp3"
+
+
+def _size_error(size: int, max_bytes: int) -> AudioTooLargeError:
+    return AudioTooLargeError(
+        f"输入音频大小 {size / 1024 / 1024:.1f}MB 超过{max_bytes // 1024 // 1024}MB限制"
+    )
+
+
+def _check_duration(info: AudioInfo, max_seconds: float) -> None:
+    if info.duration is None:
+        return
+    if info.duration > max_seconds + DURATION_TOLERANCE:
+        raise ValueError(f"音频时长 {info.duration:.1f} 秒超过 {max_seconds:g} 秒限制")
+    if info.duration < MIN_AUDIO_SECONDS - DURATION_TOLERANCE:
+        raise ValueError(f"音频时长 {info.duration:.1f} 秒短于 {MIN_AUDIO_SECONDS} 秒")
+
+
+def _open_chunks(input_audio_file: Any, max_bytes: int) -> tuple[Any, int | None]:
+    """
+    Return an iterator of byte chunks and the total size when known. Dify
+    files that are not loaded yet are streamed from their URL.
+    """
+    declared = getattr(input_audio_file, "size", None)
+    if isinstance(declared, int) and declared > max_bytes:
+        raise _size_error(declared, max_bytes)
+
+    url = getattr(input_audio_file, "url", None)
+    loaded = getattr(input_audio_file, "_blob", None)
+    if isinstance(url, str) and url.startswith(("http://", "https://")) and loaded is None:
+        response = ark_client.download(url, "audio_download", stream=True)
+        if response.status_code != 200:
+            response.close()
+            raise requests.exceptions.HTTPError(
+                f"音频文件下载失败，状态码: {response.status_code}", response=response
+            )
+        length = response.headers.get("Content-Length")
+        total = int(length) if length and length.isdigit() else declared
+        if total is not None and total > max_bytes:
+            response.close()
+            raise _size_error(total, max_bytes)
+
+        def stream_chunks() -> Any:
+            try:
+                yield from response.iter_content(READ_CHUNK_BYTES)
+            finally:
+                response.close()
+
+        return stream_chunks(), total
+
+    if hasattr(input_audio_file, "blob"):
+        data = input_audio_file.blob
+    elif hasattr(input_audio_file, "read") and callable(getattr(input_audio_file, "read")):
+        reader = input_audio_file
+
+        def read_chunks() -> Any:
+            while True:
+                chunk = reader.read(READ_CHUNK_BYTES)
+                if isinstance(chunk, str):
+                    chunk = chunk.encode("utf-8")
+                if not chunk:
+                    return
+                yield chunk
+
+        return read_chunks(), declared
+    elif isinstance(input_audio_file, (bytes, bytearray, memoryview)):
+        data = input_audio_file
+    else:
+        raise ValueError(f"不支持的音频数据类型: {type(input_audio_file)}")
+
+    if not isinstance(data, (bytes, bytearray, memoryview)):
+        raise ValueError("音频数据必须是字节格式")
+    return iter((data,)), len(data)
+
+
+def read_audio(
+    input_audio_file: Any,
+    max_bytes: int = MAX_AUDIO_BYTES,
+    max_seconds: float = MAX_AUDIO_SECONDS,
+) -> tuple[memoryview, AudioInfo]:
+    """
+    Read a reference audio clip, checking size and duration as early as
+    possible: the declared or ``Content-Length`` size before any byte is
+    read, the duration from the header as soon as it has arrived. Only then
+    is the rest read, into a single buffer. If the header alone did not give
+    the duration, it is worked out from the full clip. Clips whose header
+    cannot be probed are accepted with the format guessed from their MIME
+    type or file name and an unknown duration.
+
+    :raises AudioTooLargeError: if the clip is larger than ``max_bytes``.
+    :raises ValueError: if the clip is too long, too short or unreadable.
+    :raises requests.exceptions.RequestException: if streaming it fails.
+    """
+    chunks, total = _open_chunks(input_audio_file, max_bytes)
+    buffer = bytearray()
+    info = None
+    probed = False
+    try:
+        for chunk in chunks:
+            buffer += chunk
+            if len(buffer) > max_bytes:
+                raise _size_error(len(buffer), max_bytes)
+            if not probed and len(buffer) >= probe_size(buffer):
+                probed = True
+                info = probe_audio(bytes(buffer[:probe_size(buffer)]), total)
+                if info is not None:
+                    _check_duration(info, max_seconds)
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+    if not buffer:
+        raise ValueError("音频文件为空")
+    if info is None or info.duration is None:
+        # Probe again now that the size is known: it gives the duration of
+        # a constant-bitrate MP3 whose size was not declared, and a WAV data
+        # chunk past the probe window is found in the full buffer.
+        head = bytes(buffer[:probe_size(buffer)])
+        info = _probe_wav(memoryview(buffer), len(buffer)) or _probe_mp3(head, len(buffer))
+        if info is not None:
+            _check_duration(info, max_seconds)
+    if info is None:
+        info = AudioInfo(guess_audio_format(input_audio_file), None)
+        logger.warning("Could not probe reference audio header, assuming %s", info.format)
+    return memoryview(buffer), info
@@ -0,0 +1,265 @@
+# author: sawyer-shi
+
+import logging
+import os
+import tempfile
+import uuid
+from collections.abc import Generator, Iterable
+from typing import Any
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from utils.ark_client import ark_client
+
+logger = logging.getLogger(__name__)
+
+# Dify reassembles blob chunks of at most 8 KB, so never send larger pieces.
+BLOB_CHUNK_SIZE = 8192
+
+
+class BlobTooLargeError(Exception):
+    """Raised when a download exceeds its size limit."""
+
+
+def _chunk_message(
+    blob_id: str,
+    sequence: int,
+    total_length: int,
+    blob: bytes,
+    end: bool,
+    meta: dict[str, Any],
+) -> ToolInvokeMessage:
+    return ToolInvokeMessage(
+        type=ToolInvokeMessage.MessageType.BLOB_CHUNK,
+        message=ToolInvokeMessage.BlobChunkMessage(
+            id=blob_id,
+            sequence=sequence,
+            total_length=total_length,
+            blob=blob,
+            end=end,
+        ),
+        meta=meta,
+    )
+
+
+def _forward_chunks(
+    chunks: Iterable[bytes], total_length: int, meta: dict[str, Any]
+) -> Generator[ToolInvokeMessage, None, int]:
+    blob_id = uuid.uuid4().hex
+    sequence = 0
+    written = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        written += len(chunk)
+        if written > total_length:
+            raise BlobTooLargeError("文件大小与声明的长度不一致")
+        yield _chunk_message(blob_id, sequence, total_length, chunk, False, meta)
+        sequence += 1
+    yield _chunk_message(blob_id, sequence, total_length, b"", True, meta)
+    return written
+
+
+def _read_file_chunks(path: str) -> Generator[bytes, None, None]:
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(BLOB_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+def remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        logger.warning("Failed to remove temp file %s", path)
+
+
+class _FileTee:
+    """
+    Copies relayed chunks into a temporary file next to ``path`` and moves it
+    into place only once the whole body has been written. A failed write
+    just stops the copy; the relay itself carries on.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        self._file = None
+        try:
+            self._file = open(self._temp_path, "wb")
+        except OSError as e:
+            logger.warning("Cannot save download to %s: %s", path, str(e))
+
+    def wrap(self, chunks: Iterable[bytes]) -> Generator[bytes, None, None]:
+        for chunk in chunks:
+            if self._file is not None and chunk:
+                try:
+                    self._file.write(chunk)
+                except OSError as e:
+                    logger.warning("Saving download to %s failed: %s", self._path, str(e))
+                    self.discard()
+            yield chunk
+
+    def commit(self) -> bool:
+        if self._file is None:
+            return False
+        try:
+            self._file.close()
+            os.replace(self._temp_path, self._path)
+            return True
+        except OSError as e:
+            logger.warning("Saving download to %s failed: %s", self._path, str(e))
+            self.discard()
+            return False
+        finally:
+            self._file = None
+
+    def discard(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        remove_quietly(self._temp_path)
+
+
+def stream_file_blob(
+    tool: Tool,
+    path: str,
+    mime_type: str,
+    filename: str | None = None,
+) -> Generator[ToolInvokeMessage, None, int]:
+    """
+    Forward a local file as blob chunks. Returns the number of bytes sent.
+
+    :raises OSError: if the file cannot be read.
+    """
+    meta: dict[str, Any] = {"mime_type": mime_type}
+    if filename:
+        meta["filename"] = filename
+    return (
+        yield from _forward_chunks(_read_file_chunks(path), os.path.getsize(path), meta)
+    )
+
+
+def stream_url_blob(
+    tool: Tool,
+    url: str,
+    max_bytes: int,
+    profile: str,
+    mime_type: str | None = None,
+    filename: str | None = None,
+    label: str = "文件",
+    save_path: str | None = None,
+) -> Generator[ToolInvokeMessage, None, int]:
+    """
+    Download ``url`` and forward it as blob chunks without buffering it whole.
+
+    When the server reports ``Content-Length`` the body is relayed chunk by
+    chunk; otherwise it is spilled to a temporary file first so the total
+    length is known before the first chunk is sent. Either way at most one
+    chunk is held in memory. ``mime_type`` defaults to the response's
+    ``Content-Type``. When ``save_path`` is given, a complete body is also
+    kept at that path. Returns the number of bytes sent.
+
+    :raises BlobTooLargeError: if the body is larger than ``max_bytes``.
+    :raises requests.exceptions.RequestException: on network errors or a
+        non-200 response.
+    """
+    with ark_client.download(url, profile=profile, stream=True) as response:
+        response.raise_for_status()
+
+        meta: dict[str, Any] = {
+            "mime_type": mime_type
+            or response.headers.get("Content-Type", "application/octet-stream").split(";")[0]
+        }
+        if filename:
+            meta["filename"] = filename
+
+        content_length = response.headers.get("Content-Length", "")
+        content_encoding = response.headers.get("Content-Encoding", "identity")
+        if content_length.isdigit() and content_encoding == "identity":
+            total_length = int(content_length)
+            if total_length > max_bytes:
+                raise BlobTooLargeError(
+                    f"{label}大小 {total_length / 1024 / 1024:.2f} MB 超过下载上限 "
+                    f"{max_bytes / 1024 / 1024:.0f} MB"
+                )
+            chunks = response.iter_content(chunk_size=BLOB_CHUNK_SIZE)
+            if save_path is None:
+                return (yield from _forward_chunks(chunks, total_length, meta))
+
+            tee = _FileTee(save_path)
+            try:
+                written = yield from _forward_chunks(tee.wrap(chunks), total_length, meta)
+            except BaseException:
+                tee.discard()
+                raise
+            if written == total_length:
+                tee.commit()
+            else:
+                tee.discard()
+            return written
+
+        fd, temp_path = tempfile.mkstemp(
+            suffix=".tmp", dir=os.path.dirname(save_path) if save_path else None
+        )
+        try:
+            total_length = 0
+            with os.fdopen(fd, "wb") as temp_file:
+                for chunk in response.iter_content(chunk_size=BLOB_CHUNK_SIZE):
+                    total_length += len(chunk)
+                    if total_length > max_bytes:
+                        raise BlobTooLargeError(
+                            f"{label}大小超过下载上限 {max_bytes / 1024 / 1024:.0f} MB"
+                        )
+                    temp_file.write(chunk)
+            written = yield from _forward_chunks(
+                _read_file_chunks(temp_path), total_length, meta
+            )
+            if save_path is not None:
+                try:
+                    os.replace(temp_path, save_path)
+                except OSError as e:
+                    logger.warning("Saving download to %s failed: %s", save_path, str(e))
+            return written
+        finally:
+            remove_quietly(temp_path)
+
+
+def download_to_file(
+    url: str,
+    path: str,
+    max_bytes: int,
+    profile: str,
+    label: str = "文件",
+) -> int:
+    """
+    Download ``url`` into ``path``, which only appears once the body is
+    complete. Returns the number of bytes written.
+
+    :raises BlobTooLargeError: if the body is larger than ``max_bytes``.
+    :raises requests.exceptions.RequestException: on network errors or a
+        non-200 response.
+    :raises OSError: if the file cannot be written.
+    """
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with ark_client.download(url, profile=profile, stream=True) as response:
+            response.raise_for_status()
+            total_length = 0
+            with open(temp_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=BLOB_CHUNK_SIZE):
+                    total_length += len(chunk)
+                    if total_length > max_bytes:
+                        raise BlobTooLargeError(
+                            f"{label}大小超过下载上限 {max_bytes / 1024 / 1024:.0f} MB"
+                        )
+                    f.write(chunk)
+        os.replace(temp_path, path)
+        return total_length
+    finally:
+        remove_quietly(temp_path)
@@ -0,0 +1,82 @@
+# author: sawyer-shi
+
+import os
+import threading
+from collections.abc import Callable
+from concurrent.futures import Executor
+from typing import Any, TypeVar
+
+from utils.env import env_int
+
+T = TypeVar("T")
+
+CPU_WORKERS = max(1, env_int("ARK_IMAGE_ENCODE_WORKERS", min(4, os.cpu_count() or 1)))
+
+_executor: Executor | None = None
+_executor_lock = threading.Lock()
+
+
+def is_cooperative() -> bool:
+    """
+    True when the plugin runtime has monkey-patched ``threading`` with
+    gevent. Every invocation then runs in a greenlet and all network waits
+    (``requests`` sockets, ``time.sleep`` in poll loops) yield to the hub, so
+    one process can hold hundreds of Ark calls in flight. Only CPU-bound
+    work still blocks every invocation at once and has to be moved off the
+    hub with :func:`run_cpu`.
+    """
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("threading")
+
+
+def cpu_executor() -> Executor:
+    """
+    Return the process-wide pool for CPU-bound work.
+
+    Under gevent a stdlib thread pool would only create more greenlets on the
+    same core, so gevent's native thread pool is used instead. Pillow, hashlib
+    and zlib drop the GIL, so its workers run truly in parallel.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                if is_cooperative():
+                    from gevent.threadpool import ThreadPoolExecutor
+                else:
+                    from concurrent.futures import ThreadPoolExecutor
+
+                _executor = ThreadPoolExecutor(max_workers=CPU_WORKERS)
+    return _executor
+
+
+def capture(func: Callable[..., T], *args: Any, **kwargs: Any) -> tuple[bool, Any]:
+    """
+    Call ``func`` and return ``(True, result)`` or ``(False, exception)``.
+
+    Failures travel back as values: gevent's future proxies re-raise from
+    ``exception()`` and log every worker error, which would be noise here.
+    """
+    try:
+        return True, func(*args, **kwargs)
+    except Exception as e:
+        return False, e
+
+
+def run_cpu(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Run CPU-bound ``func`` without stalling other invocations.
+
+    Under gevent the call is handed to :func:`cpu_executor` and the calling
+    greenlet waits cooperatively; in a plain threaded process it simply runs
+    inline.
+    """
+    if not is_cooperative():
+        return func(*args, **kwargs)
+    ok, value = cpu_executor().submit(capture, func, *args, **kwargs).result()
+    if not ok:
+        raise value
+    return value
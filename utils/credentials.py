@@ -0,0 +1,155 @@
+# author: sawyer-shi
+
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+
+from utils.api_keys import api_key_id
+from utils.ark_client import CONTENTS_GENERATIONS_TASKS_URL, ark_client
+from utils.env import env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+# How long a validation result is reused. Rejected keys are cached for a
+# shorter time so a key fixed in the console is picked up quickly.
+CREDENTIAL_CACHE_TTL = env_float("ARK_CREDENTIAL_CACHE_TTL", 600)
+CREDENTIAL_FAILURE_TTL = env_float("ARK_CREDENTIAL_FAILURE_TTL", 60)
+CREDENTIAL_CACHE_MAX_ENTRIES = env_int("ARK_CREDENTIAL_CACHE_MAX_ENTRIES", 1024)
+
+AUTH_FAILURE_STATUSES = (401, 403)
+
+
+class CredentialError(Exception):
+    """Raised when an API key cannot be confirmed as valid."""
+
+    def __init__(self, message: str, status_code: int | None = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _error_message(response: requests.Response) -> str:
+    try:
+        data = response.json()
+        return data.get("error", {}).get("message") or data.get("message") or response.text
+    except Exception:
+        return response.text
+
+
+def check_api_key(api_key: str) -> None:
+    """
+    Confirm the key with a one-item task list query. It is an auth-only
+    metadata read, so no model is invoked and no tokens are spent.
+
+    :raises CredentialError: if the key is rejected or the service cannot be
+        reached.
+    """
+    try:
+        response = ark_client.get(
+            CONTENTS_GENERATIONS_TASKS_URL,
+            api_key,
+            "credential_check",
+            params={"page_num": 1, "page_size": 1},
+        )
+    except requests.RequestException as req_err:
+        raise CredentialError(f"Unable to reach Volcengine service: {req_err}")
+
+    if response.status_code != 200:
+        raise CredentialError(
+            f"Volcengine API error {response.status_code}: {_error_message(response)}",
+            response.status_code,
+        )
+
+
+class CredentialValidator:
+    """
+    TTL cache in front of :func:`check_api_key`, keyed by a hash of the API
+    key. Concurrent validations of the same key share a single request.
+    """
+
+    def __init__(
+        self,
+        ttl: float = CREDENTIAL_CACHE_TTL,
+        failure_ttl: float = CREDENTIAL_FAILURE_TTL,
+        max_entries: int = CREDENTIAL_CACHE_MAX_ENTRIES,
+    ) -> None:
+        self._ttl = ttl
+        self._failure_ttl = failure_ttl
+        self._max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        # key id -> (expires_at, rejection or None when valid)
+        self._results: dict[str, tuple[float, CredentialError | None]] = {}
+        self._inflight: dict[str, Future] = {}
+
+    def validate(self, api_key: str) -> None:
+        """
+        :raises CredentialError: if the key is invalid or cannot be checked.
+        """
+        key_id = api_key_id(api_key)
+        now = time.monotonic()
+
+        with self._lock:
+            cached = self._results.get(key_id)
+            if cached is not None and cached[0] > now:
+                if cached[1] is not None:
+                    raise CredentialError(str(cached[1]), cached[1].status_code)
+                return
+            future = self._inflight.get(key_id)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key_id] = future
+
+        if not leader:
+            logger.info("Joining in-flight credential validation")
+            future.result()
+            return
+
+        try:
+            check_api_key(api_key)
+        except CredentialError as e:
+            # Only cache a definite rejection, never an outage or rate limit.
+            self._finish(key_id, future, e, e.status_code in AUTH_FAILURE_STATUSES)
+            raise
+        except Exception as e:
+            self._finish(key_id, future, e, False)
+            raise
+        self._finish(key_id, future, None, True)
+
+    def _finish(
+        self,
+        key_id: str,
+        future: Future,
+        error: Exception | None,
+        cacheable: bool,
+    ) -> None:
+        with self._lock:
+            self._inflight.pop(key_id, None)
+            if cacheable:
+                ttl = self._ttl if error is None else self._failure_ttl
+                if ttl > 0:
+                    self._results.pop(key_id, None)
+                    if len(self._results) >= self._max_entries:
+                        self._evict(time.monotonic())
+                    self._results[key_id] = (time.monotonic() + ttl, error)
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(error)
+
+    def _evict(self, now: float) -> None:
+        expired = [key for key, (expires_at, _) in self._results.items() if expires_at <= now]
+        for key in expired:
+            del self._results[key]
+        while len(self._results) >= self._max_entries:
+            # dicts keep insertion order, so the first entry is the oldest.
+            del self._results[next(iter(self._results))]
+
+    def invalidate(self, api_key: str) -> None:
+        with self._lock:
+            self._results.pop(api_key_id(api_key), None)
+
+
+credential_validator = CredentialValidator()
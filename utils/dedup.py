@@ -0,0 +1,146 @@
+# author: sawyer-shi
+
+import copy
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import Future
+from typing import Any
+
+import requests
+
+from utils.env import env_bool, env_float, env_int
+from utils.request_body import DataUrl
+
+logger = logging.getLogger(__name__)
+
+# Opt-in: identical generation calls made at the same time share one Ark
+# request. With a result TTL, a fixed-seed call repeated within the TTL
+# also gets the earlier result instead of paying for a new generation.
+DEDUP_ENABLED = env_bool("ARK_DEDUP_ENABLED", False)
+DEDUP_RESULT_TTL = env_float("ARK_DEDUP_RESULT_TTL", 0)
+DEDUP_CACHE_MAX_ENTRIES = env_int("ARK_DEDUP_CACHE_MAX_ENTRIES", 256)
+
+REUSE_JOINED = "joined"
+REUSE_CACHED = "cached"
+
+
+def _canonical(value: Any) -> Any:
+    if isinstance(value, DataUrl):
+        return f"{value.mime_type}:{hashlib.sha256(value.data).hexdigest()}"
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    return value
+
+
+def payload_key(api_key: str, url: str, payload: dict[str, Any]) -> str:
+    """
+    Hash the API key, endpoint and payload in canonical form: sorted keys,
+    and inline media replaced by a digest of its bytes.
+    """
+    digest = hashlib.sha256()
+    digest.update(hashlib.sha256(api_key.encode("utf-8")).digest())
+    digest.update(url.encode("utf-8"))
+    digest.update(
+        json.dumps(
+            _canonical(payload), sort_keys=True, ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+    )
+    return digest.hexdigest()
+
+
+def has_fixed_seed(payload: dict[str, Any]) -> bool:
+    seed = payload.get("seed")
+    return isinstance(seed, int) and not isinstance(seed, bool) and seed >= 0
+
+
+def _reused(response: requests.Response, how: str) -> requests.Response:
+    # Each caller gets its own copy; the body bytes are shared. The leader's
+    # queue wait is not this caller's: joined and cached callers never
+    # queued for an Ark slot.
+    reused = copy.copy(response)
+    reused.reused = how
+    reused.queue_wait = 0.0
+    return reused
+
+
+class RequestDeduplicator:
+    """
+    Coalesces identical in-flight requests and keeps a short-lived cache of
+    successful responses for fixed-seed payloads.
+
+    Only whole, already read responses are shared, so streamed requests must
+    not go through it.
+    """
+
+    def __init__(
+        self,
+        result_ttl: float = DEDUP_RESULT_TTL,
+        max_entries: int = DEDUP_CACHE_MAX_ENTRIES,
+    ) -> None:
+        self._result_ttl = result_ttl
+        self._max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._inflight: dict[str, Future] = {}
+        # key -> (expires_at, response)
+        self._results: OrderedDict[str, tuple[float, requests.Response]] = OrderedDict()
+
+    def run(
+        self,
+        key: str,
+        send: Callable[[], requests.Response],
+        cacheable: bool = False,
+    ) -> requests.Response:
+        """
+        Call ``send`` unless an identical request is already running or,
+        when ``cacheable``, finished successfully within the TTL. A reused
+        response has ``response.reused`` set to ``"joined"`` or ``"cached"``.
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                if cacheable and cached[0] > now:
+                    self._results.move_to_end(key)
+                    logger.info("Reusing cached response for identical request")
+                    return _reused(cached[1], REUSE_CACHED)
+                if cached[0] <= now:
+                    del self._results[key]
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+
+        if not leader:
+            logger.info("Joining identical in-flight request")
+            return _reused(future.result(), REUSE_JOINED)
+
+        try:
+            response = send()
+            # Read the body now so followers can share it.
+            response.content
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._inflight.pop(key, None)
+            if cacheable and self._result_ttl > 0 and response.status_code == 200:
+                self._results[key] = (time.monotonic() + self._result_ttl, response)
+                self._results.move_to_end(key)
+                while len(self._results) > self._max_entries:
+                    self._results.popitem(last=False)
+        future.set_result(response)
+        return response
+
+
+request_deduplicator = RequestDeduplicator()
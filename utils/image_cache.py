@@ -0,0 +1,148 @@
+# author: sawyer-shi
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from utils.env import env_int
+
+logger = logging.getLogger(__name__)
+
+MEMORY_CACHE_BYTES = env_int("ARK_IMAGE_CACHE_MB", 32) * 1024 * 1024
+DISK_CACHE_DIR = os.environ.get("ARK_IMAGE_CACHE_DIR", "")
+DISK_CACHE_BYTES = env_int("ARK_IMAGE_CACHE_DISK_MB", 512) * 1024 * 1024
+
+_MIME_EXTENSIONS = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+}
+_EXTENSION_MIMES = {ext: mime for mime, ext in _MIME_EXTENSIONS.items()}
+
+
+def content_key(data: bytes, *variant: object) -> str:
+    """
+    Build a cache key from the content hash plus any options that change the
+    encoded output.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    if not variant:
+        return digest
+    suffix = hashlib.sha256(repr(variant).encode("utf-8")).hexdigest()[:16]
+    return f"{digest}-{suffix}"
+
+
+class ImageCache:
+    """
+    Two-tier LRU cache of encoded images keyed by content hash.
+
+    The memory tier is bounded by total payload bytes. The optional disk tier
+    lives in ``disk_dir`` and is trimmed oldest-first when it grows past
+    ``disk_max_bytes``.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = MEMORY_CACHE_BYTES,
+        disk_dir: str = DISK_CACHE_DIR,
+        disk_max_bytes: int = DISK_CACHE_BYTES,
+    ) -> None:
+        self._max_bytes = max_bytes
+        self._disk_dir = disk_dir
+        self._disk_max_bytes = disk_max_bytes
+        self._entries: OrderedDict[str, tuple[bytes | memoryview, str]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        if self._disk_dir:
+            os.makedirs(self._disk_dir, exist_ok=True)
+
+    def get(self, key: str) -> tuple[bytes | memoryview, str] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        entry = self._disk_get(key)
+        if entry is not None:
+            self._memory_put(key, entry)
+        return entry
+
+    def put(self, key: str, data: bytes | memoryview, mime_type: str) -> None:
+        self._memory_put(key, (data, mime_type))
+        self._disk_put(key, data, mime_type)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _memory_put(self, key: str, entry: tuple[bytes | memoryview, str]) -> None:
+        size = len(entry[0])
+        if size > self._max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[0])
+            self._entries[key] = entry
+            self._size += size
+            while self._size > self._max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _disk_path(self, key: str, mime_type: str) -> str:
+        return os.path.join(self._disk_dir, f"{key}.{_MIME_EXTENSIONS.get(mime_type, 'bin')}")
+
+    def _disk_get(self, key: str) -> tuple[bytes, str] | None:
+        if not self._disk_dir:
+            return None
+        for ext, mime_type in _EXTENSION_MIMES.items():
+            path = os.path.join(self._disk_dir, f"{key}.{ext}")
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                os.utime(path)
+                return data, mime_type
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.warning("Image cache read failed for %s: %s", path, str(e))
+                return None
+        return None
+
+    def _disk_put(self, key: str, data: bytes | memoryview, mime_type: str) -> None:
+        if not self._disk_dir or len(data) > self._disk_max_bytes:
+            return
+        path = self._disk_path(key, mime_type)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+            self._trim_disk()
+        except OSError as e:
+            logger.warning("Image cache write failed for %s: %s", path, str(e))
+
+    def _trim_disk(self) -> None:
+        files = []
+        total = 0
+        with os.scandir(self._disk_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        for _, size, path in sorted(files):
+            if total <= self._disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+image_cache = ImageCache()
@@ -0,0 +1,99 @@
+# author: sawyer-shi
+
+import json
+import logging
+from typing import Any
+
+import requests
+
+from utils.ark_client import IMAGES_GENERATIONS_URL, ark_client
+from utils.payload_log import RedactedPayload
+
+logger = logging.getLogger(__name__)
+
+
+class ImageGenerationError(Exception):
+    """Raised when an ``/images/generations`` call does not return images."""
+
+
+def build_text_to_image_payload(
+    prompt: str,
+    model: str,
+    size: str,
+    sequential_image_generation: str = "disabled",
+    watermark: bool = True,
+    stream: bool = False,
+    seed: int | None = None,
+) -> dict[str, Any]:
+    payload: dict[str, Any] = {
+        "model": model,
+        "prompt": prompt,
+        "size": size,
+        "sequential_image_generation": sequential_image_generation,
+        "stream": stream,
+        "response_format": "url",
+        "watermark": watermark,
+    }
+    if seed is not None and seed >= 0:
+        payload["seed"] = seed
+    return payload
+
+
+def post_image_generation(
+    api_key: str,
+    payload: dict[str, Any],
+    profile: str,
+    stream: bool = False,
+    dedupe: bool = False,
+) -> requests.Response:
+    """
+    Send an ``/images/generations`` request and return the response once
+    Ark has accepted it with status 200.
+
+    :raises ImageGenerationError: with a user-facing message on a network
+        error or any other status.
+    """
+    logger.info("Submitting request: %s", RedactedPayload(payload))
+    try:
+        response = ark_client.post(
+            IMAGES_GENERATIONS_URL, api_key, payload, profile, stream=stream, dedupe=dedupe
+        )
+    except requests.exceptions.Timeout:
+        raise ImageGenerationError("请求超时，请稍后重试")
+    except requests.exceptions.RequestException as e:
+        raise ImageGenerationError(f"请求失败: {str(e)}")
+
+    if response.status_code != 200:
+        logger.error("API status %s: %s", response.status_code, response.text[:300])
+        raise ImageGenerationError(
+            f"API 响应状态码: {response.status_code} {response.text[:500]}".rstrip()
+        )
+    return response
+
+
+def parse_image_response(response: requests.Response) -> dict[str, Any]:
+    """
+    Decode a non-streaming ``/images/generations`` response.
+
+    :raises ImageGenerationError: if the body is not JSON or has no images.
+    """
+    try:
+        resp_data = response.json()
+    except json.JSONDecodeError as e:
+        logger.error("Failed to parse JSON: %s - %s", str(e), response.text[:300])
+        raise ImageGenerationError("API 响应解析失败（非JSON）")
+
+    if not resp_data.get("data"):
+        raise ImageGenerationError("API 响应中未返回图像数据")
+
+    return resp_data
+
+
+def generate_images(api_key: str, payload: dict[str, Any], profile: str) -> dict[str, Any]:
+    """
+    Run a non-streaming ``/images/generations`` request and return the
+    decoded body.
+
+    :raises ImageGenerationError: with a user-facing message on any failure.
+    """
+    return parse_image_response(post_image_generation(api_key, payload, profile))
@@ -0,0 +1,79 @@
+# author: sawyer-shi
+
+import base64
+import logging
+from collections.abc import Generator
+from typing import Any
+
+import requests
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from utils.blob_stream import BlobTooLargeError, stream_url_blob
+from utils.env import env_int
+
+logger = logging.getLogger(__name__)
+
+# How generated images are handed back to Dify:
+#   url  - pass Ark's result URL through as an image message
+#   blob - fetch the URL and stream it back as blob chunks
+#   b64  - request b64_json and decode it (for hosts that cannot reach the URL)
+OUTPUT_MODE_URL = "url"
+OUTPUT_MODE_BLOB = "blob"
+OUTPUT_MODE_B64 = "b64"
+OUTPUT_MODES = (OUTPUT_MODE_URL, OUTPUT_MODE_BLOB, OUTPUT_MODE_B64)
+
+MAX_IMAGE_DOWNLOAD_BYTES = env_int("ARK_IMAGE_MAX_DOWNLOAD_MB", 50) * 1024 * 1024
+
+
+def parse_output_mode(tool_parameters: dict[str, Any], default: str = OUTPUT_MODE_BLOB) -> str:
+    output_mode = tool_parameters.get("output_mode") or default
+    return output_mode if output_mode in OUTPUT_MODES else default
+
+
+def response_format_for(output_mode: str) -> str:
+    return "b64_json" if output_mode == OUTPUT_MODE_B64 else "url"
+
+
+def emit_image(
+    tool: Tool, data: dict[str, Any], output_mode: str
+) -> Generator[ToolInvokeMessage, None, int | None]:
+    """
+    Forward one generated image from an ``/images/generations`` data item or
+    stream event. Returns the image size in bytes when it passed through the
+    plugin, or ``None`` when only the URL was forwarded.
+
+    :raises ValueError: if the item carries neither a URL nor b64 data.
+    """
+    b64_json = data.get("b64_json")
+    image_url = data.get("url")
+
+    if b64_json:
+        image_bytes = base64.b64decode(b64_json)
+        yield tool.create_blob_message(blob=image_bytes, meta={"mime_type": "image/png"})
+        return len(image_bytes)
+
+    if not image_url:
+        raise ValueError("未获取到图片数据")
+
+    if output_mode == OUTPUT_MODE_BLOB:
+        chunks = stream_url_blob(
+            tool, image_url, MAX_IMAGE_DOWNLOAD_BYTES, "image_download", label="图片"
+        )
+        started = False
+        try:
+            while True:
+                message = next(chunks)
+                started = True
+                yield message
+        except StopIteration as stop:
+            return stop.value
+        except (BlobTooLargeError, requests.exceptions.RequestException) as e:
+            # Before the first chunk the URL is still a usable result; after
+            # it the blob is incomplete and the error has to surface.
+            if started:
+                raise
+            logger.warning("Image download failed, returning URL instead: %s", str(e))
+
+    yield tool.create_image_message(image_url)
+    return None
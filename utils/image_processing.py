@@ -0,0 +1,457 @@
+# author: sawyer-shi
+
+import base64
+import logging
+from collections.abc import Callable, Sequence
+from concurrent.futures import as_completed
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Any, TypeVar
+
+from PIL import ExifTags, Image
+
+from utils.concurrency import (
+    CPU_WORKERS,
+    capture,
+    cpu_executor,
+    is_cooperative,
+    run_cpu,
+)
+from utils.env import env_bool, env_int
+from utils.image_cache import content_key, image_cache
+from utils.request_body import DataUrl
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+DEFAULT_MAX_IMAGE_BYTES = 10 * 1024 * 1024
+# Safety cap on raw input that will be scaled down. The upload limit
+# (``max_bytes``) applies to what is actually sent, so a large photo that the
+# resize shrinks below it is accepted.
+MAX_INPUT_IMAGE_BYTES = env_int("ARK_IMAGE_MAX_INPUT_MB", 50) * 1024 * 1024
+
+# Formats Ark accepts that can be forwarded without re-encoding, and the
+# pixel modes they may be forwarded in.
+PASSTHROUGH_FORMATS = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+}
+PASSTHROUGH_MODES = {"RGB", "L"}
+LOSSY_FORMATS = {"JPEG", "WEBP", "MPO"}
+JPEG_QUALITY = 95
+
+AUTO_RESIZE = env_bool("ARK_IMAGE_AUTO_RESIZE", True)
+
+# Longest reference edge for models without an entry in MODEL_INPUT_LIMITS.
+DEFAULT_MAX_INPUT_DIMENSION = 6000
+
+# Longest output edge for each video resolution.
+VIDEO_RESOLUTION_LONG_EDGE = {
+    "480p": 864,
+    "720p": 1280,
+    "1080p": 1920,
+}
+
+
+# EXIF orientation -> transpose that makes the image upright.
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+@dataclass(frozen=True)
+class ImageLimits:
+    """Reference image limits of a model family, as Ark documents them."""
+
+    min_edge: int
+    max_edge: int
+    max_pixels: int
+    min_aspect: float
+    max_aspect: float
+
+
+# Seedream accepts 1:16 to 16:1 with edges of 15-6000 px and at most
+# 6000x6000 pixels; Seedance accepts 0.4 to 2.5 with edges of 300-6000 px.
+MODEL_INPUT_LIMITS = {
+    "seedream": ImageLimits(
+        min_edge=15, max_edge=6000, max_pixels=6000 * 6000, min_aspect=1 / 16, max_aspect=16
+    ),
+    "seedance": ImageLimits(
+        min_edge=300, max_edge=6000, max_pixels=6000 * 6000, min_aspect=0.4, max_aspect=2.5
+    ),
+}
+
+
+class ImageEncodeError(ValueError):
+    """Raised by ``encode_all`` with the index of the first failed item."""
+
+    def __init__(self, index: int, error: Exception) -> None:
+        super().__init__(str(error))
+        self.index = index
+
+
+@dataclass(frozen=True)
+class ImageInfo:
+    format: str
+    mode: str
+    width: int
+    height: int
+    orientation: int = 1
+
+    @property
+    def pixels(self) -> int:
+        return self.width * self.height
+
+    @property
+    def upright_size(self) -> tuple[int, int]:
+        """Width and height once the EXIF orientation is applied."""
+        if self.orientation in (5, 6, 7, 8):
+            return self.height, self.width
+        return self.width, self.height
+
+
+@dataclass(frozen=True)
+class EncodedImage:
+    data: bytes | memoryview
+    mime_type: str
+
+    def to_data_url(self) -> DataUrl:
+        return DataUrl(self.mime_type, self.data)
+
+
+def read_image_bytes(input_image_file: Any) -> bytes:
+    """
+    Extract raw bytes from a Dify file, file-like object, bytes or data URL.
+    """
+    if hasattr(input_image_file, "blob"):
+        image_bytes = input_image_file.blob
+    elif hasattr(input_image_file, "read") and callable(getattr(input_image_file, "read")):
+        image_bytes = input_image_file.read()
+        if isinstance(image_bytes, str):
+            image_bytes = image_bytes.encode("utf-8")
+    elif isinstance(input_image_file, bytes):
+        image_bytes = input_image_file
+    elif isinstance(input_image_file, str) and input_image_file.startswith("data:"):
+        _, base64_data = input_image_file.split(",", 1)
+        image_bytes = base64.b64decode(base64_data)
+    else:
+        raise ValueError(f"不支持的图像数据类型: {type(input_image_file)}")
+
+    if not isinstance(image_bytes, bytes):
+        raise ValueError("图像数据必须是字节格式")
+
+    return image_bytes
+
+
+def _orientation(image: Image.Image) -> int:
+    if image.format == "PNG":
+        # PngImageFile.getexif() decodes the image to look for a late eXIf
+        # chunk; only an eXIf chunk ahead of the pixel data is read here.
+        raw = image.info.get("exif")
+        if not raw:
+            return 1
+        exif = Image.Exif()
+        exif.load(raw)
+    else:
+        exif = image.getexif()
+    orientation = exif.get(ExifTags.Base.Orientation, 1)
+    return orientation if orientation in ORIENTATION_TRANSPOSE else 1
+
+
+def probe_image(image_bytes: bytes) -> ImageInfo:
+    """
+    Read format, mode, dimensions and EXIF orientation from the image
+    header without decoding pixel data.
+    """
+    with Image.open(BytesIO(image_bytes)) as image:
+        return ImageInfo(
+            format=image.format or "",
+            mode=image.mode,
+            width=image.width,
+            height=image.height,
+            orientation=_orientation(image),
+        )
+
+
+def input_limits_for(model: str) -> ImageLimits | None:
+    normalized = model.lower()
+    for family, limits in MODEL_INPUT_LIMITS.items():
+        if family in normalized:
+            return limits
+    return None
+
+
+def max_input_dimension(model: str) -> int:
+    """Longest reference edge ``model`` accepts."""
+    limits = input_limits_for(model)
+    return limits.max_edge if limits is not None else DEFAULT_MAX_INPUT_DIMENSION
+
+
+def validate_image(info: ImageInfo, limits: ImageLimits | None = None) -> None:
+    """
+    Reject an image from its header alone when its edges or aspect ratio
+    fall outside ``limits``. Any format Pillow can open is accepted and
+    converted; oversized images are not rejected either, ``encode_image``
+    scales them down to fit.
+
+    :raises ValueError: with a message for the user.
+    """
+    if limits is None:
+        return
+    width, height = info.upright_size
+    if min(width, height) < limits.min_edge:
+        raise ValueError(f"图片尺寸 {width}x{height} 过小，宽高均需不小于 {limits.min_edge} 像素")
+    aspect = width / height
+    if not limits.min_aspect <= aspect <= limits.max_aspect:
+        raise ValueError(
+            f"图片宽高比 {aspect:.2f} 超出范围（{limits.min_aspect:g} - {limits.max_aspect:g}）"
+        )
+
+
+def _fit_dimension(
+    info: ImageInfo, limits: ImageLimits | None, max_dimension: int | None
+) -> int | None:
+    """Tighten ``max_dimension`` so the result also fits the model's limits."""
+    if limits is None:
+        return max_dimension
+    long_edge = max(info.width, info.height)
+    fit = min(long_edge, limits.max_edge)
+    if info.pixels > limits.max_pixels:
+        fit = min(fit, int(long_edge * (limits.max_pixels / info.pixels) ** 0.5))
+    if fit >= long_edge:
+        return max_dimension
+    return fit if max_dimension is None else min(fit, max_dimension)
+
+
+def target_dimension_for_image(size: str, model: str) -> int | None:
+    """
+    Longest reference edge worth uploading for an image generation ``size``
+    such as ``2048x2048``. Returns ``None`` when resizing is disabled.
+    """
+    if not AUTO_RESIZE:
+        return None
+    model_max = max_input_dimension(model)
+    try:
+        width, height = (int(part) for part in size.lower().split("x", 1))
+    except ValueError:
+        return model_max
+    return min(model_max, max(width, height))
+
+
+def target_dimension_for_video(resolution: str, model: str) -> int | None:
+    """
+    Longest reference edge worth uploading for a video ``resolution`` such as
+    ``720p``. Returns ``None`` when resizing is disabled.
+    """
+    if not AUTO_RESIZE:
+        return None
+    model_max = max_input_dimension(model)
+    return min(model_max, VIDEO_RESOLUTION_LONG_EDGE.get(resolution, model_max))
+
+
+def _downscale(image: Image.Image, max_dimension: int) -> Image.Image:
+    # thumbnail() calls draft() first, so JPEG sources are decoded straight
+    # at 1/2, 1/4 or 1/8 scale, and reducing_gap lets it use the cheap
+    # box reduce() before the final Lanczos pass.
+    if image.mode in ("1", "P"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+    image.thumbnail(
+        (max_dimension, max_dimension), Image.Resampling.LANCZOS, reducing_gap=2.0
+    )
+    return image
+
+
+def _flatten(image: Image.Image) -> Image.Image:
+    if image.mode == "P":
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+    if image.mode in ("RGBA", "LA"):
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    if image.mode not in PASSTHROUGH_MODES:
+        return image.convert("RGB")
+    return image
+
+
+def _choose_format(source_format: str, width: int, height: int, max_bytes: int) -> str:
+    # Lossless output for a lossy source only adds bytes. For lossless sources
+    # PNG stays within the raw pixel size, so anything whose raw RGB buffer
+    # exceeds the limit goes straight to JPEG instead of encoding PNG first
+    # and retrying.
+    if source_format in LOSSY_FORMATS:
+        return "JPEG"
+    if width * height * 3 > max_bytes:
+        return "JPEG"
+    return "PNG"
+
+
+def encode_image(
+    image_bytes: bytes,
+    max_bytes: int = DEFAULT_MAX_IMAGE_BYTES,
+    max_dimension: int | None = None,
+    limits: ImageLimits | None = None,
+) -> EncodedImage:
+    """
+    Prepare an image for upload to Ark in at most one encode pass.
+
+    The header is checked first (see ``validate_image``), so a bad input
+    fails before any pixel is decoded. ``max_bytes`` limits the bytes sent;
+    input above it is only accepted when a downscale is planned, up to
+    ``MAX_INPUT_IMAGE_BYTES``. JPEG, PNG and WebP inputs that are
+    already RGB/greyscale and upright, within ``max_bytes`` and no larger
+    than ``max_dimension`` or the model's ``limits`` are returned untouched.
+    Everything else is downscaled if needed, turned upright, flattened onto
+    a white background and encoded once, with the reported MIME type
+    matching the bytes actually produced. Re-encoded results are cached by
+    content hash, so a repeated reference skips everything but the header
+    probe; rejected and untouched inputs are never hashed.
+    """
+    input_cap = max(max_bytes, MAX_INPUT_IMAGE_BYTES)
+    if len(image_bytes) > input_cap:
+        raise ValueError(f"输入图片大小超过{input_cap // 1024 // 1024}MB限制")
+
+    info = probe_image(image_bytes)
+    validate_image(info, limits)
+    max_dimension = _fit_dimension(info, limits, max_dimension)
+    needs_resize = max_dimension is not None and max(info.width, info.height) > max_dimension
+    if not needs_resize and len(image_bytes) > max_bytes:
+        raise ValueError(f"输入图片大小超过{max_bytes // 1024 // 1024}MB限制")
+    if (
+        not needs_resize
+        and info.orientation == 1
+        and info.format in PASSTHROUGH_FORMATS
+        and info.mode in PASSTHROUGH_MODES
+    ):
+        return EncodedImage(data=image_bytes, mime_type=PASSTHROUGH_FORMATS[info.format])
+
+    # Only inputs that get re-encoded pay for hashing. max_dimension already
+    # reflects the model's limits at this point.
+    cache_key = content_key(image_bytes, max_bytes, max_dimension)
+    cached = image_cache.get(cache_key)
+    if cached is not None:
+        return EncodedImage(data=cached[0], mime_type=cached[1])
+
+    with Image.open(BytesIO(image_bytes)) as image:
+        if needs_resize:
+            image = _downscale(image, max_dimension)
+        if info.orientation != 1:
+            # Applied after the downscale, on fewer pixels. The output is
+            # saved without EXIF, so it has to be upright.
+            image = image.transpose(ORIENTATION_TRANSPOSE[info.orientation])
+        image = _flatten(image)
+        output_format = _choose_format(info.format, image.width, image.height, max_bytes)
+        buffer = BytesIO()
+        if output_format == "JPEG":
+            image.save(buffer, format="JPEG", quality=JPEG_QUALITY)
+        else:
+            image.save(buffer, format="PNG")
+    if buffer.tell() > max_bytes:
+        raise ValueError(
+            f"处理后的图片大小 {buffer.tell() / 1024 / 1024:.1f}MB "
+            f"超过{max_bytes // 1024 // 1024}MB限制"
+        )
+
+    logger.debug(
+        "Re-encoded %s %s %sx%s image as %s %sx%s (%d -> %d bytes)",
+        info.format,
+        info.mode,
+        info.width,
+        info.height,
+        output_format,
+        image.width,
+        image.height,
+        len(image_bytes),
+        buffer.tell(),
+    )
+    # getbuffer() exposes the encoder's output without the copy getvalue()
+    # would make; the cache and the request body share this one buffer.
+    encoded = EncodedImage(
+        data=buffer.getbuffer(),
+        mime_type="image/jpeg" if output_format == "JPEG" else "image/png",
+    )
+    image_cache.put(cache_key, encoded.data, encoded.mime_type)
+    return encoded
+
+
+def encode_image_file(
+    input_image_file: Any,
+    max_bytes: int = DEFAULT_MAX_IMAGE_BYTES,
+    max_dimension: int | None = None,
+    limits: ImageLimits | None = None,
+) -> EncodedImage:
+    return run_cpu(
+        encode_image, read_image_bytes(input_image_file), max_bytes, max_dimension, limits
+    )
+
+
+def encode_all(
+    items: Sequence[Any],
+    encoder: Callable[[Any], T],
+    reader: Callable[[Any], Any] | None = None,
+) -> list[T]:
+    """
+    Run ``encoder`` over ``items`` on the shared pool, preserving order.
+
+    ``reader`` runs first, sequentially in the calling greenlet, so any I/O
+    such as fetching a Dify file blob stays off the worker threads; only the
+    CPU-bound ``encoder`` is parallelised. Stops at the first failure:
+    pending items are cancelled and ``ImageEncodeError`` is raised with the
+    index of the failing item.
+    """
+    if reader is not None:
+        loaded = []
+        for index, item in enumerate(items):
+            try:
+                loaded.append(reader(item))
+            except Exception as e:
+                raise ImageEncodeError(index, e) from e
+        items = loaded
+
+    # Under gevent even a single item goes to the pool so the hub stays free
+    # for other invocations while Pillow runs.
+    if not is_cooperative() and (len(items) <= 1 or CPU_WORKERS <= 1):
+        results = []
+        for index, item in enumerate(items):
+            try:
+                results.append(encoder(item))
+            except Exception as e:
+                raise ImageEncodeError(index, e) from e
+        return results
+
+    executor = cpu_executor()
+    futures = {
+        executor.submit(capture, encoder, item): index
+        for index, item in enumerate(items)
+    }
+    results: list[Any] = [None] * len(items)
+    for future in as_completed(futures):
+        ok, value = future.result()
+        if not ok:
+            for other in futures:
+                other.cancel()
+            raise ImageEncodeError(futures[future], value) from value
+        results[futures[future]] = value
+    return results
+
+
+def encode_image_files_to_data_urls(
+    input_image_files: Sequence[Any],
+    max_bytes: int = DEFAULT_MAX_IMAGE_BYTES,
+    max_dimension: int | None = None,
+    limits: ImageLimits | None = None,
+) -> list[DataUrl]:
+    return encode_all(
+        input_image_files,
+        lambda image_bytes: encode_image(
+            image_bytes, max_bytes, max_dimension, limits
+        ).to_data_url(),
+        reader=read_image_bytes,
+    )
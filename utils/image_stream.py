@@ -0,0 +1,101 @@
+# author: sawyer-shi
+
+import json
+import logging
+from collections.abc import Generator
+from typing import Any
+
+import requests
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from utils.image_output import OUTPUT_MODE_URL, emit_image
+
+logger = logging.getLogger(__name__)
+
+EVENT_PARTIAL_SUCCEEDED = "image_generation.partial_succeeded"
+EVENT_PARTIAL_FAILED = "image_generation.partial_failed"
+EVENT_COMPLETED = "image_generation.completed"
+
+
+def iter_sse_events(response: requests.Response) -> Generator[dict[str, Any], None, None]:
+    """
+    Decode the ``data:`` lines of an Ark server-sent event stream.
+    """
+    data_lines: list[str] = []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if line == "":
+            if data_lines:
+                data = "\n".join(data_lines)
+                data_lines = []
+                if data.strip() == "[DONE]":
+                    return
+                try:
+                    yield json.loads(data)
+                except json.JSONDecodeError as e:
+                    logger.error("Failed to parse SSE event: %s - %s", str(e), data[:300])
+            continue
+        if line.startswith("data:"):
+            data_lines.append(line[5:].lstrip())
+
+    if data_lines:
+        data = "\n".join(data_lines)
+        if data.strip() != "[DONE]":
+            try:
+                yield json.loads(data)
+            except json.JSONDecodeError as e:
+                logger.error("Failed to parse SSE event: %s - %s", str(e), data[:300])
+
+
+def relay_image_stream(
+    tool: Tool, response: requests.Response, output_mode: str = OUTPUT_MODE_URL
+) -> Generator[ToolInvokeMessage, None, int]:
+    """
+    Forward each image from a streaming ``/images/generations`` response as
+    soon as its event arrives, in the given output mode (see
+    :mod:`utils.image_output`). Returns the number of images delivered.
+    """
+    image_count = 0
+    for event in iter_sse_events(response):
+        event_type = event.get("type")
+
+        if event_type == EVENT_PARTIAL_SUCCEEDED:
+            index = event.get("image_index", image_count)
+            image_size_text = event.get("size", "")
+
+            if not event.get("url") and not event.get("b64_json"):
+                yield tool.create_text_message(f"❌ 未获取到第 {index + 1} 张图片的数据")
+                continue
+
+            image_bytes_size = yield from emit_image(tool, event, output_mode)
+
+            info_text = f"✅ 第 {index + 1} 张图片生成完成！\n"
+            if image_size_text:
+                info_text += f"📐 尺寸: {image_size_text}\n"
+            if image_bytes_size is not None:
+                info_text += f"💾 大小: {image_bytes_size / 1024 / 1024:.2f} MB"
+
+            yield tool.create_text_message(info_text.rstrip())
+            image_count += 1
+
+        elif event_type == EVENT_PARTIAL_FAILED:
+            index = event.get("image_index", image_count)
+            error = event.get("error") or {}
+            message = error.get("message") if isinstance(error, dict) else str(error)
+            yield tool.create_text_message(f"❌ 第 {index + 1} 张图片生成失败: {message}")
+
+        elif event_type == EVENT_COMPLETED:
+            usage = event.get("usage")
+            if isinstance(usage, dict) and usage:
+                yield tool.create_text_message("📊 使用统计:")
+                for key, value in usage.items():
+                    yield tool.create_text_message(f"  - {key}: {value}")
+
+        elif event.get("error"):
+            error = event["error"]
+            message = error.get("message") if isinstance(error, dict) else str(error)
+            yield tool.create_text_message(f"❌ 生成失败: {message}")
+
+    return image_count
@@ -0,0 +1,49 @@
+# author: sawyer-shi
+
+import json
+from typing import Any
+
+from utils.request_body import DataUrl
+
+MAX_LOGGED_STRING_LENGTH = 200
+
+
+def summarize_payload(value: Any) -> Any:
+    """
+    Return a copy of a request payload that is safe to log.
+
+    Inline ``data:`` URLs are replaced by their media type and decoded size
+    and other long strings are truncated, so the structure stays visible
+    without writing megabytes of base64 into the log.
+    """
+    if isinstance(value, dict):
+        return {key: summarize_payload(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [summarize_payload(item) for item in value]
+    if isinstance(value, DataUrl):
+        return f"<{value.header.rstrip(',')}, {value.size / 1024 / 1024:.2f} MB>"
+    if isinstance(value, str):
+        if value.startswith("data:"):
+            header, _, data = value.partition(",")
+            size_mb = len(data) * 3 / 4 / 1024 / 1024
+            return f"<{header}, {size_mb:.2f} MB>"
+        if len(value) > MAX_LOGGED_STRING_LENGTH:
+            return f"{value[:MAX_LOGGED_STRING_LENGTH]}...<{len(value)} chars>"
+    return value
+
+
+class RedactedPayload:
+    """
+    Log argument that summarises a payload only when the record is emitted.
+
+    Pass it as a ``%s`` argument so the summary is skipped entirely when the
+    log level is disabled.
+    """
+
+    __slots__ = ("payload",)
+
+    def __init__(self, payload: Any) -> None:
+        self.payload = payload
+
+    def __str__(self) -> str:
+        return json.dumps(summarize_payload(self.payload), ensure_ascii=False)
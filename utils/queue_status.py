@@ -0,0 +1,71 @@
+# author: sawyer-shi
+
+from collections.abc import Generator
+
+import requests
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from utils.dedup import REUSE_CACHED
+from utils.rate_limit import PROFILE_ENDPOINTS, get_limiter
+
+ENDPOINT_LABELS = {
+    "images": "图像生成",
+    "task_submit": "视频任务提交",
+    "task_query": "视频任务查询",
+}
+
+# Queue waits shorter than this are not worth a message.
+QUEUE_REPORT_MIN_WAIT = 0.5
+
+
+def announce_queue(
+    tool: Tool, api_key: str, profile: str
+) -> Generator[ToolInvokeMessage, None, None]:
+    """Tell the user up front when the next call on ``profile`` will queue."""
+    limiter = get_limiter(api_key, profile)
+    if limiter is None or not limiter.busy():
+        return
+    waiting, active = limiter.snapshot()
+    label = ENDPOINT_LABELS[PROFILE_ENDPOINTS[profile]]
+    yield tool.create_text_message(
+        f"🚦 {label}请求较多，正在排队（排队中 {waiting} 个，进行中 {active} 个）..."
+    )
+
+
+def report_queue_wait(
+    tool: Tool, response: requests.Response
+) -> Generator[ToolInvokeMessage, None, None]:
+    """Report how long a call queued, see ``ArkClient.request``."""
+    waited = getattr(response, "queue_wait", 0.0)
+    if waited >= QUEUE_REPORT_MIN_WAIT:
+        yield tool.create_text_message(f"⏱️ 排队等待 {waited:.1f} 秒")
+
+
+def report_reuse(
+    tool: Tool, response: requests.Response
+) -> Generator[ToolInvokeMessage, None, None]:
+    """Say when a deduplicated call reused another call's result."""
+    reused = getattr(response, "reused", None)
+    if reused == REUSE_CACHED:
+        yield tool.create_text_message("♻️ 相同请求刚刚已生成过，直接复用之前的结果")
+    elif reused:
+        yield tool.create_text_message("♻️ 相同请求正在进行中，已合并为同一次生成")
+
+
+def report_assets(
+    tool: Tool, response: requests.Response
+) -> Generator[ToolInvokeMessage, None, None]:
+    """Say how much reference media was sent as uploaded assets, see ``utils.assets``."""
+    stats = getattr(response, "asset_stats", None)
+    if not stats or not stats["hashes"]:
+        return
+    parts = []
+    if stats["reused"]:
+        parts.append(f"复用 {stats['reused']} 个")
+    if stats["uploaded"]:
+        parts.append(f"新上传 {stats['uploaded']} 个")
+    yield tool.create_text_message(
+        f"📎 参考素材已改用素材引用（{'，'.join(parts)}），"
+        f"请求体减少约 {stats['bytes_saved'] / 1024 / 1024:.1f} MB"
+    )
@@ -0,0 +1,170 @@
+# author: sawyer-shi
+
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from utils.api_keys import api_key_id
+from utils.env import env_float, env_int
+
+# Shared budgets per API key and endpoint group: requests per minute and
+# requests in flight. Calls over budget wait their turn instead of failing
+# on Ark's quota. 0 disables a limit.
+ENDPOINT_LIMITS: dict[str, tuple[float, int]] = {
+    "images": (
+        env_float("ARK_RPM_IMAGES", 500),
+        env_int("ARK_CONCURRENCY_IMAGES", 16),
+    ),
+    "task_submit": (
+        env_float("ARK_RPM_TASK_SUBMIT", 600),
+        env_int("ARK_CONCURRENCY_TASK_SUBMIT", 16),
+    ),
+    "task_query": (
+        env_float("ARK_RPM_TASK_QUERY", 1200),
+        env_int("ARK_CONCURRENCY_TASK_QUERY", 32),
+    ),
+}
+
+# Timeout profile -> endpoint group. Downloads of signed result links do not
+# count against Ark's API quota.
+PROFILE_ENDPOINTS = {
+    "text_to_image": "images",
+    "image_edit": "images",
+    "task_submit": "task_submit",
+    "task_query": "task_query",
+    "credential_check": "task_query",
+}
+
+
+class TokenBucket:
+    """
+    Blocking token bucket refilled at ``rate_per_minute`` with room for
+    ``burst`` requests.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int | None = None) -> None:
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+        self.configure(rate_per_minute, burst)
+        self._tokens = float(self._burst)
+
+    def configure(self, rate_per_minute: float, burst: int | None = None) -> None:
+        with self._lock:
+            self._rate = max(rate_per_minute, 0.0) / 60.0
+            self._burst = max(1, burst if burst is not None else int(rate_per_minute) or 1)
+            self._tokens = min(self._tokens, float(self._burst))
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(float(self._burst), self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def available(self) -> float:
+        """Tokens that could be taken right now."""
+        with self._lock:
+            if self._rate <= 0:
+                return float(self._burst)
+            self._refill(time.monotonic())
+            return self._tokens
+
+    def acquire(self) -> float:
+        """
+        Take one token, sleeping until one is available. Returns the number of
+        seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                if self._rate <= 0:
+                    return waited
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self._rate
+            time.sleep(delay)
+            waited += delay
+
+
+class EndpointLimiter:
+    """
+    Rate and concurrency budget for one endpoint group of one API key.
+
+    :meth:`slot` waits for a free in-flight slot and then for a rate token,
+    and keeps count of callers still queued so tools can report it.
+    """
+
+    def __init__(self, rate_per_minute: float, max_concurrent: int) -> None:
+        self._bucket = TokenBucket(rate_per_minute) if rate_per_minute > 0 else None
+        self._max_concurrent = max_concurrent
+        self._slots = threading.Semaphore(max_concurrent) if max_concurrent > 0 else None
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._active = 0
+
+    def snapshot(self) -> tuple[int, int]:
+        """Return ``(queued, in flight)``."""
+        with self._lock:
+            return self._waiting, self._active
+
+    def busy(self) -> bool:
+        """Whether a new call would have to wait."""
+        with self._lock:
+            if self._waiting:
+                return True
+            if self._max_concurrent > 0 and self._active >= self._max_concurrent:
+                return True
+        return self._bucket is not None and self._bucket.available() < 1
+
+    @contextmanager
+    def slot(self) -> Iterator[float]:
+        """Hold one in-flight slot; yields the seconds spent queuing."""
+        started = time.monotonic()
+        with self._lock:
+            self._waiting += 1
+        try:
+            if self._slots is not None:
+                self._slots.acquire()
+            try:
+                if self._bucket is not None:
+                    self._bucket.acquire()
+            except BaseException:
+                if self._slots is not None:
+                    self._slots.release()
+                raise
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        with self._lock:
+            self._active += 1
+        try:
+            yield time.monotonic() - started
+        finally:
+            with self._lock:
+                self._active -= 1
+            if self._slots is not None:
+                self._slots.release()
+
+
+_limiters: dict[tuple[str, str], EndpointLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(api_key: str, profile: str) -> EndpointLimiter | None:
+    """
+    Return the process-wide limiter for the endpoint group behind a timeout
+    profile and this API key, or ``None`` if the profile is not limited.
+    """
+    endpoint = PROFILE_ENDPOINTS.get(profile)
+    if endpoint is None:
+        return None
+    limiter_key = (api_key_id(api_key), endpoint)
+    with _limiters_lock:
+        limiter = _limiters.get(limiter_key)
+        if limiter is None:
+            limiter = EndpointLimiter(*ENDPOINT_LIMITS[endpoint])
+            _limiters[limiter_key] = limiter
+    return limiter
+
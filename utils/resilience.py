@@ -0,0 +1,161 @@
+# author: sawyer-shi
+
+import email.utils
+import logging
+import random
+import threading
+import time
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from utils.env import env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+RETRY_MAX_ATTEMPTS = max(1, env_int("ARK_RETRY_MAX_ATTEMPTS", 3))
+RETRY_BASE_DELAY = env_float("ARK_RETRY_BASE_DELAY", 0.5)
+RETRY_MAX_DELAY = env_float("ARK_RETRY_MAX_DELAY", 8)
+# A Retry-After longer than this is not waited out; the response is returned.
+RETRY_AFTER_MAX = env_float("ARK_RETRY_AFTER_MAX", 30)
+
+BREAKER_FAILURE_THRESHOLD = env_int("ARK_BREAKER_FAILURE_THRESHOLD", 5)
+BREAKER_RESET_TIMEOUT = env_float("ARK_BREAKER_RESET_TIMEOUT", 30)
+
+# Statuses worth retrying for reads. A create request (task submit, image
+# generation) is only retried when Ark has clearly not acted on it: it was
+# throttled or refused by an overloaded service. A generic 500, a gateway
+# error or a read timeout may hide a paid task that was in fact created, so
+# those are never resent.
+IDEMPOTENT_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+CREATE_RETRY_STATUSES = frozenset({429, 503})
+# Statuses that count against the circuit breaker. Throttling is not an
+# outage, so 429 is left out.
+DEGRADED_STATUSES = frozenset({500, 502, 503, 504})
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling Ark while the circuit breaker is open."""
+
+    def __init__(self, name: str, retry_in: float) -> None:
+        super().__init__(
+            f"火山方舟服务暂时不可用（{name} 连续失败），请 {max(1, round(retry_in))} 秒后重试"
+        )
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After ``failure_threshold`` failures in a row the circuit opens and calls
+    fail immediately with :class:`CircuitOpenError` for ``reset_timeout``
+    seconds. Then a single trial call is let through: success closes the
+    circuit, failure opens it again. A threshold of 0 disables the breaker.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = BREAKER_RESET_TIMEOUT,
+    ) -> None:
+        self.name = name
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._trial_running = False
+
+    def before_call(self) -> bool:
+        """
+        :returns: ``True`` when this call is the trial of a half-open circuit.
+        :raises CircuitOpenError: while the circuit is open.
+        """
+        if self._failure_threshold <= 0:
+            return False
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            remaining = self._opened_at + self._reset_timeout - time.monotonic()
+            if remaining > 0 or self._trial_running:
+                raise CircuitOpenError(self.name, max(remaining, 1.0))
+            self._trial_running = True
+            return True
+
+    def record(self, success: bool, trial: bool) -> None:
+        if self._failure_threshold <= 0:
+            return
+        with self._lock:
+            if trial:
+                self._trial_running = False
+            if success:
+                if self._opened_at is not None:
+                    logger.info("Circuit %s closed", self.name)
+                self._failures = 0
+                self._opened_at = None
+                return
+            self._failures += 1
+            if trial or self._failures >= self._failure_threshold:
+                if self._opened_at is None or trial:
+                    logger.warning(
+                        "Circuit %s opened after %d failures", self.name, self._failures
+                    )
+                self._opened_at = time.monotonic()
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name)
+            _breakers[name] = breaker
+    return breaker
+
+
+def retry_after_seconds(response: requests.Response) -> float | None:
+    """Parse ``Retry-After`` given either in seconds or as an HTTP date."""
+    value = response.headers.get("Retry-After", "").strip()
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for the given retry number (1-based)."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+
+
+def _connection_refused(error: requests.exceptions.RequestException) -> bool:
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def is_retryable_error(error: requests.exceptions.RequestException, idempotent: bool) -> bool:
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, requests.exceptions.ConnectTimeout) or _connection_refused(error):
+        # Never reached the server.
+        return True
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        # A reset or read timeout may come after the server acted on it.
+        return idempotent
+    return False
+
+
+def is_degraded_error(error: requests.exceptions.RequestException) -> bool:
+    return isinstance(
+        error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+    ) and not isinstance(error, CircuitOpenError)
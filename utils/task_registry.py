@@ -0,0 +1,510 @@
+# author: sawyer-shi
+
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import requests
+
+from utils.api_keys import api_key_id
+from utils.concurrency import capture
+from utils.env import env_bool, env_float, env_int
+from utils.video_tasks import (
+    MAX_LIST_PAGE_SIZE,
+    POLL_BACKOFF_FACTOR,
+    TERMINAL_STATUSES,
+    VideoTaskError,
+    fetch_task,
+    fetch_tasks,
+    signed_url_expiry,
+)
+
+logger = logging.getLogger(__name__)
+
+STORAGE_KEY_PREFIX = "seedance_video_tasks"
+
+# Records kept per API key. The plugin's storage quota is 1 MB in total, so
+# the persisted copy is also capped in bytes.
+REGISTRY_MAX_TASKS = env_int("ARK_TASK_REGISTRY_MAX_TASKS", 200)
+REGISTRY_MAX_BYTES = env_int("ARK_TASK_REGISTRY_MAX_KB", 256) * 1024
+# A non-terminal status younger than this is answered without asking Ark.
+STATUS_MAX_AGE = env_float("ARK_TASK_STATUS_MAX_AGE", 15)
+# Finished results are reused until their signed video link is about to
+# expire. Links without a readable expiry fall back to a fixed age.
+RESULT_URL_EXPIRY_MARGIN = env_float("ARK_TASK_RESULT_EXPIRY_MARGIN", 300)
+RESULT_MAX_AGE = env_float("ARK_TASK_RESULT_MAX_AGE", 12 * 3600)
+
+REFRESH_ENABLED = env_bool("ARK_TASK_REFRESH_ENABLED", True)
+REFRESH_MIN_INTERVAL = env_float("ARK_TASK_REFRESH_MIN_INTERVAL", 5)
+REFRESH_MAX_INTERVAL = env_float("ARK_TASK_REFRESH_MAX_INTERVAL", 60)
+REFRESH_BATCH_SIZE = min(
+    MAX_LIST_PAGE_SIZE, max(1, env_int("ARK_TASK_REFRESH_BATCH_SIZE", 50))
+)
+# Tasks still pending after this long are left to explicit queries.
+REFRESH_GIVE_UP_SECONDS = 24 * 3600
+
+PARAMETER_TEXT_LIMIT = 200
+
+# Task fields kept in a record, in Ark's shape so tools can report a stored
+# task like a fresh one. Everything else in the task body is dropped.
+TASK_FIELDS = (
+    "id",
+    "model",
+    "status",
+    "error",
+    "seed",
+    "resolution",
+    "ratio",
+    "duration",
+    "frames",
+    "framespersecond",
+    "usage",
+    "created_at",
+    "updated_at",
+)
+TASK_CONTENT_FIELDS = ("video_url", "last_frame_url")
+
+
+def _compact_parameters(parameters: dict[str, Any]) -> dict[str, Any]:
+    """Keep the scalar tool parameters; files and long text are dropped or cut."""
+    compact: dict[str, Any] = {}
+    for name, value in parameters.items():
+        if isinstance(value, str):
+            compact[name] = value[:PARAMETER_TEXT_LIMIT]
+        elif isinstance(value, (bool, int, float)) or value is None:
+            compact[name] = value
+    return compact
+
+
+def _compact_task(data: dict[str, Any]) -> dict[str, Any]:
+    task = {name: data[name] for name in TASK_FIELDS if data.get(name) is not None}
+    content = data.get("content") or {}
+    content = {
+        name: content[name] for name in TASK_CONTENT_FIELDS if content.get(name) is not None
+    }
+    if content:
+        task["content"] = content
+    return task
+
+
+def _checked_at(record: dict[str, Any]) -> float:
+    return record.get("checked_at") or record.get("submitted_at") or 0
+
+
+def _is_pending(record: dict[str, Any]) -> bool:
+    return record.get("status") not in TERMINAL_STATUSES
+
+
+def _result_valid(record: dict[str, Any], now: float) -> bool:
+    """A finished result stays valid as long as its video link does."""
+    video_url = ((record.get("task") or {}).get("content") or {}).get("video_url")
+    if not video_url:
+        # Failed, cancelled and expired tasks never change again.
+        return True
+    expires_at = signed_url_expiry(video_url)
+    if expires_at is not None:
+        return now < expires_at - RESULT_URL_EXPIRY_MARGIN
+    return now - record["checked_at"] <= RESULT_MAX_AGE
+
+
+class TaskRegistry:
+    """
+    Process-wide record of submitted video tasks, mirrored per API key into
+    the plugin's persistent storage.
+
+    Storage can only be reached from inside an invocation, so tools call
+    :meth:`load` before reading and :meth:`save` after changing records.
+    Records hold a compact copy of the task, and only submissions and status
+    changes make a key's records worth writing back. A background
+    refresher keeps pending tasks current between invocations by polling
+    them in batches through the task list endpoint, backing off while a
+    task's status does not change.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        # key id -> task id -> record; dicts keep submission order.
+        self._records: dict[str, dict[str, dict[str, Any]]] = {}
+        # Refresh schedule, never persisted: (key id, task id) -> (due, interval)
+        self._schedule: dict[tuple[str, str], tuple[float, float]] = {}
+        # API keys are kept in memory only, for the refresher.
+        self._api_keys: dict[str, str] = {}
+        self._loaded: set[str] = set()
+        self._dirty: set[str] = set()
+        self._refresher: threading.Thread | None = None
+
+    @staticmethod
+    def _storage_key(key_id: str) -> str:
+        return f"{STORAGE_KEY_PREFIX}:{key_id}"
+
+    def load(self, session: Any, api_key: str) -> None:
+        """Merge the stored records for this key on first use in the process."""
+        key_id = api_key_id(api_key)
+        with self._lock:
+            self._api_keys[key_id] = api_key
+            if key_id in self._loaded:
+                return
+            self._loaded.add(key_id)
+
+        stored = self._read_stored(session, key_id)
+        if stored is None:
+            return
+        with self._lock:
+            self._merge_locked(key_id, stored)
+            self._trim_locked(key_id)
+        logger.info("Loaded %d video task records from storage", len(stored))
+        self._ensure_refresher()
+
+    def _read_stored(self, session: Any, key_id: str) -> list[dict[str, Any]] | None:
+        storage = getattr(session, "storage", None)
+        if storage is None:
+            return None
+        try:
+            if not storage.exist(self._storage_key(key_id)):
+                return None
+            return json.loads(storage.get(self._storage_key(key_id))).get("tasks", [])
+        except Exception as e:
+            logger.warning("Could not load the video task registry: %s", str(e))
+            return None
+
+    def _merge_locked(self, key_id: str, stored: list[dict[str, Any]]) -> None:
+        """Take every stored record that is newer than the one held here."""
+        records = self._records.setdefault(key_id, {})
+        for record in stored:
+            task_id = record.get("task_id")
+            if not task_id:
+                continue
+            current = records.get(task_id)
+            if current is not None and _checked_at(current) >= _checked_at(record):
+                continue
+            if record.get("task"):
+                # Older versions stored the full task body.
+                record["task"] = _compact_task(record["task"])
+            records[task_id] = record
+            if _is_pending(record):
+                self._schedule_locked(key_id, task_id, REFRESH_MIN_INTERVAL)
+
+    def save(self, session: Any, api_key: str) -> None:
+        """
+        Write this key's records back to storage if they changed.
+
+        The stored copy is read again and merged first, so records written
+        by another plugin process in the meantime are kept. Storage has no
+        compare-and-set, so two processes saving at the same moment can
+        still overwrite each other; the last writer wins.
+        """
+        key_id = api_key_id(api_key)
+        self.load(session, api_key)
+        with self._lock:
+            if key_id not in self._dirty:
+                return
+        stored = self._read_stored(session, key_id)
+        with self._lock:
+            self._dirty.discard(key_id)
+            if stored:
+                self._merge_locked(key_id, stored)
+            self._trim_locked(key_id)
+            body = json.dumps(
+                {"tasks": list(self._records.get(key_id, {}).values())},
+                ensure_ascii=False,
+                separators=(",", ":"),
+            ).encode("utf-8")
+
+        storage = getattr(session, "storage", None)
+        if storage is None:
+            return
+        try:
+            storage.set(self._storage_key(key_id), body)
+        except Exception as e:
+            logger.warning("Could not save the video task registry: %s", str(e))
+            with self._lock:
+                self._dirty.add(key_id)
+
+    def _trim_locked(self, key_id: str) -> None:
+        records = self._records.get(key_id)
+        if not records:
+            return
+
+        def drop_oldest() -> str:
+            # Finished tasks go first; pending ones are dropped only when
+            # nothing else is left.
+            victim = next(
+                (task_id for task_id, record in records.items() if not _is_pending(record)),
+                next(iter(records)),
+            )
+            del records[victim]
+            self._schedule.pop((key_id, victim), None)
+            return victim
+
+        while len(records) > max(1, REGISTRY_MAX_TASKS):
+            drop_oldest()
+        sizes = {
+            task_id: len(json.dumps(record, ensure_ascii=False)) + 1
+            for task_id, record in records.items()
+        }
+        size = sum(sizes.values())
+        while len(records) > 1 and size > REGISTRY_MAX_BYTES:
+            size -= sizes[drop_oldest()]
+
+    def record_submission(
+        self,
+        api_key: str,
+        task_id: str,
+        tool: str,
+        model: str,
+        parameters: dict[str, Any],
+    ) -> None:
+        key_id = api_key_id(api_key)
+        with self._lock:
+            self._api_keys[key_id] = api_key
+            records = self._records.setdefault(key_id, {})
+            records[task_id] = {
+                "task_id": task_id,
+                "tool": tool,
+                "model": model,
+                "parameters": _compact_parameters(parameters),
+                "submitted_at": time.time(),
+                "status": "submitted",
+                "checked_at": None,
+                "task": None,
+            }
+            self._schedule_locked(key_id, task_id, REFRESH_MIN_INTERVAL)
+            self._dirty.add(key_id)
+            self._trim_locked(key_id)
+        self._ensure_refresher()
+
+    def observe(self, api_key: str, data: dict[str, Any], adopt: bool = True) -> None:
+        """
+        Record task data fetched from Ark. Unknown tasks are adopted unless
+        ``adopt`` is false, in which case only known records are updated.
+        """
+        key_id = api_key_id(api_key)
+        with self._lock:
+            self._api_keys[key_id] = api_key
+            self._observe_locked(key_id, data, time.time(), adopt)
+        self._ensure_refresher()
+
+    def _observe_locked(
+        self, key_id: str, data: dict[str, Any], now: float, adopt: bool = True
+    ) -> None:
+        task_id = data.get("id")
+        if not task_id:
+            return
+        records = self._records.setdefault(key_id, {})
+        record = records.get(task_id)
+        if record is None:
+            if not adopt:
+                return
+            record = {
+                "task_id": task_id,
+                "tool": None,
+                "model": data.get("model"),
+                "parameters": {},
+                "submitted_at": data.get("created_at") or now,
+                "status": None,
+                "checked_at": None,
+                "task": None,
+            }
+            records[task_id] = record
+
+        status = data.get("status")
+        changed = status != record.get("status")
+        record.update(status=status, checked_at=now, task=_compact_task(data))
+        if record.get("model") is None:
+            record["model"] = data.get("model")
+        if changed:
+            # A newer check alone is not worth a storage write.
+            self._dirty.add(key_id)
+
+        if not _is_pending(record):
+            self._schedule.pop((key_id, task_id), None)
+            return
+        _, interval = self._schedule.get((key_id, task_id), (0.0, REFRESH_MIN_INTERVAL))
+        if changed:
+            interval = REFRESH_MIN_INTERVAL
+        else:
+            interval = min(REFRESH_MAX_INTERVAL, interval * POLL_BACKOFF_FACTOR)
+        self._schedule_locked(key_id, task_id, interval)
+
+    def _schedule_locked(self, key_id: str, task_id: str, interval: float) -> None:
+        self._schedule[(key_id, task_id)] = (time.monotonic() + interval, interval)
+
+    def lookup(self, api_key: str, task_id: str) -> tuple[dict[str, Any], float] | None:
+        """
+        Return ``(task data, age in seconds)`` when the registry can answer
+        for the task: it is finished and its video link is still valid, or
+        its status was checked within ``STATUS_MAX_AGE``. Finished results
+        are reused least-recently-used first out when the registry is trimmed.
+        """
+        now = time.time()
+        with self._lock:
+            records = self._records.get(api_key_id(api_key), {})
+            record = records.get(task_id)
+            if record is None or not record.get("task") or not record.get("checked_at"):
+                return None
+            age = max(0.0, now - record["checked_at"])
+            if _is_pending(record):
+                if age > STATUS_MAX_AGE:
+                    return None
+            else:
+                if not _result_valid(record, now):
+                    return None
+                # Keep recently read results away from the trimmed end.
+                records[task_id] = records.pop(task_id)
+            return dict(record["task"]), age
+
+    def query_many(
+        self,
+        api_key: str,
+        task_ids: list[str],
+        max_concurrency: int = 4,
+        use_registry: bool = True,
+    ) -> tuple[dict[str, dict[str, Any]], dict[str, str]]:
+        """
+        Current data for several tasks. Answers the registry can give come
+        first, then one list query per ``REFRESH_BATCH_SIZE`` ids, then
+        parallel single-task queries for any id the list did not return.
+
+        :returns: ``(task data by id, error message by id)``.
+        """
+        found: dict[str, dict[str, Any]] = {}
+        errors: dict[str, str] = {}
+        stale = []
+        for task_id in task_ids:
+            cached = self.lookup(api_key, task_id) if use_registry else None
+            if cached is not None:
+                found[task_id] = cached[0]
+            else:
+                stale.append(task_id)
+
+        for start in range(0, len(stale), REFRESH_BATCH_SIZE):
+            batch = stale[start:start + REFRESH_BATCH_SIZE]
+            try:
+                items = fetch_tasks(api_key, batch)
+            except (requests.exceptions.RequestException, VideoTaskError) as e:
+                logger.warning("Listing %d video tasks failed: %s", len(batch), str(e))
+                continue
+            for data in items:
+                if data.get("id") in batch:
+                    found[data["id"]] = data
+
+        missing = [task_id for task_id in stale if task_id not in found]
+        if missing:
+            workers = max(1, min(max_concurrency, len(missing)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                outcomes = executor.map(
+                    lambda task_id: capture(fetch_task, api_key, task_id), missing
+                )
+                for task_id, (ok, value) in zip(missing, outcomes):
+                    if ok:
+                        found[task_id] = value
+                    else:
+                        errors[task_id] = str(value)
+
+        for task_id in stale:
+            if task_id in found:
+                self.observe(api_key, found[task_id])
+        return found, errors
+
+    def pending_task_ids(self, api_key: str) -> list[str]:
+        """Ids of recorded tasks that have not reached a terminal status."""
+        with self._lock:
+            records = self._records.get(api_key_id(api_key), {})
+            return [task_id for task_id, record in records.items() if _is_pending(record)]
+
+    def get(self, api_key: str, task_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            record = self._records.get(api_key_id(api_key), {}).get(task_id)
+            return dict(record) if record is not None else None
+
+    def _ensure_refresher(self) -> None:
+        if not REFRESH_ENABLED:
+            return
+        with self._lock:
+            if not self._schedule:
+                return
+            if self._refresher is not None and self._refresher.is_alive():
+                self._wakeup.set()
+                return
+            self._refresher = threading.Thread(
+                target=self._refresh_loop, name="video-task-refresher", daemon=True
+            )
+            self._refresher.start()
+
+    def _due_batches(self) -> tuple[list[tuple[str, list[str]]], float | None]:
+        now = time.monotonic()
+        wall_now = time.time()
+        due: dict[str, list[str]] = {}
+        next_due = None
+        with self._lock:
+            for (key_id, task_id), (due_at, _) in list(self._schedule.items()):
+                record = self._records.get(key_id, {}).get(task_id)
+                if (
+                    record is None
+                    or key_id not in self._api_keys
+                    or wall_now - (record.get("submitted_at") or wall_now) > REFRESH_GIVE_UP_SECONDS
+                ):
+                    del self._schedule[(key_id, task_id)]
+                    continue
+                if due_at <= now:
+                    due.setdefault(key_id, []).append(task_id)
+                elif next_due is None or due_at < next_due:
+                    next_due = due_at
+            if not due and next_due is None:
+                # Nothing left to refresh; let the thread exit.
+                self._refresher = None
+        batches = [
+            (key_id, task_ids[start:start + REFRESH_BATCH_SIZE])
+            for key_id, task_ids in due.items()
+            for start in range(0, len(task_ids), REFRESH_BATCH_SIZE)
+        ]
+        return batches, next_due
+
+    def _refresh_loop(self) -> None:
+        logger.info("Video task refresher started")
+        while True:
+            batches, next_due = self._due_batches()
+            if not batches:
+                if next_due is None:
+                    logger.info("Video task refresher stopped, no pending tasks")
+                    return
+                self._wakeup.wait(max(0.0, next_due - time.monotonic()))
+                self._wakeup.clear()
+                continue
+            for key_id, task_ids in batches:
+                self._refresh_batch(key_id, task_ids)
+
+    def _refresh_batch(self, key_id: str, task_ids: list[str]) -> None:
+        with self._lock:
+            api_key = self._api_keys.get(key_id)
+        if api_key is None:
+            return
+        try:
+            items = fetch_tasks(api_key, task_ids)
+        except (requests.exceptions.RequestException, VideoTaskError) as e:
+            logger.warning("Refreshing %d video tasks failed: %s", len(task_ids), str(e))
+            items = []
+
+        now = time.time()
+        with self._lock:
+            seen = set()
+            for data in items:
+                if data.get("id") in task_ids:
+                    seen.add(data["id"])
+                    self._observe_locked(key_id, data, now)
+            # Missing or failed lookups back off like an unchanged status.
+            for task_id in task_ids:
+                if task_id in seen or (key_id, task_id) not in self._schedule:
+                    continue
+                _, interval = self._schedule[(key_id, task_id)]
+                self._schedule_locked(
+                    key_id, task_id, min(REFRESH_MAX_INTERVAL, interval * POLL_BACKOFF_FACTOR)
+                )
+        logger.info("Refreshed %d of %d pending video tasks", len(seen), len(task_ids))
+
+
+task_registry = TaskRegistry()
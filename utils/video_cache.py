@@ -0,0 +1,98 @@
+# author: sawyer-shi
+
+import logging
+import os
+import re
+import tempfile
+import threading
+
+from utils.env import env_int, env_str
+
+logger = logging.getLogger(__name__)
+
+VIDEO_CACHE_DIR = env_str(
+    "ARK_VIDEO_CACHE_DIR", os.path.join(tempfile.gettempdir(), "seedance_video_cache")
+)
+# 0 disables the cache.
+VIDEO_CACHE_BYTES = env_int("ARK_VIDEO_CACHE_MB", 1024) * 1024 * 1024
+
+_SAFE_KEY_RE = re.compile(r"[^\w.-]")
+
+
+class VideoCache:
+    """
+    On-disk LRU of downloaded videos keyed by task id.
+
+    A finished task's video never changes, so a cached file can be served
+    for as long as it is kept, long after the signed link has expired. File
+    modification times track recency and the directory is trimmed
+    oldest-first when it grows past ``max_bytes``.
+    """
+
+    def __init__(
+        self, cache_dir: str = VIDEO_CACHE_DIR, max_bytes: int = VIDEO_CACHE_BYTES
+    ) -> None:
+        self._dir = cache_dir
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._ready = False
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._dir) and self._max_bytes > 0
+
+    def _ensure_dir(self) -> bool:
+        if self._ready:
+            return True
+        try:
+            os.makedirs(self._dir, exist_ok=True)
+        except OSError as e:
+            logger.warning("Video cache disabled, cannot create %s: %s", self._dir, str(e))
+            self._max_bytes = 0
+            return False
+        self._ready = True
+        return True
+
+    def path_for(self, task_id: str) -> str | None:
+        """Where the video of ``task_id`` is stored, or ``None`` when disabled."""
+        if not self.enabled or not self._ensure_dir():
+            return None
+        return os.path.join(self._dir, f"{_SAFE_KEY_RE.sub('_', task_id)}.mp4")
+
+    def get(self, task_id: str) -> str | None:
+        """Return the cached file for ``task_id`` and mark it recently used."""
+        path = self.path_for(task_id)
+        if path is None:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning("Video cache read failed for %s: %s", path, str(e))
+            return None
+        return path
+
+    def trim(self) -> None:
+        if not self.enabled or not self._ready:
+            return
+        with self._lock:
+            files = []
+            total = 0
+            with os.scandir(self._dir) as entries:
+                for entry in entries:
+                    if entry.is_file() and not entry.name.endswith(".tmp"):
+                        stat = entry.stat()
+                        files.append((stat.st_mtime, stat.st_size, entry.path))
+                        total += stat.st_size
+            for _, size, path in sorted(files):
+                if total <= self._max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+
+video_cache = VideoCache()
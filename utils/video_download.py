@@ -0,0 +1,106 @@
+# author: sawyer-shi
+
+import logging
+import os
+import tempfile
+from collections.abc import Generator
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from utils.blob_stream import (
+    BlobTooLargeError,
+    download_to_file,
+    stream_file_blob,
+    stream_url_blob,
+)
+from utils.env import env_int
+from utils.video_cache import video_cache
+
+logger = logging.getLogger(__name__)
+
+MAX_VIDEO_DOWNLOAD_BYTES = env_int("ARK_VIDEO_MAX_DOWNLOAD_MB", 100) * 1024 * 1024
+
+VideoTooLargeError = BlobTooLargeError
+
+
+def stream_video_blob(
+    tool: Tool,
+    video_url: str,
+    filename: str,
+    max_bytes: int = MAX_VIDEO_DOWNLOAD_BYTES,
+    task_id: str | None = None,
+) -> Generator[ToolInvokeMessage, None, int]:
+    """
+    Download a video and forward it as blob chunks, see
+    :func:`utils.blob_stream.stream_url_blob`. With a ``task_id`` the video
+    is served from, or saved to, the local video cache. Returns the number
+    of bytes sent.
+
+    :raises VideoTooLargeError: if the video is larger than ``max_bytes``.
+    :raises requests.exceptions.RequestException: on network errors or a
+        non-200 response.
+    """
+    if task_id:
+        cached_path = video_cache.get(task_id)
+        if cached_path is not None:
+            try:
+                logger.info("Serving video of task %s from cache", task_id)
+                return (
+                    yield from stream_file_blob(tool, cached_path, "video/mp4", filename)
+                )
+            except OSError as e:
+                # Nothing has been sent before the file is opened, so fall
+                # back to downloading.
+                logger.warning("Cached video %s unreadable: %s", cached_path, str(e))
+
+    save_path = video_cache.path_for(task_id) if task_id else None
+    size = yield from stream_url_blob(
+        tool,
+        video_url,
+        max_bytes,
+        "video_download",
+        mime_type="video/mp4",
+        filename=filename,
+        label="视频",
+        save_path=save_path,
+    )
+    if save_path is not None:
+        video_cache.trim()
+    return size
+
+
+def fetch_video_file(
+    video_url: str,
+    task_id: str,
+    max_bytes: int = MAX_VIDEO_DOWNLOAD_BYTES,
+) -> tuple[str, bool]:
+    """
+    Make the video of ``task_id`` available as a local file, from the video
+    cache if possible. Safe to run in worker threads, so several videos can
+    download in parallel and be streamed to Dify one after another.
+
+    :returns: ``(path, temporary)``; a temporary file is the caller's to
+        delete once sent.
+    :raises VideoTooLargeError: if the video is larger than ``max_bytes``.
+    :raises requests.exceptions.RequestException: on network errors or a
+        non-200 response.
+    """
+    cached_path = video_cache.get(task_id)
+    if cached_path is not None:
+        return cached_path, False
+
+    save_path = video_cache.path_for(task_id)
+    if save_path is not None:
+        download_to_file(video_url, save_path, max_bytes, "video_download", label="视频")
+        video_cache.trim()
+        return save_path, False
+
+    fd, temp_path = tempfile.mkstemp(suffix=".mp4")
+    os.close(fd)
+    try:
+        download_to_file(video_url, temp_path, max_bytes, "video_download", label="视频")
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return temp_path, True
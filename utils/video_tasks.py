@@ -0,0 +1,266 @@
+# author: sawyer-shi
+
+import calendar
+import json
+import logging
+import random
+import time
+from collections.abc import Generator
+from typing import Any
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from utils.ark_client import CONTENTS_GENERATIONS_TASKS_URL, ark_client
+from utils.env import env_float
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = {"succeeded", "failed", "cancelled", "expired"}
+
+POLL_INITIAL_INTERVAL = env_float("ARK_POLL_INITIAL_INTERVAL", 2)
+POLL_MAX_INTERVAL = env_float("ARK_POLL_MAX_INTERVAL", 30)
+POLL_BACKOFF_FACTOR = env_float("ARK_POLL_BACKOFF_FACTOR", 1.5)
+POLL_JITTER = env_float("ARK_POLL_JITTER", 0.2)
+
+DEFAULT_MAX_WAIT_SECONDS = 600
+MIN_MAX_WAIT_SECONDS = 10
+MAX_MAX_WAIT_SECONDS = 3600
+
+# Largest page the task list endpoint accepts.
+MAX_LIST_PAGE_SIZE = 500
+
+
+class VideoTaskError(Exception):
+    """Raised when a video task cannot be queried from Ark."""
+
+
+def task_url(task_id: str) -> str:
+    return f"{CONTENTS_GENERATIONS_TASKS_URL}/{task_id}"
+
+
+def signed_url_expiry(url: str) -> float | None:
+    """
+    Read the expiry of a presigned TOS/S3 link as a Unix timestamp, from the
+    ``X-Tos-Date``/``X-Tos-Expires`` pair (or their ``X-Amz-`` equivalents)
+    or a plain ``Expires`` timestamp. Returns ``None`` when the link carries
+    no readable expiry.
+    """
+    query = {key.lower(): values[0] for key, values in parse_qs(urlsplit(url).query).items()}
+    for prefix in ("x-tos-", "x-amz-"):
+        signed_at = query.get(f"{prefix}date")
+        lifetime = query.get(f"{prefix}expires")
+        if signed_at and lifetime:
+            try:
+                return float(
+                    calendar.timegm(time.strptime(signed_at, "%Y%m%dT%H%M%SZ")) + int(lifetime)
+                )
+            except ValueError:
+                return None
+    try:
+        return float(query["expires"])
+    except (KeyError, ValueError):
+        return None
+
+
+def fetch_task(api_key: str, task_id: str) -> dict[str, Any]:
+    """
+    Run a single GET on the task and return the decoded body.
+    """
+    response = ark_client.get(task_url(task_id), api_key, "task_query")
+    if response.status_code != 200:
+        logger.error("API status %s: %s", response.status_code, response.text[:300])
+        raise VideoTaskError(
+            f"API 响应状态码: {response.status_code} {response.text[:300]}".rstrip()
+        )
+    try:
+        return response.json()
+    except json.JSONDecodeError as e:
+        logger.error("Failed to parse JSON: %s - %s", str(e), response.text[:300])
+        raise VideoTaskError("API 响应解析失败（非JSON）")
+
+
+def list_tasks(
+    api_key: str,
+    page_num: int = 1,
+    page_size: int = MAX_LIST_PAGE_SIZE,
+    status: str | None = None,
+    model: str | None = None,
+    task_ids: list[str] | None = None,
+) -> tuple[list[dict[str, Any]], int]:
+    """
+    Fetch one page of the content generation task list, newest first.
+
+    :returns: ``(tasks on the page, total number of matching tasks)``.
+    """
+    if not 1 <= page_size <= MAX_LIST_PAGE_SIZE:
+        raise ValueError(f"page_size must be between 1 and {MAX_LIST_PAGE_SIZE}")
+    params: dict[str, Any] = {"page_num": page_num, "page_size": page_size}
+    if status:
+        params["filter.status"] = status
+    if model:
+        params["filter.model"] = model
+    if task_ids:
+        params["filter.task_ids"] = list(task_ids)
+    response = ark_client.get(CONTENTS_GENERATIONS_TASKS_URL, api_key, "task_query", params=params)
+    if response.status_code != 200:
+        logger.error("API status %s: %s", response.status_code, response.text[:300])
+        raise VideoTaskError(
+            f"API 响应状态码: {response.status_code} {response.text[:300]}".rstrip()
+        )
+    try:
+        body = response.json()
+        items = body.get("items") or []
+        total = int(body.get("total") or 0)
+    except (json.JSONDecodeError, AttributeError, TypeError, ValueError) as e:
+        logger.error("Failed to parse task list: %s - %s", str(e), response.text[:300])
+        raise VideoTaskError("API 响应解析失败（非JSON）")
+    return items, max(total, len(items))
+
+
+def fetch_tasks(api_key: str, task_ids: list[str]) -> list[dict[str, Any]]:
+    """
+    Look up several tasks with one list query filtered by task id. Tasks the
+    service no longer knows about are simply missing from the result.
+    """
+    if not task_ids:
+        return []
+    if len(task_ids) > MAX_LIST_PAGE_SIZE:
+        raise ValueError(f"at most {MAX_LIST_PAGE_SIZE} task ids per query")
+    items, _ = list_tasks(api_key, page_size=len(task_ids), task_ids=task_ids)
+    return items
+
+
+def parse_wait_parameters(tool_parameters: dict[str, Any]) -> tuple[bool, int]:
+    wait_for_completion = (
+        tool_parameters.get("wait_for_completion", "false") == "true"
+    )
+    try:
+        max_wait_seconds = int(
+            tool_parameters.get("max_wait_seconds") or DEFAULT_MAX_WAIT_SECONDS
+        )
+    except (TypeError, ValueError):
+        max_wait_seconds = DEFAULT_MAX_WAIT_SECONDS
+
+    if max_wait_seconds < MIN_MAX_WAIT_SECONDS:
+        max_wait_seconds = MIN_MAX_WAIT_SECONDS
+    elif max_wait_seconds > MAX_MAX_WAIT_SECONDS:
+        max_wait_seconds = MAX_MAX_WAIT_SECONDS
+    return wait_for_completion, max_wait_seconds
+
+
+def next_poll_interval(interval: float) -> float:
+    return min(POLL_MAX_INTERVAL, interval * POLL_BACKOFF_FACTOR)
+
+
+def jittered_interval(interval: float) -> float:
+    return max(0.1, interval * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER))
+
+
+def wait_for_task(
+    tool: Tool,
+    api_key: str,
+    task_id: str,
+    max_wait_seconds: int,
+    initial_data: dict[str, Any] | None = None,
+) -> Generator[ToolInvokeMessage, None, dict[str, Any] | None]:
+    """
+    Poll a content generation task until it reaches a terminal status.
+
+    Progress is streamed as text messages. The poll interval grows by
+    ``POLL_BACKOFF_FACTOR`` up to ``POLL_MAX_INTERVAL`` and drops back to the
+    initial interval whenever the task changes status. Returns the final task
+    data, or ``None`` when the deadline passes or the task cannot be queried.
+    """
+    started = time.monotonic()
+    deadline = started + max_wait_seconds
+    interval = POLL_INITIAL_INTERVAL
+    last_status = initial_data.get("status") if initial_data else None
+
+    if initial_data is not None and last_status in TERMINAL_STATUSES:
+        return initial_data
+
+    yield tool.create_text_message(
+        f"⏳ 正在等待任务完成（最长 {max_wait_seconds} 秒）..."
+    )
+
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            yield tool.create_text_message(
+                f"⌛ 等待超时（{max_wait_seconds} 秒），任务仍在处理中，可稍后用任务ID查询"
+            )
+            return None
+
+        time.sleep(min(jittered_interval(interval), remaining))
+
+        try:
+            data = fetch_task(api_key, task_id)
+        except requests.exceptions.RequestException as e:
+            # A dropped poll should not end the wait; back off and try again.
+            logger.warning("Polling task %s failed: %s", task_id, str(e))
+            interval = next_poll_interval(interval)
+            continue
+        except VideoTaskError as e:
+            yield tool.create_text_message(f"❌ 查询任务失败: {str(e)}")
+            return None
+
+        status = data.get("status")
+        if status in TERMINAL_STATUSES:
+            return data
+
+        if status != last_status:
+            interval = POLL_INITIAL_INTERVAL
+            last_status = status
+        else:
+            interval = next_poll_interval(interval)
+
+        elapsed = int(time.monotonic() - started)
+        yield tool.create_text_message(f"🔄 任务状态: {status}（已等待 {elapsed} 秒）")
+
+
+def build_task_result(resp_data: dict[str, Any]) -> dict[str, Any]:
+    content = resp_data.get("content") or {}
+    return {
+        "task_id": resp_data.get("id"),
+        "status": resp_data.get("status"),
+        "video_url": content.get("video_url"),
+        "last_frame_url": content.get("last_frame_url"),
+        "model": resp_data.get("model"),
+        "error": resp_data.get("error"),
+        "seed": resp_data.get("seed"),
+        "resolution": resp_data.get("resolution"),
+        "ratio": resp_data.get("ratio"),
+        "duration": resp_data.get("duration"),
+        "frames": resp_data.get("frames"),
+        "frames_per_second": resp_data.get("framespersecond"),
+        "usage": resp_data.get("usage"),
+        "created_at": resp_data.get("created_at"),
+        "updated_at": resp_data.get("updated_at"),
+    }
+
+
+def report_task_result(
+    tool: Tool, resp_data: dict[str, Any]
+) -> Generator[ToolInvokeMessage, None, None]:
+    result_json = build_task_result(resp_data)
+    status = result_json["status"]
+
+    if status == "succeeded":
+        yield tool.create_text_message("🎉 视频生成完成！")
+    else:
+        yield tool.create_text_message(f"❌ 视频任务结束，状态: {status}")
+        error = result_json.get("error")
+        if error:
+            yield tool.create_text_message(
+                f"🔧 错误信息: {json.dumps(error, ensure_ascii=False)}"
+            )
+
+    if result_json["video_url"]:
+        yield tool.create_text_message(f"🎬 视频链接: {result_json['video_url']}")
+    if result_json["last_frame_url"]:
+        yield tool.create_text_message(f"🖼️ 尾帧链接: {result_json['last_frame_url']}")
+
+    yield tool.create_json_message(result_json)